@@ -90,11 +90,20 @@ type GetSectionResponse = {
   file?: string;
   encoding?: string;
   id?: string;
+  start_char?: number;
+  end_char?: number;
+  start_line?: number;
+  end_line?: number;
+  total_chars?: number;
+  total_lines?: number;
+  truncated?: boolean;
+  next_cursor?: string | null;
 };
 
 type SearchTextResult = {
   section_id: string;
   snippet: string;
+  distance?: number | null;
 };
 
 type SearchTextResponse = {
@@ -282,6 +291,7 @@ server.registerTool(
     title: "Get section text",
     description: [
       "Retrieve the full text of a specific section (chapter) from the specified manual.",
+      "For long sections, pass a line/char range, a ToC anchor, or max_chars (then follow next_cursor) to fetch only the part you need.",
       "In Location Mode, use this lightly for screening: confirm whether a candidate section actually discusses the question’s theme.",
       "In Full Answer Mode, call this for every section in S1, treat the returned text as the full body of the section,",
       "and conceptually chunk it to extract conditions, definitions, exceptions, and other elements.",
@@ -293,6 +303,50 @@ server.registerTool(
       section_id: z
         .string()
         .describe("Section ID (for example '03-1')."),
+      start_line: z
+        .number()
+        .int()
+        .min(1)
+        .optional()
+        .describe("Optional first line to return (1-based, inclusive)."),
+      end_line: z
+        .number()
+        .int()
+        .min(1)
+        .optional()
+        .describe("Optional last line to return (1-based, inclusive)."),
+      start_char: z
+        .number()
+        .int()
+        .min(0)
+        .optional()
+        .describe("Optional start character offset (0-based)."),
+      end_char: z
+        .number()
+        .int()
+        .min(0)
+        .optional()
+        .describe("Optional end character offset (exclusive)."),
+      anchor: z
+        .string()
+        .optional()
+        .describe(
+          "Optional ToC child anchor (e.g. 'PRE', 'I'..'XV') to return only that part of the section."
+        ),
+      max_chars: z
+        .number()
+        .int()
+        .min(1)
+        .optional()
+        .describe(
+          "Optional limit on returned characters. Text is cut at a line boundary and 'next_cursor' is returned for the rest."
+        ),
+      cursor: z
+        .string()
+        .optional()
+        .describe(
+          "Continuation cursor from a previous response's 'next_cursor'. Do not combine with a line/char range or anchor."
+        ),
     },
     outputSchema: {
       manual: z.string().describe("Name of the manual."),
@@ -321,13 +375,26 @@ server.registerTool(
         .describe(
           "Optional backend identifier for the section (defaults to section_id)."
         ),
+      start_char: z.number().optional().describe("Start offset of the returned text (range requests only)."),
+      end_char: z.number().optional().describe("End offset (exclusive) of the returned text (range requests only)."),
+      start_line: z.number().optional().describe("First line of the returned text (1-based)."),
+      end_line: z.number().optional().describe("Last line of the returned text (1-based)."),
+      total_chars: z.number().optional().describe("Length of the whole section."),
+      total_lines: z.number().optional().describe("Number of lines in the whole section."),
+      truncated: z.boolean().optional().describe("True when the text was cut by max_chars."),
+      next_cursor: z
+        .string()
+        .nullable()
+        .optional()
+        .describe("Pass as 'cursor' to fetch the rest of the requested range."),
     },
   },
-  async ({ manual_name, section_id }) => {
-    const resp = await getJson<GetSectionResponse>("/get_section", {
-      manual_name,
-      section_id,
-    });
+  async ({ manual_name, section_id, ...range }) => {
+    const query: Record<string, string> = { manual_name, section_id };
+    for (const [k, v] of Object.entries(range)) {
+      if (v !== undefined) query[k] = String(v);
+    }
+    const resp = await getJson<GetSectionResponse>("/get_section", query);
     const structuredContent = resp;
 
     return {
@@ -353,10 +420,11 @@ server.registerTool(
     description: [
       "Full-text search within the specified manual.",
       "Use this to locate candidate sections and snippets related to the user’s question.",
-      "Supports three modes:",
+      "Supports four modes:",
       " - 'plain': simple substring search.",
       " - 'regex': regular expression search (invalid patterns fall back to plain search on the backend).",
       " - 'loose': tolerant matching that ignores spaces and some punctuation (useful for noisy OCR text).",
+      " - 'fuzzy': typo-tolerant matching within 'max_distance' edits (kanji variants, okurigana), ranked by distance.",
       "In the hierarchical RAG flow, this tool is mainly used in Location Mode during the exploration phase",
       "to build the initial candidate set S0 of section_ids based on the question.",
     ].join(" "),
@@ -382,11 +450,20 @@ server.registerTool(
           "When true, perform a case-sensitive search (backend default is false)."
         ),
       mode: z
-        .enum(["plain", "regex", "loose"])
+        .enum(["plain", "regex", "loose", "fuzzy"])
         .optional()
         .describe(
           "Search mode. If omitted, the backend default (typically 'regex') will be used."
         ),
+      max_distance: z
+        .number()
+        .int()
+        .min(0)
+        .max(5)
+        .optional()
+        .describe(
+          "Maximum edit distance for 'fuzzy' mode. If omitted, the backend default is used."
+        ),
       limit: z
         .number()
         .int()
@@ -408,6 +485,11 @@ server.registerTool(
               .describe(
                 "Excerpt of text around the first match in that section, used for context and screening."
               ),
+            distance: z
+              .number()
+              .nullable()
+              .optional()
+              .describe("Edit distance to the query ('fuzzy' mode only; null in other modes)."),
           })
         )
         .describe(
@@ -415,7 +497,7 @@ server.registerTool(
         ),
     },
   },
-  async ({ manual_name, query, section_id, case_sensitive, mode, limit }) => {
+  async ({ manual_name, query, section_id, case_sensitive, mode, max_distance, limit }) => {
     const body: Record<string, unknown> = {
       manual_name,
       query,
@@ -425,6 +507,7 @@ server.registerTool(
     if (typeof case_sensitive === "boolean")
       body.case_sensitive = case_sensitive;
     if (mode) body.mode = mode;
+    if (typeof max_distance === "number") body.max_distance = max_distance;
     if (typeof limit === "number") body.limit = limit;
 
     const resp = await postJson<SearchTextResponse>("/search_text", body);
@@ -0,0 +1,47 @@
+from __future__ import annotations
+import argparse
+import logging
+import sys
+import time
+from typing import List, Optional
+
+from app.deps import get_repo, get_settings
+
+
+def _compile_corpus(args: argparse.Namespace) -> int:
+    """全マニュアル（または --manual で指定したもの）のコーパスを作り直す。"""
+    repo = get_repo()
+    manuals = args.manual or repo.list_manuals()
+    failed = 0
+    for manual in manuals:
+        started = time.perf_counter()
+        try:
+            corpus = repo.corpus.compile(manual)
+        except Exception as e:
+            logging.error(f"failed to compile corpus: manual={manual}: {e}")
+            failed += 1
+            continue
+        print(f"{manual}: sections={len(corpus.sections)} bytes={len(corpus.buf)} "
+              f"({time.perf_counter() - started:.2f}s)")
+    return 1 if failed else 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m app.cli", description="manual-tools の管理コマンド")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("compile-corpus", help="検索用のコーパス（indices_dir/{manual}/corpus.bin）を作る")
+    p.add_argument("--manual", action="append", help="対象マニュアル（複数指定可。省略時は全マニュアル）")
+    p.set_defaults(func=_compile_corpus)
+
+    args = parser.parse_args(argv)
+    settings = get_settings()
+    logging.basicConfig(
+        level=getattr(logging, settings.logging.level.upper(), logging.INFO),
+        format="%(asctime)s %(levelname)s %(name)s - %(message)s",
+    )
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,7 +1,7 @@
 from __future__ import annotations
 import os
 from pathlib import Path
-from typing import Any, Dict, Union
+from typing import Any, Dict, List, Union
 
 try:
     from pydantic import BaseModel
@@ -29,11 +29,91 @@ class TocConfig(BaseModel):
 class LoggingConfig(BaseModel):
     level: str = "INFO"
 
+class WatchConfig(BaseModel):
+    enabled: bool = True
+    backend: str = "auto"  # auto / inotify / poll
+    poll_interval: float = 2.0
+
+class CacheConfig(BaseModel):
+    section_bytes: int = 128 * 1024 * 1024  # 章本文キャッシュの上限（バイト）
+    response_bytes: int = 32 * 1024 * 1024  # 圧縮済みレスポンスキャッシュの上限（バイト）
+    search_result_bytes: int = 16 * 1024 * 1024  # 検索結果キャッシュの上限（バイト, 0 で無効）
+
+class HttpConfig(BaseModel):
+    compression: bool = True  # Accept-Encoding に応じて gzip / br で返す
+    compress_min_bytes: int = 1024  # これより小さい本文は圧縮しない
+    gzip_level: int = 6
+    metrics: bool = True  # GET /metrics（Prometheus テキスト形式）とリクエスト計測のミドルウェア
+
+class PathsConfig(BaseModel):
+    indices_dir: str = "indices"  # 検索インデックスの保存先
+
+class SearchConfig(BaseModel):
+    use_ngram_index: bool = True
+    ngram_compact_delay: float = 5.0  # 秒。n-gram 索引の差分をこの間変更が無ければ基底に併合して保存する
+    ngram_rebuild_ratio: float = 0.5  # 差分の章がこの割合を超えたら索引全体を作り直す
+    max_workers: int = 4  # マニュアル横断検索の並列数
+    regex_sandbox: bool = True  # regex モードを別プロセスで期限つきで実行する
+    regex_workers: int = 2
+    regex_timeout: float = 2.0  # 秒。超えたらそこまでの結果を truncated として返す
+    use_corpus: bool = True  # compile-corpus で作ったコーパスがあれば plain / loose の走査に使う
+    fuzzy_max_distance: int = 1  # fuzzy モードの編集距離の上限（リクエストの max_distance で上書き可）
+
+class ChunkConfig(BaseModel):
+    max_chars: int = 1000  # これを超える段落は行単位で分割する
+
+class VectorConfig(BaseModel):
+    embedder: str = "hashed_ngram"  # 既定の CPU 埋め込み、または "module:factory"
+    dim: int = 512
+
+# 例外・非該当・禁止事項を示す語（find_exceptions 用）。本文と同じく NFKC 正規化して照合する
+DEFAULT_EXCEPTION_TERMS = [
+    "留意",
+    "注意",
+    "例外",
+    "対象外",
+    "禁止",
+    "適用しない",
+    "支払われない",
+    "支給されない",
+    "不支給",
+    "不適用",
+    "除外",
+    "取り扱わない",
+]
+
+class ExceptionsConfig(BaseModel):
+    terms: List[str] = list(DEFAULT_EXCEPTION_TERMS)
+
+class StartupConfig(BaseModel):
+    warmup: bool = True  # 起動後にバックグラウンドで全 ToC を読み込む
+    workers: int = 8
+    snapshot: bool = True  # 検証済み ToC を indices_dir に保存し、次回起動で再利用する
+    references: bool = True  # ToC の読み込み後に章間参照グラフも作っておく（全章を読む）
+
+class ProfilingConfig(BaseModel):
+    enabled: bool = False  # true のとき header 付きのリクエストを cProfile で計測する
+    header: str = "X-Profile"
+    routes: List[str] = []  # ヘッダーなしでも常に計測するパス（例: ["/search_text"]）
+    dump_dir: str = "var/profiles"  # .prof の書き出し先（相対パスは設定ファイルの場所から）
+    slow_request_ms: float = 1000.0  # これ以上かかったリクエストをフェーズ内訳つきでログに出す（0 で無効）
+    log_body_bytes: int = 2048  # ログに含めるリクエスト本文の上限
+
 class Settings(BaseModel):
     manuals_root: str = "manuals"
     toc: TocConfig = TocConfig()
     validation_mode: str = "relaxed"  # relaxed / strict
     logging: LoggingConfig = LoggingConfig()
+    watch: WatchConfig = WatchConfig()
+    cache: CacheConfig = CacheConfig()
+    paths: PathsConfig = PathsConfig()
+    search: SearchConfig = SearchConfig()
+    chunks: ChunkConfig = ChunkConfig()
+    vectors: VectorConfig = VectorConfig()
+    exceptions: ExceptionsConfig = ExceptionsConfig()
+    http: HttpConfig = HttpConfig()
+    startup: StartupConfig = StartupConfig()
+    profiling: ProfilingConfig = ProfilingConfig()
 
 PROJECT_ROOT = Path(__file__).resolve().parents[2]
 
@@ -44,6 +124,8 @@ def _resolve_with_base(base: Path, target: Union[str, os.PathLike[str]]) -> Path
     return (base / candidate).resolve()
 
 def load_settings(path: Union[str, os.PathLike[str], None] = None) -> Settings:
+    # 設定ファイルの差し替え（ベンチマーク等で別の manuals_root を使う場合）
+    path = path or os.getenv("MANUAL_TOOLS_CONFIG") or None
     config_path = (
         _resolve_with_base(PROJECT_ROOT, path)
         if path
@@ -77,9 +159,19 @@ def load_settings(path: Union[str, os.PathLike[str], None] = None) -> Settings:
     if not pattern_path.is_absolute():
         path_pattern = str((config_dir / pattern_path).resolve())
 
+    indices_dir_path = Path(settings.paths.indices_dir)
+    if not indices_dir_path.is_absolute():
+        indices_dir_path = (config_dir / indices_dir_path).resolve()
+
+    dump_dir_path = Path(settings.profiling.dump_dir)
+    if not dump_dir_path.is_absolute():
+        dump_dir_path = (config_dir / dump_dir_path).resolve()
+
     return settings.model_copy(
         update={
             "manuals_root": str(manuals_root_path),
             "toc": settings.toc.model_copy(update={"path_pattern": path_pattern}),
+            "paths": settings.paths.model_copy(update={"indices_dir": str(indices_dir_path)}),
+            "profiling": settings.profiling.model_copy(update={"dump_dir": str(dump_dir_path)}),
         }
     )
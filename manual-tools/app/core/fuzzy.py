@@ -0,0 +1,106 @@
+"""
+編集距離の上限つきのあいまい一致（search_text の fuzzy モード用）。
+
+本文全体に DP をかけると遅いので、クエリを k + 1 個に分けた断片の完全一致で
+位置の候補を拾い（編集が k 回以内なら少なくとも 1 断片はそのまま残る）、
+その周辺の窓だけを上限つきの DP で確かめる。
+"""
+from __future__ import annotations
+import re
+from functools import lru_cache
+from typing import List, Optional, Pattern, Tuple
+
+# (編集距離, 開始, 終了)。終了は含まない
+FuzzyMatch = Tuple[int, int, int]
+
+
+def effective_distance(query: str, max_distance: int) -> int:
+    """
+    クエリ長に対して使う編集距離の上限。クエリの半分以上を書き換えられると
+    ほぼ何にでも一致してしまうので、(len(query) - 1) // 2 までに抑える。
+    """
+    return max(0, min(max_distance, (len(query) - 1) // 2))
+
+
+@lru_cache(maxsize=256)
+def _pieces(query: str, k: int) -> Tuple[Pattern[str], Tuple[Tuple[str, int], ...]]:
+    """
+    クエリを k + 1 個の断片に分け、(いずれかの断片が始まる位置を探す正規表現, (断片, クエリ内の位置) の組) を返す。
+    正規表現は先読みなので、重なり合う出現もすべて拾える。
+    """
+    n = k + 1
+    size, extra = divmod(len(query), n)
+    pieces: List[Tuple[str, int]] = []
+    pos = 0
+    for i in range(n):
+        length = size + (1 if i < extra else 0)
+        pieces.append((query[pos:pos + length], pos))
+        pos += length
+    alternatives = sorted({re.escape(p) for p, _ in pieces}, key=len, reverse=True)
+    return re.compile("(?=" + "|".join(alternatives) + ")"), tuple(pieces)
+
+
+def _best_in(text: str, lo: int, hi: int, query: str, k: int) -> Optional[FuzzyMatch]:
+    """
+    text[lo:hi] の中で query との編集距離が k 以内の部分文字列のうち、距離が最小のもの
+    （同じ距離なら開始が前、さらに短いもの）。本文の 1 文字ごとに列を更新する半大域 DP で、
+    各セルに (距離, そのときの開始位置) を持つ。
+    """
+    m = len(query)
+    cost = list(range(m + 1))  # cost[i]: query[:i] を text[start[i]:j] に合わせる最小の距離
+    start = [lo] * (m + 1)
+    best: Optional[FuzzyMatch] = None
+    for j in range(lo, hi):
+        ch = text[j]
+        diag_cost, diag_start = cost[0], start[0]
+        cost[0], start[0] = 0, j + 1
+        for i in range(1, m + 1):
+            up_cost, up_start = cost[i], start[i]
+            # 同じ距離なら開始の早い方を残す（(距離, 開始) の辞書順で最小）
+            c, s = diag_cost + (query[i - 1] != ch), diag_start
+            if (up_cost + 1, up_start) < (c, s):  # 本文側に余分な 1 文字
+                c, s = up_cost + 1, up_start
+            if (cost[i - 1] + 1, start[i - 1]) < (c, s):  # クエリの 1 文字が本文に無い
+                c, s = cost[i - 1] + 1, start[i - 1]
+            diag_cost, diag_start = up_cost, up_start
+            cost[i], start[i] = c, s
+        c = cost[m]
+        if c <= k and (best is None or (c, start[m]) < (best[0], best[1])):
+            best = (c, start[m], j + 1)
+    return best
+
+
+def best_match(text: str, query: str, k: int) -> Optional[FuzzyMatch]:
+    """
+    text 中で query との編集距離が k 以内の部分文字列のうち最も近いもの。無ければ None。
+    k は effective_distance() を通した値（k < len(query)）を渡す。
+    """
+    if not query:
+        return None
+    exact = text.find(query)
+    if exact >= 0:
+        return (0, exact, exact + len(query))
+    rx, pieces = _pieces(query, k)
+    m = len(query)
+    n = len(text)
+    seeds: List[Tuple[int, int]] = []
+    for mt in rx.finditer(text):
+        p = mt.start()
+        for piece, offset in pieces:
+            if text.startswith(piece, p):
+                # 一致があれば、その開始は p - offset ± k、終了は p - offset + m + k 以内
+                seeds.append((max(0, p - offset - k), min(n, p - offset + m + k)))
+    windows: List[List[int]] = []
+    for lo, hi in sorted(seeds):
+        if windows and lo <= windows[-1][1]:
+            windows[-1][1] = max(windows[-1][1], hi)
+        else:
+            windows.append([lo, hi])
+    best: Optional[FuzzyMatch] = None
+    for lo, hi in windows:
+        r = _best_in(text, lo, hi, query, k)
+        if r is not None and (best is None or (r[0], r[1]) < (best[0], best[1])):
+            best = r
+            if best[0] == 1:  # 完全一致は無いので、距離 1 なら以降の窓（開始が後ろ）より良い
+                break
+    return best
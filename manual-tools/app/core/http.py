@@ -0,0 +1,145 @@
+from __future__ import annotations
+import gzip
+import hashlib
+import json
+from email.utils import formatdate, parsedate_to_datetime
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Sequence
+
+from fastapi import Request, Response
+
+try:  # orjson は任意。入っていれば JSON のシリアライズに使う
+    import orjson
+except ModuleNotFoundError:  # pragma: no cover - only hit in minimal dependency envs
+    orjson = None  # type: ignore[assignment]
+
+try:  # brotli は任意。入っていれば Accept-Encoding: br にも応じる
+    import brotli
+except ModuleNotFoundError:  # pragma: no cover - only hit in minimal dependency envs
+    brotli = None  # type: ignore[assignment]
+
+from app.core.watcher import Fingerprint
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.core.config import HttpConfig
+    from app.repositories.cache import BytesCache
+
+_ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+
+def dump_json(obj: object) -> bytes:
+    """レスポンス本文用の JSON（UTF-8, 区切りの空白なし）。orjson があればそれを使う。"""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def make_etag(kind: str, *parts: object, fps: Sequence[Fingerprint]) -> str:
+    """
+    ファイル指紋から強い ETag を作る。kind / parts（マニュアル名・章 ID・表示オプション等）
+    も混ぜるので、同じファイルから作る別の表現とは値が衝突しない。
+    """
+    h = hashlib.blake2b(repr((kind, parts, tuple(fps))).encode("utf-8"), digest_size=12)
+    return f'"{h.hexdigest()}"'
+
+
+def last_modified(fps: Sequence[Fingerprint]) -> str:
+    mtime_ns = max(fp[0] for fp in fps)
+    return formatdate(mtime_ns / 1e9, usegmt=True)
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    if header.strip() == "*":
+        return True
+    base = etag.strip('"')
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        # 圧縮表現の ETag（"<base>-gzip" など）も同じ版として扱う
+        if tag == base or any(tag == f"{base}-{enc}" for enc in _ENCODINGS):
+            return True
+    return False
+
+
+def is_not_modified(request: Request, etag: str, modified: str) -> bool:
+    """If-None-Match（優先）または If-Modified-Since から 304 を返してよいか判定する。"""
+    inm = request.headers.get("if-none-match")
+    if inm is not None:
+        return _etag_matches(inm, etag)
+    ims = request.headers.get("if-modified-since")
+    if ims is not None:
+        try:
+            return parsedate_to_datetime(modified) <= parsedate_to_datetime(ims)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def choose_encoding(accept_encoding: Optional[str]) -> Optional[str]:
+    """Accept-Encoding から使う圧縮方式を選ぶ（br > gzip、q=0 は除外）。圧縮しないなら None。"""
+    if not accept_encoding:
+        return None
+    accepted: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        name, _, params = item.strip().partition(";")
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[name.strip().lower()] = q
+    for enc in _ENCODINGS:
+        q = accepted.get(enc, accepted.get("*", 0.0))
+        if q > 0:
+            return enc
+    return None
+
+
+def _compress(body: bytes, encoding: str, cfg: "HttpConfig") -> bytes:
+    if encoding == "br":
+        return brotli.compress(body)
+    return gzip.compress(body, compresslevel=cfg.gzip_level, mtime=0)
+
+
+def conditional_response(
+    request: Request,
+    cache: "BytesCache",
+    cfg: "HttpConfig",
+    etag: str,
+    fps: Sequence[Fingerprint],
+    build: Callable[[], bytes],
+    media_type: str = "application/json",
+    cache_body: bool = True,
+) -> Response:
+    """
+    ETag / Last-Modified つきのレスポンスを返す。
+
+    - 条件付きリクエストが一致すれば本文を作らずに 304
+    - 本文（JSON）と圧縮形は (ETag, 圧縮方式) をキーに cache に入れ、版ごとに 1 回だけ作る
+      （build 側で本文を保持している場合は cache_body=False で圧縮形だけを入れる）
+    """
+    modified = last_modified(fps)
+    headers = {"ETag": etag, "Last-Modified": modified, "Vary": "Accept-Encoding"}
+    if is_not_modified(request, etag, modified):
+        return Response(status_code=304, headers=headers)
+
+    body = cache.get((etag, None)) if cache_body else None
+    if body is None:
+        body = build()
+        if cache_body:
+            cache.put((etag, None), body)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding")) if cfg.compression else None
+    if encoding is not None and len(body) >= cfg.compress_min_bytes:
+        encoded = cache.get((etag, encoding))
+        if encoded is None:
+            encoded = _compress(body, encoding, cfg)
+            cache.put((etag, encoding), encoded)
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = f'"{etag[1:-1]}-{encoding}"'
+        body = encoded
+
+    return Response(content=body, media_type=media_type, headers=headers)
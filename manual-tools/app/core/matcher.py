@@ -0,0 +1,71 @@
+from __future__ import annotations
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+class KeywordMatcher:
+    """
+    複数キーワードを 1 パスで探す Aho-Corasick オートマトン。
+
+    失敗遷移は構築時に遷移表へ畳み込んでおく（DFA 化）ので、走査は 1 文字あたり
+    dict 参照 1 回で済み、語彙数が増えても走査時間はほとんど変わらない。
+    遷移先が根になる遷移は持たない（表に無い文字は根へ戻る）。
+    """
+
+    def __init__(self, terms: Iterable[str]):
+        self.terms: List[str] = []
+        seen = set()
+        for t in terms:
+            if t and t not in seen:
+                seen.add(t)
+                self.terms.append(t)
+
+        goto: List[Dict[str, int]] = [{}]
+        out: List[List[int]] = [[]]
+        for ti, term in enumerate(self.terms):
+            s = 0
+            for ch in term:
+                nxt = goto[s].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[s][ch] = nxt
+                    goto.append({})
+                    out.append([])
+                s = nxt
+            out[s].append(ti)
+
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            s = queue.popleft()
+            out[s].extend(out[fail[s]])
+            # 失敗先の遷移を引き継ぎ、自身の goto で上書きする
+            trans = dict(delta[fail[s]])
+            for ch, nxt in goto[s].items():
+                fail[nxt] = delta[fail[s]].get(ch, 0)
+                trans[ch] = nxt
+                queue.append(nxt)
+            delta[s] = trans
+
+        self._delta = delta
+        self._out = [tuple(o) for o in out]
+        self._lengths = [len(t) for t in self.terms]
+
+    def __len__(self) -> int:
+        return len(self.terms)
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """重なりも含めたすべての出現を (start, end, 語の番号) で、end の昇順に返す。"""
+        if not self.terms:
+            return
+        delta = self._delta
+        out = self._out
+        lengths = self._lengths
+        s = 0
+        for i, ch in enumerate(text):
+            s = delta[s].get(ch, 0)
+            if out[s]:
+                end = i + 1
+                for ti in out[s]:
+                    yield end - lengths[ti], end, ti
@@ -0,0 +1,258 @@
+"""
+Prometheus のテキスト形式（0.0.4）で出力する最小限のメトリクス。
+
+外部ライブラリ・外部サービスは使わない。値はプロセス内に持ち、GET /metrics で
+REGISTRY.render() を返す。ワーカーを複数起動した場合はワーカーごとの値になる。
+"""
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple, TypeVar
+
+from app.core.profiling import add_phase
+
+_PREFIX = "manual_tools_"
+
+# 秒単位のレイテンシ用（Prometheus クライアントの既定値とほぼ同じ）
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# 1 検索あたりの走査章数用
+COUNT_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+Labels = Tuple[str, ...]
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = _PREFIX + name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Sequence[str]) -> Labels:
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name}: expected labels {self.labelnames}, got {labels}")
+        return tuple(str(v) for v in labels)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+    def render(self) -> List[str]:  # pragma: no cover - overridden
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        return self._values.get(self._key(labels), 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [
+            f"{self.name}{_fmt_labels(self.labelnames, k)} {_fmt_value(v)}" for k, v in items
+        ]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+    def set(self, *labels: str, value: float) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # ラベルごとに [各バケットの件数..., +Inf の件数] と合計値
+        self._counts: Dict[Labels, List[int]] = {}
+        self._sums: Dict[Labels, float] = {}
+
+    def observe(self, *labels: str, value: float) -> None:
+        key = self._key(labels)
+        i = bisect_left(self.buckets, value)  # value <= le となる最初のバケット
+        with self._lock:
+            counts = self._counts.get(key)
+            if counts is None:
+                counts = self._counts[key] = [0] * (len(self.buckets) + 1)
+                self._sums[key] = 0.0
+            counts[i] += 1
+            self._sums[key] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(c), self._sums[k]) for k, c in self._counts.items())
+        lines = self.header()
+        for key, counts, total in items:
+            cumulative = 0
+            for le, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le_label = f'le="{_fmt_value(le)}"'
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le_label)} {cumulative}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {_fmt_value(total)}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+_M = TypeVar("_M", bound=_Metric)
+
+
+class Registry:
+    """メトリクスの登録先。"""
+
+    def __init__(self) -> None:
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: "_M") -> "_M":
+        self._metrics.append(metric)
+        return metric
+
+    def render(self, extra: Iterable[_Metric] = ()) -> str:
+        """登録済みのメトリクスと、出力時に作った extra（キャッシュ統計など）をまとめて出力する。"""
+        lines: List[str] = []
+        for m in self._metrics:
+            lines.extend(m.render())
+        for m in extra:
+            lines.extend(m.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+# -------- HTTP
+HTTP_REQUESTS = REGISTRY.register(Counter(
+    "http_requests_total", "HTTP requests by route, method and status.", ("route", "method", "status")))
+HTTP_LATENCY = REGISTRY.register(Histogram(
+    "http_request_duration_seconds", "HTTP request latency until the last body chunk is sent.",
+    ("route", "method")))
+HTTP_IN_FLIGHT = REGISTRY.register(Gauge(
+    "http_requests_in_flight", "HTTP requests currently being processed.", ("route",)))
+
+# -------- Repository
+TOC_CACHE = REGISTRY.register(Counter(
+    "toc_cache_requests_total", "ToC cache lookups (miss = ToC file loaded).", ("result",)))
+TOC_CACHE_EVICTIONS = REGISTRY.register(Counter(
+    "toc_cache_evictions_total", "ToC cache entries dropped because the ToC file changed."))
+DISK_READ_BYTES = REGISTRY.register(Counter(
+    "disk_read_bytes_total", "Bytes read from manual files.", ("kind",)))
+
+# -------- Search
+SEARCH_SECTIONS = REGISTRY.register(Histogram(
+    "search_sections_scanned", "Sections scanned per search request.", ("endpoint", "mode"),
+    buckets=COUNT_BUCKETS))
+SEARCH_MATCH_SECONDS = REGISTRY.register(Histogram(
+    "search_match_seconds", "Time spent matching section text per search request.", ("endpoint", "mode")))
+
+
+class ScanStats:
+    """1 回の検索で走査した章数と照合時間。マニュアル横断検索では各スレッドから加算する。"""
+
+    __slots__ = ("sections", "seconds", "_lock")
+
+    def __init__(self) -> None:
+        self.sections = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, sections: int, seconds: float) -> None:
+        with self._lock:
+            self.sections += sections
+            self.seconds += seconds
+
+    def observe(self, endpoint: str, mode: str) -> None:
+        SEARCH_SECTIONS.observe(endpoint, mode, value=self.sections)
+        SEARCH_MATCH_SECONDS.observe(endpoint, mode, value=self.seconds)
+        add_phase("match", self.seconds)
+
+
+class MetricsMiddleware:
+    """
+    リクエスト数・レイテンシ・処理中の数を記録する ASGI ミドルウェア。
+
+    レイテンシは最後の本文チャンクを送るまで（StreamingResponse も含む）。
+    route ラベルには登録済みのパスだけを使い、それ以外は "other" にまとめる
+    （存在しないパスでラベルが増え続けないように）。
+    """
+
+    def __init__(self, app, routes: Callable[[], Set[str]]):
+        self.app = app
+        self._routes = routes
+        self._known: Optional[Set[str]] = None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._known is None:
+            self._known = self._routes()
+        path = scope.get("path", "")
+        route = path if path in self._known else "other"
+        method = scope.get("method", "")
+        status = 500
+        started = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(route)
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            HTTP_IN_FLIGHT.dec(route)
+            HTTP_REQUESTS.inc(route, method, str(status))
+            HTTP_LATENCY.observe(route, method, value=time.perf_counter() - started)
+
+
+def cache_metrics(name: str, stats: Dict[str, int], help: str) -> List[_Metric]:
+    """SectionCache / BytesCache の stats() をメトリクスにする（出力時に作る）。"""
+    requests = Counter(f"{name}_requests_total", f"{help} lookups.", ("result",))
+    requests.inc("hit", amount=stats["hits"])
+    requests.inc("miss", amount=stats["misses"])
+    evictions = Counter(f"{name}_evictions_total", f"{help} entries evicted by the size limit.")
+    evictions.inc(amount=stats["evictions"])
+    size = Gauge(f"{name}_bytes", f"{help} size in bytes.")
+    size.set(value=stats["bytes"])
+    entries = Gauge(f"{name}_entries", f"{help} entries.")
+    entries.set(value=stats["entries"])
+    return [requests, evictions, size, entries]
@@ -0,0 +1,200 @@
+"""
+リクエスト単位のフェーズ計測・プロファイル・遅いリクエストのログ。
+
+- phase("read") などで囲んだ区間の時間を、処理中のリクエストに積算する
+  （contextvars で持つので、スレッドプールに渡す処理は copy_context() 経由で実行する）
+- ProfiledRoute はエンドポイント関数の終了時刻を記録する。そこからレスポンス開始までを
+  serialize（FastAPI の検証・シリアライズ）とする
+- ProfilingMiddleware は閾値を超えたリクエストをフェーズ内訳つきでログに出し、
+  ヘッダーまたは設定で指定されたリクエストを cProfile で計測して dump_dir に書き出す
+"""
+from __future__ import annotations
+import asyncio
+import cProfile
+import functools
+import json
+import logging
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, Optional, Set
+
+from fastapi.routing import APIRoute
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.core.config import ProfilingConfig
+
+log = logging.getLogger("app.slow")
+
+
+class RequestProfile:
+    """1 リクエスト分のフェーズ別の積算時間（秒）と回数。"""
+
+    __slots__ = ("phases", "counts", "handler_end", "profiler", "_lock")
+
+    def __init__(self, profiler: Optional[cProfile.Profile] = None):
+        self.phases: Dict[str, float] = {}
+        self.counts: Dict[str, int] = {}
+        self.handler_end: Optional[float] = None
+        self.profiler = profiler
+        self._lock = threading.Lock()
+
+    def add(self, name: str, seconds: float, count: int = 1) -> None:
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+            self.counts[name] = self.counts.get(name, 0) + count
+
+
+_current: ContextVar[Optional[RequestProfile]] = ContextVar("request_profile", default=None)
+
+
+def current() -> Optional[RequestProfile]:
+    return _current.get()
+
+
+@contextmanager
+def phase(name: str) -> Iterator[None]:
+    """処理中のリクエストがあれば、この区間の時間を name に積算する。"""
+    prof = _current.get()
+    if prof is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        prof.add(name, time.perf_counter() - started)
+
+
+def add_phase(name: str, seconds: float, count: int = 1) -> None:
+    """計測済みの時間を積算する（ループ内で既に時間を測っている箇所用）。"""
+    prof = _current.get()
+    if prof is not None:
+        prof.add(name, seconds, count)
+
+
+def _timed(call: Callable) -> Callable:
+    @functools.wraps(call)
+    def wrapper(*args, **kwargs):
+        prof = _current.get()
+        try:
+            if prof is not None and prof.profiler is not None:
+                # cProfile は有効にしたスレッドだけを測る（エンドポイントを実行するスレッド）
+                return prof.profiler.runcall(call, *args, **kwargs)
+            return call(*args, **kwargs)
+        finally:
+            if prof is not None:
+                prof.handler_end = time.perf_counter()
+    wrapper._profiled = True  # type: ignore[attr-defined]
+    return wrapper
+
+
+class ProfiledRoute(APIRoute):
+    """エンドポイント関数（同期）の終了時刻を記録し、cProfile の対象にできる APIRoute。"""
+
+    def get_route_handler(self) -> Callable:
+        call = self.dependant.call
+        if call is not None and not asyncio.iscoroutinefunction(call) and not getattr(call, "_profiled", False):
+            self.dependant.call = _timed(call)
+        return super().get_route_handler()
+
+
+class ProfilingMiddleware:
+    """
+    リクエストごとに RequestProfile を用意する ASGI ミドルウェア。
+
+    - 合計時間が slow_request_ms 以上なら、ルート・パラメータ・フェーズ内訳をログに出す
+    - enabled かつヘッダー（既定 X-Profile: 1）付き、または routes に含まれるルートは
+      cProfile で計測して dump_dir/*.prof に書き出し、ファイル名を X-Profile-Dump で返す
+    """
+
+    def __init__(self, app, cfg: "ProfilingConfig", routes: Callable[[], Set[str]]):
+        self.app = app
+        self.cfg = cfg
+        self._routes = routes
+        self._known: Optional[Set[str]] = None
+        self._header = cfg.header.lower().encode("latin-1")
+
+    def _wants_profile(self, scope, route: str) -> bool:
+        if route in self.cfg.routes:
+            return True
+        if not self.cfg.enabled:
+            return False
+        for k, v in scope.get("headers", ()):
+            if k == self._header:
+                return v not in (b"", b"0", b"false")
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self._known is None:
+            self._known = self._routes()
+        path = scope.get("path", "")
+        route = path if path in self._known else "other"
+        profiler = cProfile.Profile() if self._wants_profile(scope, route) else None
+        prof = RequestProfile(profiler)
+        token = _current.set(prof)
+
+        body = bytearray()
+        limit = self.cfg.log_body_bytes
+        started = time.perf_counter()
+        response_start: Optional[float] = None
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request" and len(body) < limit:
+                body.extend(message.get("body", b"")[: limit - len(body)])
+            return message
+
+        async def send_wrapper(message):
+            nonlocal response_start
+            if message["type"] == "http.response.start":
+                response_start = time.perf_counter()
+                if profiler is not None:
+                    name = self._dump(profiler, route)
+                    if name:
+                        message = {**message, "headers": list(message.get("headers", []))
+                                   + [(b"x-profile-dump", name.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            _current.reset(token)
+            total = time.perf_counter() - started
+            threshold = self.cfg.slow_request_ms
+            if threshold > 0 and total * 1000 >= threshold:
+                self._log_slow(scope, route, bytes(body), prof, started, response_start, total)
+
+    def _dump(self, profiler: cProfile.Profile, route: str) -> Optional[str]:
+        name = f"{time.strftime('%Y%m%d-%H%M%S')}_{route.strip('/').replace('/', '_') or 'root'}_{uuid.uuid4().hex[:8]}.prof"
+        try:
+            d = Path(self.cfg.dump_dir)
+            d.mkdir(parents=True, exist_ok=True)
+            profiler.dump_stats(str(d / name))
+        except OSError as e:
+            log.warning(f"failed to write profile: {e}")
+            return None
+        return name
+
+    def _log_slow(self, scope, route: str, body: bytes, prof: RequestProfile,
+                  started: float, response_start: Optional[float], total: float) -> None:
+        phases = {k: round(v * 1000, 3) for k, v in sorted(prof.phases.items())}
+        if prof.handler_end is not None and response_start is not None:
+            phases["serialize"] = round((response_start - prof.handler_end) * 1000, 3)
+        if response_start is not None:
+            phases["send"] = round((started + total - response_start) * 1000, 3)
+        params = {
+            "query": scope.get("query_string", b"").decode("latin-1"),
+            "body": body.decode("utf-8", errors="replace"),
+        }
+        log.warning(
+            f"slow request: {scope.get('method', '')} {route} total={total * 1000:.1f}ms "
+            f"phases={json.dumps(phases)} counts={json.dumps(prof.counts)} "
+            f"params={json.dumps(params, ensure_ascii=False)}"
+        )
@@ -0,0 +1,329 @@
+from __future__ import annotations
+import logging
+import multiprocessing as mp
+import queue
+import re
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Iterable, Iterator, List, Optional, Sequence, Tuple, Union
+
+log = logging.getLogger(__name__)
+
+# 1 回の送信にまとめる本文の量（文字数）。小さいほど打ち切り時に残る結果が増える
+_BATCH_CHARS = 256 * 1024
+_BATCH_ITEMS = 64
+# ワーカーの起動（spawn → ready の通知）を待つ上限（秒）
+_READY_TIMEOUT = 10.0
+
+Span = Optional[Tuple[int, int]]
+# search_ranges に渡す 1 件分: (本文, [(pos, endpos), ...])
+Ranges = Tuple[str, List[Tuple[int, int]]]
+
+
+@lru_cache(maxsize=256)
+def _compile(pattern: str, flags: int) -> "re.Pattern[str]":
+    return re.compile(pattern, flags)
+
+
+def _run_op(rx: "re.Pattern[str]", op: str, items: Sequence[Any], limit: Optional[int]) -> List[Any]:
+    """
+    - first: 各本文の最初のマッチ位置（span or None）
+    - all: 各本文の空でないマッチ位置の一覧（バッチ全体で limit 件まで）
+    - ranges: 各 (本文, 範囲の一覧) について、範囲ごとの pattern.search(本文, pos, endpos) の位置
+    """
+    out: List[Any] = []
+    if op == "first":
+        for text in items:
+            m = rx.search(text)
+            out.append(m.span() if m else None)
+    elif op == "all":
+        left = limit
+        for text in items:
+            spans: List[Tuple[int, int]] = []
+            if left is None or left > 0:
+                for m in rx.finditer(text):
+                    if m.start() == m.end():
+                        continue
+                    spans.append(m.span())
+                    if left is not None:
+                        left -= 1
+                        if left <= 0:
+                            break
+            out.append(spans)
+    else:  # ranges
+        for text, ranges in items:
+            found: List[Span] = []
+            for pos, endpos in ranges:
+                m = rx.search(text, pos, endpos)
+                found.append(m.span() if m else None)
+            out.append(found)
+    return out
+
+
+def _worker_main(conn) -> None:
+    """
+    ワーカープロセス本体。起動が済んだら "ready" を送り、以降は
+    (op, pattern, flags, items, limit) を受け取って _run_op の結果を返す。
+    """
+    conn.send("ready")
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        if msg is None:
+            return
+        op, pattern, flags, items, limit = msg
+        conn.send(_run_op(_compile(pattern, flags), op, items, limit))
+
+
+class _Worker:
+    def __init__(self, ctx):
+        self.conn, child = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child,), name="regex-sandbox", daemon=True)
+        self.proc.start()
+        child.close()
+
+    def wait_ready(self, timeout: float) -> bool:
+        """起動完了（"ready"）を timeout 秒まで待つ。"""
+        try:
+            return self.conn.poll(timeout) and self.conn.recv() == "ready"
+        except (EOFError, OSError):
+            return False
+
+    def kill(self) -> None:
+        try:
+            self.proc.kill()
+            self.proc.join(timeout=1)
+        finally:
+            self.conn.close()
+
+
+class Deadline:
+    """
+    regex 照合の期限。時計は最初のバッチを準備済みのワーカーに渡した時点で動き出し、
+    そこから timeout 秒。1 リクエスト内の複数の呼び出し（マニュアルごと等）で共有する。
+    """
+
+    def __init__(self, timeout: float):
+        self.timeout = timeout
+        self._at: Optional[float] = None
+
+    @property
+    def started(self) -> bool:
+        return self._at is not None
+
+    def start(self) -> None:
+        if self._at is None:
+            self._at = time.monotonic() + self.timeout
+
+    def remaining(self) -> float:
+        if self._at is None:
+            return self.timeout
+        return self._at - time.monotonic()
+
+
+class RegexSandbox:
+    """
+    利用者が与えた正規表現を別プロセスで実行するワーカープール。
+
+    - 破滅的バックトラックを起こすパターンでも、期限を過ぎたらワーカーを kill して
+      それまでの結果だけを返す（リクエストスレッドは期限以上に塞がらない）
+    - ワーカーは start() で起動し、起動完了（ready）まで待ってからプールに入れる。
+      start() 前の初回利用時と、kill したワーカーの補充はバックグラウンドのスレッドで行い、
+      リクエストスレッドでプロセスを起動することはない
+    - 期限（Deadline）はワーカーがバッチを受け取った時点から数える（起動待ち・空き待ちは含めない）
+    - 本文はバッチごとにパイプで送る。ワーカー側でもコンパイル結果を LRU で保持する
+    """
+
+    def __init__(self, workers: int = 2):
+        self.size = max(1, workers)
+        self._ctx = mp.get_context("spawn")  # スレッドを持つ親プロセスを fork しない
+        self._idle: "queue.LifoQueue[_Worker]" = queue.LifoQueue()  # 起動済み（ready）のワーカーだけを入れる
+        self._lock = threading.Lock()
+        self._started = False
+        self._closed = False
+        self.timeouts = 0
+
+    def start(self) -> None:
+        """ワーカーを起動し、すべて ready になるまで待つ（初回検索でプロセス起動を待たないように）。"""
+        with self._lock:
+            if self._started or self._closed:
+                return
+            self._started = True
+        workers = [_Worker(self._ctx) for _ in range(self.size)]
+        for w in workers:
+            if w.wait_ready(_READY_TIMEOUT):
+                self._put_idle(w)
+            else:
+                log.warning("regex worker did not become ready; retrying in background")
+                w.kill()
+                self._refill()
+
+    def _start_async(self) -> None:
+        """start() を呼ばずに使われた場合。全枠の起動をバックグラウンドに任せる。"""
+        with self._lock:
+            if self._started or self._closed:
+                return
+            self._started = True
+        for _ in range(self.size):
+            self._refill()
+
+    def _refill(self) -> None:
+        """1 枠分のワーカーをバックグラウンドで起動し、ready になったらプールに入れる。"""
+        threading.Thread(target=self._refill_main, name="regex-sandbox-refill", daemon=True).start()
+
+    def _refill_main(self) -> None:
+        while not self._closed:
+            w = _Worker(self._ctx)
+            if w.wait_ready(_READY_TIMEOUT):
+                self._put_idle(w)
+                return
+            w.kill()
+            if self._closed:
+                return
+            log.warning("regex worker did not become ready; retrying")
+            time.sleep(1.0)
+
+    def _put_idle(self, w: _Worker) -> None:
+        with self._lock:
+            if not self._closed:
+                self._idle.put(w)
+                return
+        w.kill()
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+        while True:
+            try:
+                w = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                w.conn.send(None)
+            except OSError:
+                pass
+            w.kill()
+
+    def _acquire(self, deadline: Deadline) -> Optional[_Worker]:
+        """
+        空いている準備済みのワーカーを待って取り出す。期限の時計がまだ動いていなければ
+        （このリクエストでまだ照合していなければ）起動・補充を待つ分の余裕を足す。
+        """
+        self._start_async()
+        wait = deadline.remaining() if deadline.started else deadline.timeout + _READY_TIMEOUT
+        until = time.monotonic() + wait
+        while True:
+            try:
+                w = self._idle.get(timeout=max(0.0, until - time.monotonic()))
+            except queue.Empty:
+                return None
+            if w.proc.is_alive():
+                return w
+            # 待機中に落ちていたワーカーは捨てて補充に回す
+            w.kill()
+            self._refill()
+
+    def search_first(
+        self,
+        pattern: str,
+        flags: int,
+        texts: Iterable[str],
+        deadline: Deadline,
+    ) -> Iterator[Tuple[int, Span]]:
+        """
+        texts の各要素について最初のマッチ位置を (要素の番号, span or None) で順に返す。
+        期限内に終わらなければ TimeoutError を送出する（それまでに返した分は有効）。
+        呼び出し側が途中で反復をやめた場合も、ワーカーはプールに戻る。
+        """
+        return self._run("first", pattern, flags, texts, deadline)
+
+    def finditer(
+        self,
+        pattern: str,
+        flags: int,
+        texts: Iterable[str],
+        deadline: Deadline,
+        limit: Optional[int] = None,
+    ) -> Iterator[Tuple[int, List[Tuple[int, int]]]]:
+        """
+        texts の各要素の空でないマッチ位置をすべて (要素の番号, [span, ...]) で順に返す
+        （limit を渡すと 1 バッチあたりその件数まで）。期限の扱いは search_first と同じ。
+        """
+        return self._run("all", pattern, flags, texts, deadline, limit)
+
+    def search_ranges(
+        self,
+        pattern: str,
+        flags: int,
+        items: Iterable[Ranges],
+        deadline: Deadline,
+    ) -> Iterator[Tuple[int, List[Span]]]:
+        """
+        (本文, [(pos, endpos), ...]) ごとに、範囲ごとの最初のマッチ位置を
+        (要素の番号, [span or None, ...]) で順に返す。期限の扱いは search_first と同じ。
+        """
+        return self._run("ranges", pattern, flags, items, deadline)
+
+    def _run(
+        self,
+        op: str,
+        pattern: str,
+        flags: int,
+        items: Iterable[Union[str, Ranges]],
+        deadline: Deadline,
+        limit: Optional[int] = None,
+    ) -> Iterator[Tuple[int, Any]]:
+        if self._closed:
+            raise RuntimeError("regex sandbox is closed")
+        w = self._acquire(deadline)
+        if w is None:
+            raise TimeoutError("no regex worker became available before the deadline")
+        pending = False  # 応答待ちのバッチがあるか
+        try:
+            base = 0
+            for batch in _batches(items):
+                deadline.start()
+                remaining = deadline.remaining()
+                if remaining <= 0:
+                    raise TimeoutError("regex search deadline exceeded")
+                pending = True
+                w.conn.send((op, pattern, flags, batch, limit))
+                if not w.conn.poll(remaining):
+                    self.timeouts += 1
+                    log.warning(f"regex search timed out; killing worker: pattern={pattern!r}")
+                    raise TimeoutError("regex search deadline exceeded")
+                try:
+                    results: Sequence[Any] = w.conn.recv()
+                except (EOFError, OSError):
+                    # MemoryError 等でワーカーが落ちた。結果は打ち切りとして扱う
+                    log.warning(f"regex worker exited unexpectedly: pattern={pattern!r}")
+                    raise TimeoutError("regex worker exited unexpectedly")
+                pending = False
+                for i, r in enumerate(results):
+                    yield base + i, r
+                base += len(batch)
+        finally:
+            if pending:
+                # 応答待ちのまま止めたワーカーは状態が不明なので捨て、代わりはバックグラウンドで起動する
+                w.kill()
+                if not self._closed:
+                    self._refill()
+            else:
+                self._put_idle(w)
+
+
+def _batches(items: Iterable[Union[str, Ranges]]) -> Iterator[List[Union[str, Ranges]]]:
+    batch: List[Union[str, Ranges]] = []
+    size = 0
+    for t in items:
+        batch.append(t)
+        size += len(t) if isinstance(t, str) else len(t[0])
+        if size >= _BATCH_CHARS or len(batch) >= _BATCH_ITEMS:
+            yield batch
+            batch = []
+            size = 0
+    if batch:
+        yield batch
@@ -0,0 +1,89 @@
+from __future__ import annotations
+import re
+import unicodedata
+from array import array
+from typing import List, Tuple
+
+# 許容する“区切り”の 1 文字クラス（loose 検索と n-gram 索引で共用）
+# 空白(\s) / 全角空白(\u3000) / 中点 / スラッシュ(全半角) / 各種ハイフン
+SEP_CHAR_CLASS = r"[\s\u3000・/／\-\u2010\u2011\u2012\u2013\u2014]"
+_SEP_RE = re.compile(SEP_CHAR_CLASS + "+")
+# 段落の区切り（空行。空白だけの行も空行とみなす）
+_BLANK_LINES_RE = re.compile(r"\n[ \t\u3000]*\n(?:[ \t\u3000]*\n)*")
+
+# re.IGNORECASE が ASCII 英字と同一視するが lower() では揃わない文字
+_FOLD_FIXES = str.maketrans({"\u0130": "i", "\u0131": "i", "\u017f": "s"})
+_FOLD_FIX_RE = re.compile("[\u0130\u0131\u017f]")
+
+
+def normalize_text(s: str) -> str:
+    """NFKC 正規化＋改行コード統一。"""
+    return unicodedata.normalize(
+        "NFKC",
+        s.replace("\r\n", "\n").replace("\r", "\n"),
+    )
+
+
+def strip_separators(s: str) -> str:
+    """区切り文字（SEP_CHAR_CLASS）をすべて取り除く。"""
+    return _SEP_RE.sub("", s)
+
+
+def fold_case(s: str) -> str:
+    """索引用の大文字小文字畳み込み（文字数は変わらない）。"""
+    # translate は遅いので、対象の文字があるときだけかける
+    if _FOLD_FIX_RE.search(s):
+        s = s.translate(_FOLD_FIXES)
+    return s.lower()
+
+
+def shadow_text(s: str) -> Tuple[str, array, array]:
+    """
+    loose 検索用の影テキスト。区切り文字を除いて fold_case() した文字列と、
+    影テキスト上の位置から s 上の位置を引くための表 (runs, origins) を返す。
+
+    runs[i] は区切りで分かれた i 番目の区間の影テキスト上の開始位置、origins[i] はその s 上の開始位置
+    （1 文字ごとの表より小さい。引き方は SectionText.from_shadow()）。
+    """
+    runs = array("I", [0])
+    origins = array("I", [0])
+    removed = 0
+    for m in _SEP_RE.finditer(s):
+        end = m.end()
+        removed += end - m.start()
+        runs.append(end - removed)
+        origins.append(end)
+    return fold_case(strip_separators(s)), runs, origins
+
+
+def is_simple_case(s: str) -> bool:
+    """
+    fold_case での比較が re.IGNORECASE と矛盾しない文字だけで構成されているか。
+    非 ASCII の大文字小文字を持つ文字（ギリシャ文字など）は特殊な畳み込みがあるため False。
+    """
+    return all(c.isascii() or c.lower() == c.upper() for c in s)
+
+
+def make_snippet(text: str, start: int, end: int, width: int = 80) -> str:
+    """
+    マッチ位置の前後 width 文字からスニペットを生成。
+    端が切れている場合は '…' を付与。
+    """
+    left = max(0, start - width)
+    right = min(len(text), end + width)
+    prefix = "…" if left > 0 else ""
+    suffix = "…" if right < len(text) else ""
+    return prefix + text[left:right].strip() + suffix
+
+
+def paragraph_spans(text: str) -> List[Tuple[int, int]]:
+    """空行区切りの段落を (start, end) の文字オフセットで返す。空の段落は含めない。"""
+    spans: List[Tuple[int, int]] = []
+    pos = 0
+    for m in _BLANK_LINES_RE.finditer(text):
+        if text[pos:m.start()].strip():
+            spans.append((pos, m.start()))
+        pos = m.end()
+    if text[pos:].strip():
+        spans.append((pos, len(text)))
+    return spans
@@ -0,0 +1,179 @@
+from __future__ import annotations
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+try:  # watchfiles (inotify 等) は uvicorn[standard] に同梱。無ければポーリングで代用する。
+    import watchfiles
+except ModuleNotFoundError:  # pragma: no cover - only hit in minimal dependency envs
+    watchfiles = None  # type: ignore[assignment]
+
+log = logging.getLogger(__name__)
+
+# (st_mtime_ns, st_size, st_ino)。内容のハッシュではなく stat だけで変更を検知する。
+Fingerprint = Tuple[int, int, int]
+Listener = Callable[[str, Path], None]
+
+
+def fingerprint(path: Path) -> Optional[Fingerprint]:
+    """ファイルの stat 指紋を返す。存在しなければ None。"""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+class FileWatcher:
+    """
+    ToC / 章ファイルの変更監視サービス。
+
+    - 追跡中のファイルごとに stat 指紋を保持し、変化したらそのマニュアルの
+      バージョンカウンタを進めてリスナーに (manual, path) を通知する
+    - start() 後はバックグラウンドスレッド（inotify またはポーリング）が指紋を
+      更新するので、fingerprint() / version() はシステムコールなしで返る
+    - start() していない場合は呼び出しのたびに stat して同期的に検知する
+    """
+
+    def __init__(self, root: Path, backend: str = "auto", poll_interval: float = 2.0):
+        self.root = root
+        self.backend = backend
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._files: Dict[Path, Tuple[str, Optional[Fingerprint]]] = {}
+        self._by_manual: Dict[str, Set[Path]] = {}
+        self._versions: Dict[str, int] = {}
+        self._listeners: List[Listener] = []
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # -------- Lifecycle
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        if self.running:
+            return
+        backend = self.backend
+        if backend in ("auto", "inotify"):
+            if watchfiles is not None and self.root.exists():
+                backend = "inotify"
+            else:
+                if self.backend == "inotify":
+                    log.warning("watchfiles is unavailable; falling back to polling")
+                backend = "poll"
+        target = self._run_inotify if backend == "inotify" else self._run_poll
+        self._stop.clear()
+        self._thread = threading.Thread(
+            target=target, name=f"file-watcher-{backend}", daemon=True
+        )
+        self._thread.start()
+        log.info(f"file watcher started (backend={backend}, root={self.root})")
+
+    def stop(self) -> None:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout=5)
+        self._thread = None
+
+    def subscribe(self, listener: Listener) -> None:
+        self._listeners.append(listener)
+
+    # -------- Tracking
+    def track(self, manual: str, paths: Iterable[Path]) -> None:
+        """未追跡のファイルを manual に紐づけて追跡対象に加える。"""
+        new = [p for p in paths if p not in self._files]
+        observed = [(p, fingerprint(p)) for p in new]
+        with self._lock:
+            for p, fp in observed:
+                if p not in self._files:
+                    self._files[p] = (manual, fp)
+                    self._by_manual.setdefault(manual, set()).add(p)
+
+    def fingerprint(self, path: Path, manual: Optional[str] = None) -> Optional[Fingerprint]:
+        """
+        path の指紋を返す。監視スレッド稼働中で追跡済みなら保持値を返す（stat なし）。
+        manual を渡すと、未追跡のファイルはその manual の追跡対象に加える。
+        """
+        if self.running:
+            with self._lock:
+                tracked = self._files.get(path)
+            if tracked is not None:
+                return tracked[1]
+        fp = fingerprint(path)
+        if path in self._files:
+            self._observe(path, fp)
+        elif manual is not None:
+            with self._lock:
+                if path not in self._files:
+                    self._files[path] = (manual, fp)
+                    self._by_manual.setdefault(manual, set()).add(path)
+        return fp
+
+    def version(self, manual: str) -> int:
+        """
+        manual 配下の追跡ファイルのいずれかが変わるたびに増えるカウンタ。
+        他のキャッシュはこの値をキーに含めれば無効化を意識しなくてよい。
+        """
+        if not self.running:
+            self.poll(manual)
+        return self._versions.get(manual, 0)
+
+    def poll(self, manual: Optional[str] = None) -> int:
+        """追跡中のファイル（manual 指定時はそのマニュアル分）を stat し直す。変更数を返す。"""
+        with self._lock:
+            if manual is None:
+                paths = list(self._files)
+            else:
+                paths = list(self._by_manual.get(manual, ()))
+        changed = 0
+        for p in paths:
+            if self._observe(p, fingerprint(p)):
+                changed += 1
+        return changed
+
+    def _observe(self, path: Path, fp: Optional[Fingerprint]) -> bool:
+        with self._lock:
+            tracked = self._files.get(path)
+            if tracked is None or tracked[1] == fp:
+                return False
+            manual = tracked[0]
+            self._files[path] = (manual, fp)
+            self._versions[manual] = self._versions.get(manual, 0) + 1
+        log.info(f"file changed: manual={manual} path={path}")
+        for listener in list(self._listeners):
+            try:
+                listener(manual, path)
+            except Exception:
+                log.exception(f"file watcher listener failed: {path}")
+        return True
+
+    # -------- Background loops
+    def _run_poll(self) -> None:
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception:
+                log.exception("file watcher poll failed")
+
+    def _run_inotify(self) -> None:
+        assert watchfiles is not None
+        try:
+            for changes in watchfiles.watch(
+                self.root,
+                stop_event=self._stop,
+                debounce=200,
+                raise_interrupt=False,
+            ):
+                for _, raw in changes:
+                    p = Path(raw)
+                    if p in self._files:
+                        self._observe(p, fingerprint(p))
+        except Exception:
+            # bind mount 等で inotify が使えない場合はポーリングに切り替える
+            log.exception("inotify watcher failed; falling back to polling")
+            self._run_poll()
@@ -1,10 +1,88 @@
 from __future__ import annotations
-from fastapi import Depends
+import threading
+from contextvars import ContextVar
+from typing import Optional
+
 from app.core.config import load_settings, Settings
 from app.repositories.manual import ManualRepository
 
+# プロセス内で共有する設定とリポジトリ（ToC キャッシュをリクエスト間で生かすため）
+_lock = threading.Lock()
+_settings: Optional[Settings] = None
+_repo: Optional[ManualRepository] = None
+# リクエストの開始時点の共有リポジトリ（RepoLeaseMiddleware が設定する）
+_leased: ContextVar[Optional[ManualRepository]] = ContextVar("leased_repo", default=None)
+
 def get_settings() -> Settings:
-    return load_settings()
+    global _settings
+    settings = _settings
+    if settings is None:
+        with _lock:
+            if _settings is None:
+                _settings = load_settings()
+            settings = _settings
+    return settings
+
+def get_repo() -> ManualRepository:
+    global _repo
+    repo = _leased.get()
+    if repo is not None:
+        return repo
+    repo = _repo
+    if repo is None:
+        settings = get_settings()
+        with _lock:
+            if _repo is None:
+                _repo = ManualRepository(settings)
+            repo = _repo
+    return repo
+
+def reload_settings() -> ManualRepository:
+    """
+    config.yaml を読み直し、共有リポジトリを作り直す。
+
+    処理中のリクエストは古いリポジトリをそのまま使い切り（レスポンスの送信完了まで。
+    RepoLeaseMiddleware 参照）、古いリポジトリはそれらが終わってから close する。
+    以降のリクエストから新しい設定・空のキャッシュが使われる。
+    """
+    global _settings, _repo
+    settings = load_settings()
+    repo = ManualRepository(settings)
+    repo.start()
+    with _lock:
+        old = _repo
+        _settings = settings
+        _repo = repo
+    if old is not None:
+        old.retire()
+    return repo
+
+
+def _lease() -> ManualRepository:
+    get_repo()
+    with _lock:
+        repo = _repo
+        repo.hold()  # reload_settings の差し替えと排他にして、retire() 後に数えないようにする
+    return repo
+
+
+class RepoLeaseMiddleware:
+    """
+    リクエストの開始時点の共有リポジトリを、レスポンスの送信完了まで get_repo() が返すようにする
+    ASGI ミドルウェア（ストリーミングの途中で reload されても同じリポジトリを使い続ける）。
+    """
+
+    def __init__(self, app):
+        self.app = app
 
-def get_repo(settings: Settings = Depends(get_settings)) -> ManualRepository:
-    return ManualRepository(settings)
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        repo = _lease()
+        token = _leased.set(repo)
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _leased.reset(token)
+            repo.release()
@@ -0,0 +1,188 @@
+from __future__ import annotations
+import heapq
+import logging
+import math
+import threading
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
+
+try:  # あればスコア計算をベクトル演算で行う（無ければ純 Python）
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - only hit in missing dependency envs
+    np = None  # type: ignore[assignment]
+
+from app.core.watcher import Fingerprint
+from app.indices.ngram import index_key
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.repositories.cache import SectionText
+    from app.repositories.manual import ManualRepository
+
+log = logging.getLogger(__name__)
+
+# BM25 の標準的なパラメータ
+_K1 = 1.2
+_B = 0.75
+
+
+def term_counts(text: str) -> Counter:
+    """BM25 の語＝index_key() 済み文字列の 2-gram（重複を数える）。"""
+    key = index_key(text)
+    return Counter(key[i:i + 2] for i in range(len(key) - 1))
+
+
+@dataclass
+class Doc:
+    """スコアリング単位（章全体、または章内のチャンク）。start/end は正規化済み本文上の位置。"""
+    section_id: str
+    start: int
+    end: int
+    tf: Counter
+    length: int
+    chunk_no: int = 0  # チャンクなら章内の通し番号（1 始まり）、章全体なら 0
+
+
+@dataclass
+class _SectionDocs:
+    fp: Fingerprint
+    section: Doc
+    chunks: List[Doc]
+
+
+@dataclass
+class _Level:
+    """
+    1 つの粒度（章 or チャンク）の集計値。
+
+    postings は語ごとの (文書番号の列, 重みの列)。重みは BM25 の語ごとの項から idf と
+    クエリ側の tf を除いたもの（tf と文書長だけで決まるので集計時に計算しておく）。
+    numpy があれば列は ndarray にしておき、スコアは語ごとのベクトル加算で求める。
+    """
+    docs: List[Doc] = field(default_factory=list)
+    df: Counter = field(default_factory=Counter)
+    postings: Dict[str, Tuple[Any, Any]] = field(default_factory=dict)
+    avgdl: float = 0.0
+    arrays: bool = False  # postings が ndarray か
+
+    @classmethod
+    def build(cls, docs: List[Doc]) -> "_Level":
+        level = cls(docs=docs)
+        level.avgdl = sum(d.length for d in docs) / len(docs) if docs else 0.0
+        avgdl = level.avgdl or 1.0
+        postings: Dict[str, Tuple[List[int], List[float]]] = {}
+        for i, d in enumerate(docs):
+            k = _K1 * (1.0 - _B + _B * d.length / avgdl)
+            for t, tf in d.tf.items():
+                ids, weights = postings.get(t) or postings.setdefault(t, ([], []))
+                ids.append(i)
+                weights.append(tf * (_K1 + 1.0) / (tf + k))
+        level.arrays = np is not None
+        for t, (ids, weights) in postings.items():
+            level.df[t] = len(ids)
+            if level.arrays:
+                level.postings[t] = (np.array(ids, dtype=np.int64), np.array(weights, dtype=np.float64))
+            else:
+                level.postings[t] = (ids, weights)
+        return level
+
+    def idf(self, term: str) -> float:
+        n = len(self.docs)
+        df = self.df.get(term, 0)
+        return math.log(1.0 + (n - df + 0.5) / (df + 0.5))
+
+    def top(self, query_tf: Counter, limit: int) -> List[Tuple[float, int]]:
+        """スコアの高い順（同点は文書番号順）に上位 limit 件の (score, 文書番号) を返す。"""
+        terms = [(qtf * self.idf(t), self.postings[t]) for t, qtf in query_tf.items() if t in self.postings]
+        if not terms or limit <= 0:
+            return []
+        if self.arrays:
+            scores = np.zeros(len(self.docs))
+            for c, (ids, weights) in terms:
+                scores[ids] += c * weights  # 語ごとに文書番号は重複しない
+            hit = np.flatnonzero(scores)
+            if limit < len(hit):
+                # 上位 limit 件目と同点の文書も残してから並べる（同点の順序を純 Python 版と揃える）
+                kth = np.partition(scores[hit], len(hit) - limit)[len(hit) - limit]
+                hit = hit[scores[hit] >= kth]
+            hit = hit[np.lexsort((hit, -scores[hit]))][:limit]
+            return [(float(scores[i]), int(i)) for i in hit]
+
+        acc: Dict[int, float] = {}
+        for c, (ids, weights) in terms:
+            for i, w in zip(ids, weights):
+                acc[i] = acc.get(i, 0.0) + c * w
+        return heapq.nsmallest(limit, ((s, i) for i, s in acc.items()), key=lambda x: (-x[0], x[1]))
+
+
+@dataclass
+class ManualStats:
+    version: int
+    sections: _Level
+    chunks: _Level
+
+
+class Bm25Store:
+    """
+    マニュアルごとの BM25 用統計（章レベル・チャンクレベル）。
+
+    章ごとの語頻度はファイル指紋つきで保持し、マニュアルのバージョンが進んだときは
+    指紋が変わった章だけ数え直して df / 平均文書長を集計し直す。
+    """
+
+    def __init__(self, repo: "ManualRepository"):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._stats: Dict[str, ManualStats] = {}
+        self._docs: Dict[str, Dict[str, _SectionDocs]] = {}
+
+    def get(self, manual: str) -> ManualStats:
+        version = self.repo.manual_version(manual)
+        stats = self._stats.get(manual)
+        if stats is not None and stats.version == version:
+            return stats
+
+        with self._lock:
+            stats = self._stats.get(manual)
+            if stats is not None and stats.version == version:
+                return stats
+            prev = self._docs.get(manual, {})
+            current: Dict[str, _SectionDocs] = {}
+            recounted = 0
+            for st in self.repo.iter_sections(manual):
+                docs = prev.get(st.section_id)
+                if docs is None or docs.fp != st.fp:
+                    docs = self._count(st)
+                    recounted += 1
+                current[st.section_id] = docs
+            self._docs[manual] = current
+            stats = ManualStats(
+                version=version,
+                sections=_Level.build([d.section for d in current.values()]),
+                chunks=_Level.build([c for d in current.values() for c in d.chunks]),
+            )
+            self._stats[manual] = stats
+            if recounted:
+                log.info(f"bm25 stats updated: manual={manual} recounted={recounted}/{len(current)}")
+            return stats
+
+    @staticmethod
+    def _count(st: "SectionText") -> _SectionDocs:
+        text = st.norm
+        chunks: List[Doc] = []
+        total: Counter = Counter()
+        for no, (start, end) in enumerate(zip(st.chunk_starts, st.chunk_ends), start=1):
+            tf = term_counts(text[start:end])
+            total.update(tf)
+            chunks.append(Doc(st.section_id, start, end, tf, sum(tf.values()), chunk_no=no))
+        section = Doc(st.section_id, 0, len(text), total, sum(total.values()))
+        return _SectionDocs(fp=st.fp, section=section, chunks=chunks)
+
+    def rank(self, manual: str, query: str, level: str, limit: int) -> List[Tuple[float, Doc]]:
+        """BM25 スコアの高い順に (score, Doc) を返す。"""
+        stats = self.get(manual)
+        query_tf = term_counts(query)
+        if not query_tf:
+            return []
+        lv = stats.chunks if level == "chunk" else stats.sections
+        return [(s, lv.docs[i]) for s, i in lv.top(query_tf, limit)]
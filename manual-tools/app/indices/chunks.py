@@ -0,0 +1,173 @@
+from __future__ import annotations
+import threading
+from array import array
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+
+from app.core.text import paragraph_spans
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.repositories.manual import ManualRepository
+
+
+def line_starts(text: str) -> array:
+    """各行の先頭位置（0 始まりの文字オフセット）。"""
+    starts = array("I", [0])
+    pos = text.find("\n")
+    while pos != -1:
+        starts.append(pos + 1)
+        pos = text.find("\n", pos + 1)
+    return starts
+
+
+def chunk_spans(text: str, max_chars: int) -> List[Tuple[int, int]]:
+    """
+    章本文をチャンクに分割し、(start, end) の文字オフセットで返す。
+
+    - 基本は段落（空行区切り）単位
+    - max_chars を超える段落は行単位で詰め直す（1 行が長すぎる場合はその行だけで 1 チャンク）
+    """
+    spans: List[Tuple[int, int]] = []
+    for start, end in paragraph_spans(text):
+        if end - start <= max_chars:
+            spans.append((start, end))
+            continue
+        cur = start
+        pos = start
+        while pos < end:
+            nl = text.find("\n", pos, end)
+            line_end = end if nl == -1 else nl + 1
+            if line_end - cur > max_chars and pos > cur:
+                spans.append((cur, pos))
+                cur = pos
+            pos = line_end
+        if text[cur:end].strip():
+            spans.append((cur, end))
+    return [(s, e) for s, e in ((s, e - 1 if text[e - 1] == "\n" else e) for s, e in spans) if e > s]
+
+
+def make_chunk_id(section_id: str, no: int) -> str:
+    return f"{section_id}:{no}"
+
+
+def parse_chunk_id(chunk_id: str) -> Optional[Tuple[str, int]]:
+    section_id, sep, no = chunk_id.rpartition(":")
+    if not sep or not no.isdigit():
+        return None
+    return section_id, int(no)
+
+
+@dataclass
+class ChunkRef:
+    chunk_id: str
+    section_id: str
+    no: int
+    start: int
+    end: int
+    start_line: int
+    end_line: int
+
+
+class ChunkTable:
+    """
+    1 マニュアル分のチャンク表。
+
+    チャンクごとの値は array で列ごとに持ち（章の序数・章内番号・開始/終了オフセット・開始/終了行）、
+    chunk_id → 行の解決は「章の先頭チャンク位置 + 章内番号」で行う。
+    """
+
+    def __init__(self, version: int):
+        self.version = version
+        self.section_ids: List[str] = []
+        self._section_ord: Dict[str, int] = {}
+        self.first = array("I")      # 章ごとの先頭チャンク位置
+        self.count = array("I")      # 章ごとのチャンク数
+        self.section = array("I")    # 以下、チャンクごとの列
+        self.start = array("I")
+        self.end = array("I")
+        self.start_line = array("I")
+        self.end_line = array("I")
+
+    def __len__(self) -> int:
+        return len(self.start)
+
+    def add_section(self, section_id: str, spans: List[Tuple[int, int]], lines: List[Tuple[int, int]]) -> None:
+        if section_id in self._section_ord:
+            return
+        ord_ = len(self.section_ids)
+        self.section_ids.append(section_id)
+        self._section_ord[section_id] = ord_
+        self.first.append(len(self.start))
+        self.count.append(len(spans))
+        for (s, e), (ls, le) in zip(spans, lines):
+            self.section.append(ord_)
+            self.start.append(s)
+            self.end.append(e)
+            self.start_line.append(ls)
+            self.end_line.append(le)
+
+    def ref(self, i: int) -> ChunkRef:
+        ord_ = self.section[i]
+        sid = self.section_ids[ord_]
+        no = i - self.first[ord_] + 1
+        return ChunkRef(
+            chunk_id=make_chunk_id(sid, no),
+            section_id=sid,
+            no=no,
+            start=self.start[i],
+            end=self.end[i],
+            start_line=self.start_line[i],
+            end_line=self.end_line[i],
+        )
+
+    def index_of(self, section_id: str, no: int) -> Optional[int]:
+        ord_ = self._section_ord.get(section_id)
+        if ord_ is None or not 1 <= no <= self.count[ord_]:
+            return None
+        return self.first[ord_] + no - 1
+
+    def find(self, chunk_id: str) -> Optional[ChunkRef]:
+        parsed = parse_chunk_id(chunk_id)
+        if parsed is None:
+            return None
+        i = self.index_of(*parsed)
+        return None if i is None else self.ref(i)
+
+    def section_refs(self, section_id: str, start_no: int = 1, end_no: Optional[int] = None) -> List[ChunkRef]:
+        """章内のチャンク（start_no〜end_no、両端含む）を返す。"""
+        ord_ = self._section_ord.get(section_id)
+        if ord_ is None:
+            return []
+        n = self.count[ord_]
+        last = n if end_no is None else min(end_no, n)
+        first = self.first[ord_]
+        return [self.ref(first + k - 1) for k in range(max(1, start_no), last + 1)]
+
+    def refs(self) -> List[ChunkRef]:
+        return [self.ref(i) for i in range(len(self))]
+
+
+class ChunkStore:
+    """マニュアルごとの ChunkTable。マニュアルのバージョンが進んだら組み直す。"""
+
+    def __init__(self, repo: "ManualRepository"):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._tables: Dict[str, ChunkTable] = {}
+
+    def get(self, manual: str) -> ChunkTable:
+        version = self.repo.manual_version(manual)
+        table = self._tables.get(manual)
+        if table is not None and table.version == version:
+            return table
+        with self._lock:
+            table = self._tables.get(manual)
+            if table is not None and table.version == version:
+                return table
+            table = ChunkTable(version)
+            for st in self.repo.iter_sections(manual):
+                spans = list(zip(st.chunk_starts, st.chunk_ends))
+                lines = [(st.line_of(s), st.line_of(max(s, e - 1))) for s, e in spans]
+                table.add_section(st.section_id, spans, lines)
+            self._tables[manual] = table
+            return table
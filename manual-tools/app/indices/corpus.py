@@ -0,0 +1,247 @@
+from __future__ import annotations
+import json
+import logging
+import mmap
+import os
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass
+from functools import lru_cache
+from pathlib import Path
+from typing import TYPE_CHECKING, Collection, Dict, Iterator, List, Optional, Pattern, Tuple
+
+from app.core.metrics import ScanStats
+from app.core.text import SEP_CHAR_CLASS, is_simple_case, normalize_text
+from app.indices.ngram import Signature
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.repositories.manual import ManualRepository
+
+log = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 1
+_SNIPPET_WIDTH = 80  # core.text.make_snippet の既定値と合わせる
+
+# re.IGNORECASE（str）では ASCII の i と同一視されるが、bytes の正規表現では一致しない文字。
+# ſ / K（ケルビン）も同様だが NFKC で ASCII に正規化されるので本文には残らない。
+_DOTTED_I = ("İ", "ı")
+
+
+@lru_cache(maxsize=1)
+def _sep_bytes() -> bytes:
+    """SEP_CHAR_CLASS + "*" の bytes 版。区切り文字（\\s を含む）を UTF-8 のバイト列で列挙する。"""
+    sep = re.compile(SEP_CHAR_CLASS)
+    chars = [chr(c) for c in range(0x10000) if not 0xD800 <= c <= 0xDFFF and sep.fullmatch(chr(c))]
+    single = b"".join(re.escape(c.encode("utf-8")) for c in chars if ord(c) < 0x80)
+    multi = [re.escape(c.encode("utf-8")) for c in chars if ord(c) >= 0x80]
+    return b"(?:[" + single + b"]|" + b"|".join(multi) + b")*"
+
+
+@lru_cache(maxsize=256)
+def compile_bytes_query(query: str, mode: str, case_sensitive: bool) -> Optional[Pattern[bytes]]:
+    """
+    plain / loose のクエリを、正規化済み本文の UTF-8 バイト列に対する正規表現にする。
+    str の正規表現と結果が変わり得る場合（非 ASCII の大文字小文字など）は None。
+    """
+    if mode == "plain":
+        q = query
+    elif mode == "loose":
+        q = normalize_text(query)
+    else:
+        return None
+    if not case_sensitive and not is_simple_case(q):
+        return None
+    try:
+        if mode == "plain":
+            pattern = re.escape(q.encode("utf-8"))
+        else:
+            pattern = _sep_bytes().join(re.escape(ch.encode("utf-8")) for ch in q)
+    except UnicodeEncodeError:  # サロゲートなど
+        return None
+    return re.compile(pattern, 0 if case_sensitive else re.IGNORECASE)
+
+
+@dataclass
+class _Section:
+    section_id: str
+    start: int           # corpus.bin 上のバイト位置
+    end: int
+    chunk_starts: array  # 章先頭からのバイト位置
+
+
+class CorpusFile:
+    """
+    1 マニュアル分のコンパイル済みコーパス（indices_dir/{manual}/corpus.bin + corpus.json）。
+
+    corpus.bin は全章の正規化済み本文（UTF-8）を ToC 順に連結したもの。mmap して
+    bytes の正規表現で直接走査するので、章ごとの str を作らず、複数ワーカーでも
+    OS のページキャッシュを共有できる。
+    """
+
+    def __init__(self, manual: str, signature: Signature, sections: List[_Section],
+                 has_dotted_i: bool, buf: "mmap.mmap | bytes"):
+        self.manual = manual
+        self.signature = signature
+        self.sections = sections
+        self.has_dotted_i = has_dotted_i
+        self.buf = buf
+        self._by_id = {s.section_id: i for i, s in enumerate(sections)}
+
+    # -------- Build / persistence
+    @staticmethod
+    def _paths(base: Path) -> Tuple[Path, Path]:
+        return base / "corpus.json", base / "corpus.bin"
+
+    @classmethod
+    def compile(cls, repo: "ManualRepository", manual: str, base: Path) -> "CorpusFile":
+        """repo から章本文を読み、corpus.bin / corpus.json を書き出す（一時ファイル → rename）。"""
+        signature = repo.section_signature(manual)
+        meta_path, bin_path = cls._paths(base)
+        base.mkdir(parents=True, exist_ok=True)
+        sections = []
+        has_dotted_i = False
+        pos = 0
+        tmp_bin = bin_path.with_name(bin_path.name + ".tmp")
+        with open(tmp_bin, "wb") as f:
+            for st in repo.iter_sections(manual):
+                data = st.norm.encode("utf-8")
+                # チャンク境界を文字位置からバイト位置に直す
+                chunk_starts: List[int] = []
+                prev = nbytes = 0
+                for c in st.chunk_starts:
+                    nbytes += len(st.norm[prev:c].encode("utf-8"))
+                    chunk_starts.append(nbytes)
+                    prev = c
+                sections.append([st.section_id, pos, pos + len(data), chunk_starts])
+                has_dotted_i = has_dotted_i or any(c in st.norm for c in _DOTTED_I)
+                f.write(data)
+                pos += len(data)
+        meta = {
+            "format": _FORMAT_VERSION,
+            "manual": manual,
+            "sections": sections,
+            "signature": [[sid, fn, list(fp) if fp else None] for sid, fn, fp in signature],
+            "has_dotted_i": has_dotted_i,
+        }
+        tmp_meta = meta_path.with_name(meta_path.name + ".tmp")
+        with open(tmp_meta, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_bin, bin_path)
+        os.replace(tmp_meta, meta_path)
+        log.info(f"compiled corpus: manual={manual} sections={len(sections)} bytes={pos}")
+        loaded = cls.load(base)
+        assert loaded is not None
+        return loaded
+
+    @classmethod
+    def load(cls, base: Path) -> Optional["CorpusFile"]:
+        meta_path, bin_path = cls._paths(base)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != _FORMAT_VERSION:
+                return None
+            with open(bin_path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                # 空ファイルは mmap できない
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        except (OSError, ValueError):
+            return None
+        sections = [_Section(sid, s, e, array("I", cs)) for sid, s, e, cs in meta["sections"]]
+        if sections and sections[-1].end != len(buf):
+            return None
+        signature: Signature = [
+            (sid, fn, tuple(fp) if fp else None) for sid, fn, fp in meta["signature"]
+        ]
+        return cls(meta["manual"], signature, sections, meta["has_dotted_i"], buf)
+
+    # -------- Scanning
+    def usable_for(self, query: str, case_sensitive: bool) -> bool:
+        """bytes の IGNORECASE が str と同じ結果になるか（i と İ / ı の同一視の有無）。"""
+        return case_sensitive or not self.has_dotted_i or "i" not in query.lower()
+
+    def search_first(
+        self,
+        rx: Pattern[bytes],
+        section_ids: Optional[Collection[str]] = None,
+        stats: Optional[ScanStats] = None,
+    ) -> Iterator[Tuple[str, str, int]]:
+        """
+        各章の最初のマッチを (section_id, snippet, 章内チャンク番号) で ToC 順に返す。
+        section_ids を渡すとその章だけを走査する。stats には走査した章数と照合時間を足す。
+        """
+        if section_ids is None:
+            targets = self.sections
+        else:
+            idx = sorted(self._by_id[sid] for sid in section_ids if sid in self._by_id)
+            targets = [self.sections[i] for i in idx]
+        buf = self.buf
+        scanned = 0
+        spent = 0.0
+        try:
+            for sec in targets:
+                t = time.perf_counter()
+                m = rx.search(buf, sec.start, sec.end)
+                spent += time.perf_counter() - t
+                scanned += 1
+                if m is None:
+                    continue
+                start, end = m.span()
+                chunk_no = 0
+                if sec.chunk_starts:
+                    chunk_no = max(1, bisect_right(sec.chunk_starts, start - sec.start))
+                yield sec.section_id, self._snippet(sec, start, end), chunk_no
+        finally:
+            if stats is not None:
+                stats.add(scanned, spent)
+
+    def _snippet(self, sec: _Section, start: int, end: int) -> str:
+        """make_snippet(norm, start, end) と同じ文字列をバイト位置から作る。"""
+        w = _SNIPPET_WIDTH
+        # UTF-8 は 1 文字最大 4 バイトなので、前後 (w+1)*4 バイトあれば w+1 文字以上を含む
+        lo = max(sec.start, start - (w + 1) * 4)
+        hi = min(sec.end, end + (w + 1) * 4)
+        pre = bytes(self.buf[lo:start]).decode("utf-8", errors="ignore")
+        mid = bytes(self.buf[start:end]).decode("utf-8")
+        post = bytes(self.buf[end:hi]).decode("utf-8", errors="ignore")
+        prefix = "…" if len(pre) > w else ""
+        suffix = "…" if len(post) > w else ""
+        return prefix + (pre[-w:] + mid + post[:w]).strip() + suffix
+
+
+class CorpusStore:
+    """
+    マニュアルごとの CorpusFile。作成は CLI（python -m app.cli compile-corpus）で行い、
+    サーバーは読むだけ。章ファイルの指紋が一致しない（古い）コーパスは使わない。
+    """
+
+    def __init__(self, repo: "ManualRepository", indices_dir: Path):
+        self.repo = repo
+        self.indices_dir = indices_dir
+        self._lock = threading.Lock()
+        self._files: Dict[str, Optional[CorpusFile]] = {}
+        self._versions: Dict[str, int] = {}
+
+    def compile(self, manual: str) -> CorpusFile:
+        corpus = CorpusFile.compile(self.repo, manual, self.indices_dir / manual)
+        with self._lock:
+            self._versions.pop(manual, None)
+        return corpus
+
+    def get(self, manual: str) -> Optional[CorpusFile]:
+        version = self.repo.manual_version(manual)
+        if self._versions.get(manual) == version:
+            return self._files.get(manual)
+        with self._lock:
+            if self._versions.get(manual) == version:
+                return self._files.get(manual)
+            corpus = CorpusFile.load(self.indices_dir / manual)
+            if corpus is not None and corpus.signature != self.repo.section_signature(manual):
+                log.info(f"corpus is stale; scanning sections instead: manual={manual}")
+                corpus = None
+            self._files[manual] = corpus
+            self._versions[manual] = version
+            return corpus
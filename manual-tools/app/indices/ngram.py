@@ -0,0 +1,371 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+
+from app.core.text import fold_case, strip_separators
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.repositories.manual import ManualRepository
+
+log = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 1
+_NGRAM_SIZES = (2, 3)
+
+# (section_id, file, fingerprint) の並び。ToC 順。
+Signature = List[Tuple[str, str, Optional[Tuple[int, int, int]]]]
+
+
+def index_key(text: str) -> str:
+    """索引・クエリ共通の前処理（大文字小文字の畳み込み＋区切り除去）。"""
+    return strip_separators(fold_case(text))
+
+
+def ngrams(s: str, n: int) -> Set[str]:
+    return {s[i:i + n] for i in range(len(s) - n + 1)}
+
+
+@dataclass
+class _Segment:
+    """転置索引の 1 区画。postings の値は section_ids の添字（章番号）。作成後は変更しない。"""
+    section_ids: List[str]
+    postings: Dict[str, List[int]]
+
+    @classmethod
+    def build(cls, section_ids: List[str], texts: Iterable[Tuple[int, str]]) -> "_Segment":
+        postings: Dict[str, List[int]] = {}
+        for ordinal, norm in texts:
+            key = index_key(norm)
+            grams: Set[str] = set()
+            for n in _NGRAM_SIZES:
+                grams |= ngrams(key, n)
+            for g in grams:
+                postings.setdefault(g, []).append(ordinal)
+        return cls(section_ids=section_ids, postings=postings)
+
+
+@dataclass
+class NgramIndex:
+    """
+    1 マニュアル分の文字 n-gram（2-gram / 3-gram）転置索引。
+
+    索引対象は NFKC 正規化済み本文を index_key() で畳み込んだ文字列。
+    クエリの n-gram をすべて含む章だけを候補として返すので、
+    候補は常に「実際にマッチする章」の上位集合になる。
+
+    segments[0] が保存済みの基底、以降は変更・追加された章だけを索引した差分。
+    live は章 ID → (区画番号, 章番号) で、各章の最新の索引がどこにあるかを示す
+    （古い区画に残った同じ章の postings は照会時に読み飛ばす）。
+    インスタンスは作成後に変更せず、差分の追加・併合は新しいインスタンスを返す。
+    """
+    manual: str
+    signature: Signature  # 索引に入っている内容の (section_id, file, 指紋)
+    segments: List[_Segment] = field(default_factory=list)
+    live: Dict[str, Tuple[int, int]] = field(default_factory=dict)
+    version: int = -1  # 対応する ManualRepository.manual_version()
+
+    @property
+    def section_ids(self) -> List[str]:
+        return [sid for sid, _, _ in self.signature]
+
+    @property
+    def delta_sections(self) -> int:
+        """差分区画にある章の数（0 なら併合不要）。"""
+        return sum(1 for seg, _ in self.live.values() if seg > 0)
+
+    @classmethod
+    def build(cls, manual: str, signature: Signature, texts: Iterable[Tuple[int, str]]) -> "NgramIndex":
+        """全章から基底だけの索引を作る。texts は (signature 上の位置, 正規化済み本文)。"""
+        base = _Segment.build([sid for sid, _, _ in signature], texts)
+        live = {sid: (0, i) for i, (sid, _, fp) in enumerate(signature) if fp is not None}
+        return cls(manual=manual, signature=signature, segments=[base], live=live)
+
+    def changed_sections(self, signature: Signature) -> List[str]:
+        """signature の章のうち、索引の内容と (file, 指紋) が違う（または未索引の）もの。"""
+        indexed = {sid: (f, fp) for sid, f, fp in self.signature}
+        return [sid for sid, f, fp in signature if fp is not None and indexed.get(sid) != (f, fp)]
+
+    def with_delta(self, signature: Signature, texts: Iterable[Tuple[str, str]]) -> "NgramIndex":
+        """
+        texts（(section_id, 正規化済み本文)）を差分区画として加えた索引を返す。
+        signature に無い章・ファイルが無い章は live から外す。
+        """
+        texts = list(texts)
+        seg_no = len(self.segments)
+        delta = _Segment.build([sid for sid, _ in texts], ((i, norm) for i, (_, norm) in enumerate(texts)))
+        present = {sid for sid, _, fp in signature if fp is not None}
+        live = {sid: loc for sid, loc in self.live.items() if sid in present}
+        for i, (sid, _) in enumerate(texts):
+            live[sid] = (seg_no, i)
+        return NgramIndex(manual=self.manual, signature=signature,
+                          segments=self.segments + [delta], live=live, version=self.version)
+
+    def compacted(self) -> "NgramIndex":
+        """
+        全区画を 1 つの基底に併合した索引を返す（本文は読み直さない）。
+        章番号は signature 上の位置に振り直し、古い区画に残った postings は捨てる。
+        """
+        ordinals = {sid: i for i, (sid, _, _) in enumerate(self.signature)}
+        postings: Dict[str, List[int]] = {}
+        for seg_no, seg in enumerate(self.segments):
+            ids = seg.section_ids
+            live = self.live
+            for g, lst in seg.postings.items():
+                out = [ordinals[ids[i]] for i in lst if live.get(ids[i]) == (seg_no, i)]
+                if out:
+                    postings.setdefault(g, []).extend(out)
+        for lst in postings.values():
+            lst.sort()
+        base = _Segment(section_ids=self.section_ids, postings=postings)
+        live = {sid: (0, ordinals[sid]) for sid in self.live}
+        return NgramIndex(manual=self.manual, signature=self.signature,
+                          segments=[base], live=live, version=self.version)
+
+    def _resolve(self, seg_no: int, ordinals: Iterable[int]) -> Iterator[str]:
+        """区画内の章番号を章 ID にする。その章の最新の索引でないものは飛ばす。"""
+        ids = self.segments[seg_no].section_ids
+        live = self.live
+        for i in ordinals:
+            if live.get(ids[i]) == (seg_no, i):
+                yield ids[i]
+
+    def candidates(self, key: str) -> Optional[Set[str]]:
+        """
+        key（index_key 済みクエリ）を含み得る章 ID の集合。
+        n-gram が取れない短いクエリでは絞り込めないので None を返す。
+        """
+        n = max(_NGRAM_SIZES) if len(key) >= max(_NGRAM_SIZES) else min(_NGRAM_SIZES)
+        grams = ngrams(key, n)
+        if not grams:
+            return None
+        result: Set[str] = set()
+        for seg_no, seg in enumerate(self.segments):
+            lists = sorted((seg.postings.get(g, []) for g in grams), key=len)
+            hit = set(lists[0])
+            for lst in lists[1:]:
+                if not hit:
+                    break
+                hit.intersection_update(lst)
+            result.update(self._resolve(seg_no, hit))
+        return result
+
+    def fuzzy_candidates(self, key: str, max_distance: int) -> Optional[Set[str]]:
+        """
+        key（index_key 済みクエリ）との編集距離が max_distance 以内の部分文字列を含み得る章 ID の集合。
+
+        1 回の編集で壊れる 2-gram は高々 2 個なので、key の 2-gram（異なり数 D）のうち
+        D - 2 * max_distance 個以上を含む章だけが候補になる（q-gram 補題）。
+        大文字小文字の畳み込みと区切りの除去は編集距離を増やさないので、索引上で数えてよい。
+        閾値が 0 以下なら絞り込めないので None。
+        """
+        grams = ngrams(key, 2)
+        need = len(grams) - 2 * max_distance
+        if need <= 0:
+            return None
+        result: Set[str] = set()
+        for seg_no, seg in enumerate(self.segments):
+            counts: Dict[int, int] = {}
+            for g in grams:
+                for i in seg.postings.get(g, ()):
+                    counts[i] = counts.get(i, 0) + 1
+            result.update(self._resolve(seg_no, (i for i, c in counts.items() if c >= need)))
+        return result
+
+    # -------- Persistence
+    def save(self, path: Path) -> None:
+        """基底だけの索引を書き出す（一時ファイル → rename）。差分があれば compacted() してから呼ぶ。"""
+        assert len(self.segments) == 1, "compact the index before saving"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "format": _FORMAT_VERSION,
+            "manual": self.manual,
+            "sections": [[sid, f, list(fp) if fp else None] for sid, f, fp in self.signature],
+            "postings": self.segments[0].postings,
+        }
+        # 複数ワーカー・併合スレッドが同時に書いても混ざらないよう、一時ファイル名は書き手ごとに分ける
+        tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, path)
+        finally:
+            tmp.unlink(missing_ok=True)
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["NgramIndex"]:
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("format") != _FORMAT_VERSION:
+            return None
+        signature: Signature = [
+            (sid, f, tuple(fp) if fp else None) for sid, f, fp in data["sections"]
+        ]
+        base = _Segment(section_ids=[sid for sid, _, _ in signature], postings=data["postings"])
+        live = {sid: (0, i) for i, (sid, _, fp) in enumerate(signature) if fp is not None}
+        return cls(manual=data["manual"], signature=signature, segments=[base], live=live)
+
+
+class NgramIndexStore:
+    """
+    マニュアルごとの NgramIndex を indices_dir に永続化し、章ファイルの変更に追従させる。
+
+    鮮度は ManualRepository.manual_version() で判定し、バージョンが進んだときだけ
+    章ごとの指紋（signature）を突き合わせる。変わった・増えた章だけを読み直して差分区画にし
+    （次の照会から見える）、バックグラウンドの併合スレッドが compact_delay 秒後に
+    基底へ併合して書き出す。変わった章が多いときは全体を作り直す。
+    """
+
+    def __init__(self, repo: "ManualRepository", indices_dir: Path,
+                 compact_delay: float = 5.0, rebuild_ratio: float = 0.5):
+        self.repo = repo
+        self.indices_dir = indices_dir
+        self.compact_delay = compact_delay
+        self.rebuild_ratio = rebuild_ratio
+        self._lock = threading.Lock()
+        self._indices: Dict[str, NgramIndex] = {}
+        self._build_locks: Dict[str, threading.Lock] = {}
+        # 併合待ちのマニュアル → 最後に差分を加えた時刻
+        self._pending: Dict[str, float] = {}
+        self._wake = threading.Condition(self._lock)
+        self._closing = False
+        self._compactor: Optional[threading.Thread] = None
+
+    def _path(self, manual: str) -> Path:
+        return self.indices_dir / manual / "ngram.json"
+
+    def _build_lock(self, manual: str) -> threading.Lock:
+        with self._lock:
+            lock = self._build_locks.get(manual)
+            if lock is None:
+                lock = self._build_locks[manual] = threading.Lock()
+            return lock
+
+    def get(self, manual: str) -> NgramIndex:
+        version = self.repo.manual_version(manual)
+        idx = self._indices.get(manual)
+        if idx is not None and idx.version == version:
+            return idx
+
+        with self._build_lock(manual):
+            idx = self._indices.get(manual)
+            if idx is not None and idx.version == version:
+                return idx
+
+            signature = self.repo.section_signature(manual)
+            if idx is None:
+                idx = NgramIndex.load(self._path(manual))
+            if idx is None:
+                idx = self._build(manual, signature)
+            elif idx.signature != signature:
+                idx = self._update(manual, idx, signature)
+            idx.version = version
+            with self._lock:
+                self._indices[manual] = idx
+            return idx
+
+    def _build(self, manual: str, signature: Signature) -> NgramIndex:
+        ordinals = {sid: i for i, (sid, _, fp) in enumerate(signature) if fp is not None}
+        texts = (
+            (ordinals[st.section_id], st.norm)
+            for st in self.repo.iter_sections(manual)
+            if st.section_id in ordinals
+        )
+        idx = NgramIndex.build(manual, signature, texts)
+        self._save(idx)
+        log.info(f"built ngram index: manual={manual} sections={len(signature)} grams={len(idx.segments[0].postings)}")
+        return idx
+
+    def _update(self, manual: str, idx: NgramIndex, signature: Signature) -> NgramIndex:
+        """変わった章だけを差分区画に索引する（多ければ全体を作り直す）。"""
+        changed = idx.changed_sections(signature)
+        if len(changed) + idx.delta_sections > self.rebuild_ratio * max(1, len(signature)):
+            return self._build(manual, signature)
+        wanted = set(changed)
+        texts = [(st.section_id, st.norm) for st in self.repo.iter_sections(manual, wanted)]
+        idx = idx.with_delta(signature, texts)
+        log.info(
+            f"ngram index delta: manual={manual} changed={len(changed)} "
+            f"segments={len(idx.segments)} delta_sections={idx.delta_sections}"
+        )
+        self._schedule(manual)
+        return idx
+
+    def _save(self, idx: NgramIndex) -> None:
+        try:
+            idx.save(self._path(idx.manual))
+        except OSError as e:
+            log.warning(f"failed to save ngram index: manual={idx.manual}: {e}")
+
+    # -------- Background compaction
+    def _schedule(self, manual: str) -> None:
+        with self._wake:
+            if self._closing:
+                return
+            self._pending[manual] = time.monotonic()
+            if self._compactor is None or not self._compactor.is_alive():
+                self._compactor = threading.Thread(target=self._run_compactor, name="ngram-compactor", daemon=True)
+                self._compactor.start()
+            self._wake.notify()
+
+    def _run_compactor(self) -> None:
+        """差分が compact_delay 秒続けて増えなかったマニュアルから順に併合する。"""
+        while True:
+            with self._wake:
+                while not self._closing:
+                    now = time.monotonic()
+                    due = [m for m, t in self._pending.items() if now - t >= self.compact_delay]
+                    if due:
+                        break
+                    timeout = min(self._pending.values()) + self.compact_delay - now if self._pending else None
+                    self._wake.wait(timeout)
+                if self._closing:
+                    return
+                for m in due:
+                    self._pending.pop(m, None)
+            for m in due:
+                try:
+                    self.compact(m)
+                except Exception as e:  # 併合に失敗しても差分のまま照会はできる
+                    log.error(f"failed to compact ngram index: manual={m}: {e}")
+
+    def compact(self, manual: str) -> bool:
+        """差分区画を基底に併合して書き出す。併合した（または不要だった）なら True。"""
+        idx = self._indices.get(manual)
+        if idx is None or len(idx.segments) == 1:
+            return True
+        started = time.perf_counter()
+        merged = idx.compacted()
+        self._save(merged)
+        with self._lock:
+            # 併合中に新しい差分が入っていたら差し替えない（そちらの併合は次回）
+            if self._indices.get(manual) is not idx:
+                return False
+            self._indices[manual] = merged
+        log.info(
+            f"compacted ngram index: manual={manual} segments={len(idx.segments)} "
+            f"elapsed={time.perf_counter() - started:.3f}s"
+        )
+        return True
+
+    def close(self) -> None:
+        with self._wake:
+            self._closing = True
+            self._wake.notify()
+        thread = self._compactor
+        if thread is not None:
+            thread.join(timeout=5)
+
+    def candidates(self, manual: str, key: str) -> Optional[Set[str]]:
+        return self.get(manual).candidates(key)
+
+    def fuzzy_candidates(self, manual: str, key: str, max_distance: int) -> Optional[Set[str]]:
+        return self.get(manual).fuzzy_candidates(key, max_distance)
@@ -0,0 +1,219 @@
+from __future__ import annotations
+import logging
+import re
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import TYPE_CHECKING, Dict, List, Optional, Pattern, Sequence, Tuple
+
+from app.core.text import normalize_text
+from app.core.watcher import Fingerprint
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.repositories.cache import SectionText
+    from app.repositories.manual import ManualRepository
+
+log = logging.getLogger(__name__)
+
+Node = Tuple[str, str]  # (manual, section_id)
+
+# 「第2章」「第2章-1」「別表1」（正規化済みテキスト上で照合するので数字・ハイフンは半角）
+_REF_CORE = r"(?:第\s*(?P<n>\d+)\s*章(?:\s*-\s*(?P<s>\d+))?|別表\s*(?P<t>\d+))"
+
+
+@lru_cache(maxsize=8)
+def reference_pattern(manuals: Tuple[str, ...]) -> Pattern[str]:
+    """
+    参照表現の正規表現。直前にマニュアル名（「運用仕様編」の / 運用仕様編 など）が
+    あれば manual グループに入る。マニュアル名は長いものから試す。
+    """
+    names = "|".join(re.escape(normalize_text(m)) for m in sorted(manuals, key=len, reverse=True))
+    prefix = rf"(?:「?(?P<manual>{names})」?\s*(?:の\s*)?)?" if names else ""
+    return re.compile(prefix + _REF_CORE)
+
+
+@lru_cache(maxsize=8)
+def _by_norm(manuals: Tuple[str, ...]) -> Dict[str, str]:
+    """正規化したマニュアル名 → マニュアル名。"""
+    return {normalize_text(m): m for m in manuals}
+
+
+def reference_key(m: "re.Match[str]") -> str:
+    """ToC の参照キー（"2-1" / "3" / "別表1"）。ManualRepository の num_to_id と同じ形式。"""
+    if m.group("t"):
+        return f"別表{int(m.group('t'))}"
+    n = str(int(m.group("n")))
+    return f"{n}-{int(m.group('s'))}" if m.group("s") else n
+
+
+@dataclass(frozen=True)
+class RawRef:
+    """章本文から抜き出した未解決の参照。"""
+    manual: Optional[str]  # 明示された参照先マニュアル（None なら同じマニュアル）
+    key: str
+    text: str
+    line: int  # 1 始まり
+
+
+@dataclass
+class _SectionRefs:
+    fp: Fingerprint
+    refs: List[RawRef]
+
+
+@dataclass
+class RefEdge:
+    """source 章から target 章への参照（同じ組の参照は 1 本にまとめ、最初の出現を持つ）。"""
+    source: Node
+    target: Node
+    text: str
+    line: int
+    count: int = 1
+
+
+@dataclass
+class ReferenceGraph:
+    versions: Tuple[Tuple[str, int], ...]
+    outgoing: Dict[Node, List[RefEdge]] = field(default_factory=dict)
+    incoming: Dict[Node, List[RefEdge]] = field(default_factory=dict)
+    unresolved: int = 0
+
+    def walk(self, node: Node, direction: str, depth: int) -> List[Tuple[int, RefEdge]]:
+        """
+        node から direction（"out" / "in"）に depth 段までたどった辺を (段数, 辺) で返す。
+        各章は 1 度だけ展開するので、循環があっても辺は重複しない。
+        """
+        adj = self.outgoing if direction == "out" else self.incoming
+        seen = {node}
+        frontier = [node]
+        result: List[Tuple[int, RefEdge]] = []
+        for d in range(1, depth + 1):
+            nxt: List[Node] = []
+            for n in frontier:
+                for e in adj.get(n, ()):
+                    result.append((d, e))
+                    other = e.target if direction == "out" else e.source
+                    if other not in seen:
+                        seen.add(other)
+                        nxt.append(other)
+            if not nxt:
+                break
+            frontier = nxt
+        return result
+
+
+class ReferenceGraphStore:
+    """
+    全マニュアルの章間参照グラフ（章 → 参照先の章）。
+
+    章ごとの抽出結果はファイル指紋つきで保持し、いずれかのマニュアルのバージョンが
+    進んだときは指紋が変わった章だけ抽出し直してから、全体を解決し直す
+    （参照先の ToC が変われば解決結果も変わるため、解決は毎回全体で行う）。
+    """
+
+    def __init__(self, repo: "ManualRepository"):
+        self.repo = repo
+        self._lock = threading.Lock()
+        self._graph: Optional[ReferenceGraph] = None
+        self._extracted: Dict[Node, _SectionRefs] = {}
+
+    def get(self) -> ReferenceGraph:
+        manuals = self.repo.list_manuals()
+        versions = tuple((m, self.repo.manual_version(m)) for m in manuals)
+        graph = self._graph
+        if graph is not None and graph.versions == versions:
+            return graph
+
+        with self._lock:
+            graph = self._graph
+            if graph is not None and graph.versions == versions:
+                return graph
+            graph = self._build(manuals, versions)
+            self._graph = graph
+            return graph
+
+    def _build(self, manuals: List[str], versions: Tuple[Tuple[str, int], ...]) -> ReferenceGraph:
+        pattern = reference_pattern(tuple(manuals))
+        by_norm = _by_norm(tuple(manuals))
+        graph = ReferenceGraph(versions=versions)
+        extracted: Dict[Node, _SectionRefs] = {}
+        reextracted = 0
+        for manual in manuals:
+            try:
+                sections = list(self.repo.iter_sections(manual))
+            except Exception as e:
+                # relaxed: 読めないマニュアルはグラフに含めない
+                log.error(f"skipped manual in reference graph: {manual}: {e}")
+                continue
+            for st in sections:
+                node = (manual, st.section_id)
+                refs = self._extracted.get(node)
+                if refs is None or refs.fp != st.fp:
+                    refs = _SectionRefs(fp=st.fp, refs=self._extract(st, pattern, by_norm))
+                    reextracted += 1
+                extracted[node] = refs
+                graph.unresolved += self._link(graph, node, refs.refs)
+        self._extracted = extracted
+        edges = sum(len(v) for v in graph.outgoing.values())
+        log.info(f"reference graph built: sections={len(extracted)} edges={edges} "
+                 f"unresolved={graph.unresolved} reextracted={reextracted}")
+        return graph
+
+    @staticmethod
+    def _extract(st: "SectionText", pattern: Pattern[str], by_norm: Dict[str, str]) -> List[RawRef]:
+        refs: List[RawRef] = []
+        for m in pattern.finditer(st.norm):
+            named = m.group("manual") if "manual" in pattern.groupindex else None
+            refs.append(RawRef(
+                manual=by_norm.get(named) if named else None,
+                key=reference_key(m),
+                text=m.group(0),
+                line=st.line_of(m.start()),
+            ))
+        return refs
+
+    def _link(self, graph: ReferenceGraph, source: Node, refs: Sequence[RawRef]) -> int:
+        """参照を解決して辺を張る。解決できなかった参照の数を返す。"""
+        unresolved = 0
+        edges: Dict[Node, RefEdge] = {}
+        for r in refs:
+            target = self.resolve_key(r.manual or source[0], r.key)
+            if target is None:
+                unresolved += 1
+                continue
+            if target == source:  # 自章への言及は辺にしない
+                continue
+            e = edges.get(target)
+            if e is None:
+                edges[target] = RefEdge(source=source, target=target, text=r.text, line=r.line)
+            else:
+                e.count += 1
+        if edges:
+            graph.outgoing[source] = list(edges.values())
+            for e in edges.values():
+                graph.incoming.setdefault(e.target, []).append(e)
+        return unresolved
+
+    def resolve_key(self, manual: str, key: str) -> Optional[Node]:
+        try:
+            sid = self.repo.reference_target(manual, key)
+        except Exception:
+            return None
+        return (manual, sid) if sid else None
+
+    def resolve(self, manual: str, ref_text: str, manuals: Optional[Sequence[str]] = None) -> Optional[Node]:
+        """
+        ref_text 中の最初の参照表現を (manual, section_id) に解決する。
+        manuals は参照先として認めるマニュアル名（省略時は list_manuals()）。まとめて解決する
+        呼び出し側は 1 回だけ列挙して渡す。空にするとマニュアル名を見ずに manual 内で解決する。
+        """
+        if manuals is None:
+            manuals = self.repo.list_manuals()
+        names = tuple(manuals)
+        pattern = reference_pattern(names)
+        m = pattern.search(normalize_text(ref_text))
+        if not m:
+            return None
+        named = m.group("manual") if "manual" in pattern.groupindex else None
+        target_manual = _by_norm(names).get(named) if named else None
+        return self.resolve_key(target_manual or manual, reference_key(m))
@@ -0,0 +1,271 @@
+from __future__ import annotations
+import importlib
+import json
+import logging
+import math
+import os
+import threading
+import zlib
+from collections import Counter
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Protocol, Sequence, Tuple
+
+try:  # ベクトル検索を使う場合のみ必要
+    import numpy as np
+except ModuleNotFoundError:  # pragma: no cover - only hit in missing dependency envs
+    np = None  # type: ignore[assignment]
+
+from app.indices.chunks import make_chunk_id
+from app.indices.ngram import Signature, index_key
+
+if TYPE_CHECKING:  # pragma: no cover
+    from app.core.config import VectorConfig
+    from app.repositories.manual import ManualRepository
+
+log = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 1
+
+
+class VectorSearchUnavailable(Exception): ...
+
+
+def _require_numpy() -> None:
+    if np is None:
+        raise VectorSearchUnavailable(
+            "numpy is not installed. Activate your virtualenv and run "
+            "`pip install -r requirements.txt` to use vector search."
+        )
+
+
+class Embedder(Protocol):
+    """
+    埋め込みの差し替え口。
+
+    - name / dim: 索引ファイルに記録し、変わったら作り直す
+    - use_idf: True なら索引側でコーパスの IDF を掛けてから L2 正規化する
+    - embed: テキスト列を (len(texts), dim) の float32 行列にする
+    """
+    name: str
+    dim: int
+    use_idf: bool
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray": ...
+
+
+class HashedNgramEmbedder:
+    """
+    ネットワークも GPU も不要な既定の埋め込み。
+
+    index_key() 済みテキストの文字 2-gram / 3-gram を crc32 で dim 次元に
+    符号付きハッシュし、サブリニア TF（1 + log tf）を値とする。IDF は索引側で掛ける。
+    """
+
+    use_idf = True
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+        self.name = f"hashed_ngram:{dim}"
+
+    def embed(self, texts: Sequence[str]) -> "np.ndarray":
+        _require_numpy()
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            key = index_key(text)
+            counts = Counter(key[i:i + 2] for i in range(len(key) - 1))
+            counts.update(key[i:i + 3] for i in range(len(key) - 2))
+            for gram, tf in counts.items():
+                h = zlib.crc32(gram.encode("utf-8"))
+                sign = 1.0 if h & 0x80000000 else -1.0
+                out[row, h % self.dim] += sign * (1.0 + math.log(tf))
+        return out
+
+
+def load_embedder(cfg: "VectorConfig") -> Embedder:
+    """config の vectors.embedder から埋め込みを作る。"module:attr" 形式なら外部実装を読み込む。"""
+    if cfg.embedder == "hashed_ngram":
+        return HashedNgramEmbedder(cfg.dim)
+    module_name, _, attr = cfg.embedder.partition(":")
+    factory = getattr(importlib.import_module(module_name), attr)
+    return factory()
+
+
+@dataclass
+class VectorIndex:
+    """1 マニュアル分のチャンク埋め込み。matrix は indices_dir の .npy を mmap したもの。"""
+    manual: str
+    embedder_name: str
+    signature: Signature
+    chunk_ids: List[str]
+    matrix: "np.ndarray"           # (n_chunks, dim) float32、行は L2 正規化済み
+    idf: Optional["np.ndarray"]    # (dim,) float32。use_idf=False の埋め込みでは None
+    chunk_max_chars: int = 0       # チャンク分割の設定が変わったら作り直す
+    version: int = -1
+    _rows: Optional[Dict[str, int]] = None
+
+    def row_of(self, chunk_id: str) -> Optional[int]:
+        if self._rows is None:
+            self._rows = {cid: i for i, cid in enumerate(self.chunk_ids)}
+        return self._rows.get(chunk_id)
+
+    def encode_query(self, embedder: Embedder, query: str) -> "np.ndarray":
+        q = embedder.embed([query])[0]
+        if self.idf is not None:
+            q = q * self.idf
+        norm = float(np.linalg.norm(q))
+        return q / norm if norm > 0 else q
+
+    def top_k(self, q: "np.ndarray", k: int) -> List[Tuple[int, float]]:
+        """コサイン類似度の上位 k 件を (行番号, スコア) で返す。"""
+        n = self.matrix.shape[0]
+        if n == 0 or k <= 0:
+            return []
+        scores = self.matrix @ q
+        if k < n:
+            idx = np.argpartition(-scores, k - 1)[:k]
+        else:
+            idx = np.arange(n)
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return [(int(i), float(scores[i])) for i in idx]
+
+    # -------- Persistence
+    @staticmethod
+    def _paths(base: Path) -> Tuple[Path, Path, Path]:
+        return base / "vectors.json", base / "vectors.npy", base / "vectors_idf.npy"
+
+    def save(self, base: Path) -> None:
+        base.mkdir(parents=True, exist_ok=True)
+        meta_path, mat_path, idf_path = self._paths(base)
+        for path, arr in ((mat_path, self.matrix), (idf_path, self.idf)):
+            if arr is None:
+                continue
+            tmp = path.with_name(path.name + ".tmp")
+            with open(tmp, "wb") as f:
+                np.save(f, np.ascontiguousarray(arr, dtype=np.float32))
+            os.replace(tmp, path)
+        meta = {
+            "format": _FORMAT_VERSION,
+            "manual": self.manual,
+            "embedder": self.embedder_name,
+            "use_idf": self.idf is not None,
+            "chunk_max_chars": self.chunk_max_chars,
+            "sections": [[sid, f, list(fp) if fp else None] for sid, f, fp in self.signature],
+            "chunk_ids": self.chunk_ids,
+        }
+        tmp = meta_path.with_name(meta_path.name + ".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp, meta_path)
+
+    @classmethod
+    def load(cls, base: Path) -> Optional["VectorIndex"]:
+        meta_path, mat_path, idf_path = cls._paths(base)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get("format") != _FORMAT_VERSION:
+                return None
+            matrix = np.load(mat_path, mmap_mode="r")
+            idf = np.load(idf_path) if meta.get("use_idf") else None
+        except (OSError, ValueError):
+            return None
+        if matrix.shape[0] != len(meta["chunk_ids"]):
+            return None
+        signature: Signature = [
+            (sid, f, tuple(fp) if fp else None) for sid, f, fp in meta["sections"]
+        ]
+        return cls(
+            manual=meta["manual"],
+            embedder_name=meta["embedder"],
+            signature=signature,
+            chunk_ids=meta["chunk_ids"],
+            matrix=matrix,
+            idf=idf,
+            chunk_max_chars=meta.get("chunk_max_chars", 0),
+        )
+
+
+class VectorStore:
+    """
+    マニュアルごとの VectorIndex を indices_dir に保存し、mmap で読み込む。
+    鮮度判定は NgramIndexStore と同じく manual_version() → 章の指紋の順。
+    """
+
+    def __init__(self, repo: "ManualRepository", indices_dir: Path, cfg: "VectorConfig"):
+        self.repo = repo
+        self.indices_dir = indices_dir
+        self.cfg = cfg
+        self._embedder: Optional[Embedder] = None
+        self._lock = threading.Lock()
+        self._indices: Dict[str, VectorIndex] = {}
+
+    @property
+    def embedder(self) -> Embedder:
+        if self._embedder is None:
+            self._embedder = load_embedder(self.cfg)
+        return self._embedder
+
+    def get(self, manual: str) -> VectorIndex:
+        _require_numpy()
+        version = self.repo.manual_version(manual)
+        idx = self._indices.get(manual)
+        if idx is not None and idx.version == version:
+            return idx
+
+        with self._lock:
+            idx = self._indices.get(manual)
+            if idx is not None and idx.version == version:
+                return idx
+            signature = self.repo.section_signature(manual)
+            if idx is None:
+                idx = VectorIndex.load(self.indices_dir / manual)
+            if (
+                idx is None
+                or idx.signature != signature
+                or idx.embedder_name != self.embedder.name
+                or idx.chunk_max_chars != self.repo.settings.chunks.max_chars
+            ):
+                idx = self._build(manual, signature)
+            idx.version = version
+            self._indices[manual] = idx
+            return idx
+
+    def _build(self, manual: str, signature: Signature) -> VectorIndex:
+        embedder = self.embedder
+        chunk_ids: List[str] = []
+        texts: List[str] = []
+        for st in self.repo.iter_sections(manual):
+            for no, (s, e) in enumerate(zip(st.chunk_starts, st.chunk_ends), start=1):
+                chunk_ids.append(make_chunk_id(st.section_id, no))
+                texts.append(st.norm[s:e])
+
+        matrix = embedder.embed(texts) if texts else np.zeros((0, embedder.dim), dtype=np.float32)
+        idf = None
+        if embedder.use_idf:
+            df = np.count_nonzero(matrix, axis=0).astype(np.float32)
+            idf = (np.log((1.0 + len(texts)) / (1.0 + df)) + 1.0).astype(np.float32)
+            matrix *= idf
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        matrix /= norms
+
+        idx = VectorIndex(
+            manual=manual,
+            embedder_name=embedder.name,
+            signature=signature,
+            chunk_ids=chunk_ids,
+            matrix=matrix,
+            idf=idf,
+            chunk_max_chars=self.repo.settings.chunks.max_chars,
+        )
+        base = self.indices_dir / manual
+        try:
+            idx.save(base)
+            loaded = VectorIndex.load(base)  # 以後は mmap 版を使う（ワーカー間でページを共有できる）
+            if loaded is not None:
+                idx = loaded
+        except OSError as e:
+            log.warning(f"failed to save vector index: manual={manual}: {e}")
+        log.info(f"built vector index: manual={manual} chunks={len(chunk_ids)} embedder={embedder.name}")
+        return idx
@@ -1,14 +1,27 @@
 from __future__ import annotations
 import logging
-from fastapi import FastAPI
+from typing import List
+
+from fastapi import FastAPI, Response
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.config import load_settings
+from app.core.metrics import REGISTRY, Counter, MetricsMiddleware, cache_metrics
+from app.core.profiling import ProfiledRoute, ProfilingMiddleware
+from app.deps import RepoLeaseMiddleware, get_settings, get_repo, reload_settings
 from app.repositories.manual import ManualRepository
 from app.routers.manuals import router as manuals_router
 
+def _repo_metrics(repo: ManualRepository) -> List:
+    """リポジトリが持つカウンタ（キャッシュ統計など）を出力時点の値でメトリクスにする。"""
+    metrics = cache_metrics("section_cache", repo.sections.stats(), "Section text cache")
+    metrics += cache_metrics("response_cache", repo.responses.stats(), "Serialized response cache")
+    metrics += cache_metrics("search_result_cache", repo.results.stats(), "Search result cache")
+    timeouts = Counter("regex_timeouts_total", "Regex searches cut off by search.regex_timeout.")
+    timeouts.inc(amount=repo.regex_sandbox.timeouts)
+    return metrics + [timeouts]
+
 def create_app() -> FastAPI:
-    settings = load_settings()
+    settings = get_settings()
 
     logging.basicConfig(
         level=getattr(logging, settings.logging.level.upper(), logging.INFO),
@@ -16,6 +29,10 @@ def create_app() -> FastAPI:
     )
 
     app = FastAPI(title="manual-tools", version="0.1.0")
+    # エンドポイント関数の終了時刻を記録する（遅いリクエストのログ・プロファイル用）
+    app.router.route_class = ProfiledRoute
+    # reload_config の前に始まったリクエストは、送信完了まで古いリポジトリを使う
+    app.add_middleware(RepoLeaseMiddleware)
 
     app.add_middleware(
         CORSMiddleware,
@@ -23,6 +40,12 @@ def create_app() -> FastAPI:
         allow_methods=["*"],
         allow_headers=["*"],
     )
+    prof = settings.profiling
+    if prof.enabled or prof.routes or prof.slow_request_ms > 0:
+        app.add_middleware(ProfilingMiddleware, cfg=prof, routes=lambda: {r.path for r in app.routes})
+    if settings.http.metrics:
+        # 最も外側で計測する（CORS の処理やストリーミングの送信も含める）
+        app.add_middleware(MetricsMiddleware, routes=lambda: {r.path for r in app.routes})
 
     # ルーター登録（Depends(get_repo) を各エンドポイントで使用）
     app.include_router(manuals_router)
@@ -31,19 +54,42 @@ def create_app() -> FastAPI:
     def healthz():
         return {"ok": True}
 
-    # 起動時：relaxed 検証（致命的例外のみ停止）
+    # キャッシュのヒット率など（運用時のサイジング用）
+    @app.get("/cache_stats")
+    def cache_stats():
+        repo = get_repo()
+        return {
+            "sections": repo.sections.stats(),
+            "responses": repo.responses.stats(),
+            "search_results": repo.results.stats(),
+        }
+
+    # Prometheus のテキスト形式。キャッシュ統計は現在のリポジトリの値（/reload_config で 0 に戻る）
+    if settings.http.metrics:
+        @app.get("/metrics")
+        def metrics():
+            body = REGISTRY.render(extra=_repo_metrics(get_repo()))
+            return Response(content=body, media_type="text/plain; version=0.0.4; charset=utf-8")
+
+    # config.yaml を読み直し、共有リポジトリ（ToC キャッシュ）を作り直す
+    @app.post("/reload_config")
+    def reload_config():
+        repo = reload_settings()
+        manuals = repo.list_manuals()
+        logging.getLogger(__name__).info(f"reloaded config (manuals={manuals})")
+        return {"ok": True, "manuals": manuals}
+
+    # 起動時：マニュアル一覧だけ確定させ、ToC の読み込み・relaxed 検証はバックグラウンドで行う
     @app.on_event("startup")
     def on_startup():
-        repo = ManualRepository(settings)
+        repo = get_repo()
+        repo.start()
         manuals = repo.list_manuals()
         logging.getLogger(__name__).info(f"Found manuals: {manuals}")
-        for m in manuals:
-            try:
-                _ = repo.load_toc(m)
-                logging.getLogger(__name__).info(f"validated(manual={m})")
-            except Exception as e:
-                logging.getLogger(__name__).exception(f"failed to load toc: {m}: {e}")
-                raise
+
+    @app.on_event("shutdown")
+    def on_shutdown():
+        get_repo().close()
 
     return app
 
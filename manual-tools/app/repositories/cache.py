@@ -0,0 +1,273 @@
+from __future__ import annotations
+import sys
+import threading
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+from app.core.watcher import Fingerprint
+
+
+@dataclass
+class SectionText:
+    """
+    章本文のキャッシュ単位。生テキスト（get_section 用）と正規化済みテキスト（検索用）を持つ。
+
+    読み込み時に正規化済みテキスト上の行頭位置・チャンク境界・例外語を含む行も求めておく。
+    """
+    manual: str
+    section_id: str
+    file: str
+    fp: Fingerprint
+    raw: str
+    norm: str
+    line_starts: array = field(default_factory=lambda: array("I", [0]))
+    chunk_starts: array = field(default_factory=lambda: array("I"))
+    chunk_ends: array = field(default_factory=lambda: array("I"))
+    exc_lines: array = field(default_factory=lambda: array("I"))  # 例外語を含む行（0 始まり、昇順）
+    exc_terms: array = field(default_factory=lambda: array("I"))  # その行で最初に現れる語の番号
+    # 生テキスト上の行頭位置（get_section の範囲指定用）。norm が raw と同一なら line_starts と同じもの
+    raw_line_starts: array = field(default_factory=lambda: array("I", [0]))
+    # loose 検索用の影テキスト（norm から区切り文字を除いて fold_case したもの）と、
+    # 区切りで分かれた区間ごとの影テキスト上・norm 上の開始位置（text.shadow_text 参照）
+    shadow: str = ""
+    shadow_runs: array = field(default_factory=lambda: array("I", [0]))
+    shadow_origins: array = field(default_factory=lambda: array("I", [0]))
+
+    @property
+    def nbytes(self) -> int:
+        size = sys.getsizeof(self.raw) + sys.getsizeof(self.shadow)
+        if self.norm is not self.raw:
+            size += sys.getsizeof(self.norm)
+        for a in (self.line_starts, self.chunk_starts, self.chunk_ends, self.exc_lines, self.exc_terms,
+                  self.shadow_runs, self.shadow_origins):
+            size += sys.getsizeof(a)
+        if self.raw_line_starts is not self.line_starts:
+            size += sys.getsizeof(self.raw_line_starts)
+        return size
+
+    def line_of(self, offset: int) -> int:
+        """正規化済みテキスト上の位置 offset が含まれる行番号（1 始まり）。"""
+        return bisect_right(self.line_starts, offset)
+
+    def line_text(self, i: int) -> str:
+        """正規化済みテキストの i 行目（0 始まり、改行を含まない）。"""
+        start = self.line_starts[i]
+        end = self.line_starts[i + 1] - 1 if i + 1 < len(self.line_starts) else len(self.norm)
+        return self.norm[start:end]
+
+    def raw_line_of(self, offset: int) -> int:
+        """生テキスト上の位置 offset が含まれる行番号（1 始まり）。"""
+        return bisect_right(self.raw_line_starts, offset)
+
+    def from_shadow(self, pos: int) -> int:
+        """影テキスト上の位置 pos の文字の、正規化済みテキスト上の位置。"""
+        i = bisect_right(self.shadow_runs, pos) - 1
+        return self.shadow_origins[i] + pos - self.shadow_runs[i]
+
+    def chunk_of(self, offset: int) -> int:
+        """offset を含むチャンクの章内通し番号（1 始まり）。チャンクが無ければ 0。"""
+        if not self.chunk_starts:
+            return 0
+        return max(1, bisect_right(self.chunk_starts, offset))
+
+
+class SectionCache:
+    """
+    章本文のバイト上限付き LRU キャッシュ。
+
+    キーは (manual, section_id) で、取り出し時にファイル指紋が一致しなければ
+    古い版としてミス扱いにする。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, str], SectionText]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, manual: str, section_id: str, fp: Fingerprint) -> Optional[SectionText]:
+        key = (manual, section_id)
+        with self._lock:
+            st = self._entries.get(key)
+            if st is not None and st.fp == fp:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return st
+            if st is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def put(self, st: SectionText) -> None:
+        size = st.nbytes
+        if size > self.max_bytes:
+            return
+        key = (st.manual, st.section_id)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = st
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                old_key = next(iter(self._entries))
+                self._remove(old_key)
+                self.evictions += 1
+
+    def discard_file(self, manual: str, file: str) -> None:
+        """指定ファイルに対応するエントリを捨てる（監視で変更を検知したとき用）。"""
+        with self._lock:
+            for key in [k for k, v in self._entries.items() if k[0] == manual and v.file == file]:
+                self._remove(key)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+    def _remove(self, key: Tuple[str, str]) -> None:
+        st = self._entries.pop(key)
+        self._bytes -= st.nbytes
+
+
+class BytesCache:
+    """
+    シリアライズ・圧縮済みレスポンス本文のバイト上限付き LRU キャッシュ。
+
+    キーに ETag（＝ファイル指紋から作る版）を含めるので、古い版は参照されなくなって
+    自然に追い出される。明示的な無効化は不要。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        with self._lock:
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        if len(body) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= len(old)
+            self._entries[key] = body
+            self._bytes += len(body)
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
+
+
+class ResultCache:
+    """
+    マニュアル単位の検索結果のバイト上限付き LRU キャッシュ（search_text / find_exceptions 用）。
+
+    キーは (manual, manual_version, 正規化したリクエスト...)。バージョンが進めば古いエントリは
+    参照されなくなるが、ファイル変更の通知で discard_manual() を呼んですぐに捨てる。
+    サイズは呼び出し側の見積もり（スニペット等の合計）で数える。
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[Hashable, ...], Tuple[Any, int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: Tuple[Hashable, ...]) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Tuple[Hashable, ...], value: Any, nbytes: int) -> None:
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[1]
+            self._entries[key] = (value, nbytes)
+            self._bytes += nbytes
+            while self._bytes > self.max_bytes:
+                _, (_, size) = self._entries.popitem(last=False)
+                self._bytes -= size
+                self.evictions += 1
+
+    def discard_manual(self, manual: str) -> None:
+        """manual のエントリをすべて捨てる（監視で変更を検知したとき用）。"""
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == manual]:
+                self._bytes -= self._entries.pop(key)[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
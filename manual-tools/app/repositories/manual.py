@@ -1,36 +1,205 @@
 from __future__ import annotations
-import json, logging, re, hashlib, time
-from dataclasses import dataclass
+import json, logging, re, threading, time
+from concurrent.futures import ThreadPoolExecutor
+from array import array
+from bisect import bisect_right
+from dataclasses import dataclass, field
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Collection, Dict, Iterator, List, Optional, Tuple
 
-from app.schemas.toc import TocFile, TocEntry
+from app.schemas.toc import TocChild, TocFile, TocEntry
 from app.core.config import Settings
+from app.core.http import dump_json
+from app.core.matcher import KeywordMatcher
+from app.core.metrics import DISK_READ_BYTES, TOC_CACHE, TOC_CACHE_EVICTIONS
+from app.core.profiling import phase
+from app.core.sandbox import RegexSandbox
+from app.core.text import normalize_text, shadow_text
 from app.core.validation import validate_toc_relaxed
+from app.core.watcher import FileWatcher, Fingerprint
+from app.repositories.cache import BytesCache, ResultCache, SectionCache, SectionText
+from app.repositories.snapshot import TocSnapshot
+from app.indices.bm25 import Bm25Store
+from app.indices.chunks import ChunkStore, chunk_spans, line_starts
+from app.indices.corpus import CorpusStore
+from app.indices.ngram import NgramIndexStore, Signature
+from app.indices.refs import ReferenceGraphStore, reference_key
+from app.indices.vectors import VectorStore
 
 log = logging.getLogger(__name__)
 
+# ToC タイトル先頭の章番号（"第2章-1 入院" / "別表1 手術一覧"）。キーは reference_key() で作る
+_TITLE_KEY_RE = re.compile(r"^(?:第(?P<n>\d+)章(?:-(?P<s>\d+))?|別表\s*(?P<t>\d+))")
+
 class ManualNotFound(Exception): ...
 class SectionNotFound(Exception): ...
 class TocLoadError(Exception): ...
 
 @dataclass
 class _ManualCache:
-    sha: str
-    mtime: float
+    fp: Fingerprint
     toc: TocFile
     id_to_entry: Dict[str, TocEntry]
-    num_to_id: Dict[str, str]  # "2-1" -> "02-1" or "02-1_入院" など
+    num_to_id: Dict[str, str]  # "2-1" -> "02-1" or "02-1_入院" など（"別表1" も含む）
+    toc_json: Dict[bool, bytes] = field(default_factory=dict)  # hierarchical -> シリアライズ済み ToC
+    # section_id -> (章ファイルの指紋, anchor -> 本文の行範囲)。ToC が変われば _ManualCache ごと作り直される
+    anchors: Dict[str, Tuple[Fingerprint, Dict[str, Tuple[int, int]]]] = field(default_factory=dict)
+
+def _is_heading(line: str, child: TocChild, label: str) -> bool:
+    line = normalize_text(line).strip()
+    if not line:
+        return False
+    if line == label:
+        return True
+    return child.anchor != "PRE" and line.startswith(child.anchor + " ")
+
+
+def _anchor_ranges(st: SectionText, children: List[TocChild]) -> Dict[str, Tuple[int, int]]:
+    """ManualRepository.section_anchors の本体。見出し行を children の順に前から探す（本文は 1 回だけ走査）。"""
+    starts = st.raw_line_starts
+    n_lines = len(starts)
+    found: List[Tuple[str, int]] = []
+    line = 0
+    for child in children:
+        label = normalize_text(child.label).strip()
+        for i in range(line, n_lines):
+            end = starts[i + 1] - 1 if i + 1 < n_lines else len(st.raw)
+            if _is_heading(st.raw[starts[i]:end], child, label):
+                found.append((child.anchor, i))
+                line = i + 1
+                break
+        else:
+            if child.anchor == "PRE" and not found:
+                found.append((child.anchor, 0))
+    ranges: Dict[str, Tuple[int, int]] = {}
+    for k, (anchor, start) in enumerate(found):
+        ranges.setdefault(anchor, (start, found[k + 1][1] if k + 1 < len(found) else n_lines))
+    return ranges
 
-def _calc_sha(p: Path) -> str:
-    data = p.read_bytes()
-    return hashlib.sha256(data).hexdigest()
 
 class ManualRepository:
     def __init__(self, settings: Settings):
         self.settings = settings
         self.root = Path(settings.manuals_root)
         self._cache: Dict[str, _ManualCache] = {}
+        # uvicorn のスレッドプールから並行に呼ばれるため、キャッシュ更新はロックで保護する
+        self._lock = threading.Lock()
+        self._load_locks: Dict[str, threading.Lock] = {}
+        self._toc_paths: Dict[str, Path] = {}
+        self.watcher = FileWatcher(
+            self.root,
+            backend=settings.watch.backend,
+            poll_interval=settings.watch.poll_interval,
+        )
+        self.watcher.subscribe(self._on_file_changed)
+        self.sections = SectionCache(settings.cache.section_bytes)
+        self.responses = BytesCache(settings.cache.response_bytes)
+        self.results = ResultCache(settings.cache.search_result_bytes)
+        # 例外語は本文と同じ正規化をかけてから照合する（語の番号は settings の並び順）
+        self.exception_matcher = KeywordMatcher(normalize_text(t) for t in settings.exceptions.terms)
+        self.ngrams = NgramIndexStore(
+            self, Path(settings.paths.indices_dir),
+            compact_delay=settings.search.ngram_compact_delay,
+            rebuild_ratio=settings.search.ngram_rebuild_ratio,
+        )
+        self.corpus = CorpusStore(self, Path(settings.paths.indices_dir))
+        self.refs = ReferenceGraphStore(self)
+        self.bm25 = Bm25Store(self)
+        self.chunks = ChunkStore(self)
+        self.vectors = VectorStore(self, Path(settings.paths.indices_dir), settings.vectors)
+        self.regex_sandbox = RegexSandbox(settings.search.regex_workers)
+        self.snapshot = TocSnapshot(Path(settings.paths.indices_dir) / "toc_snapshot.json", self.root)
+        self._closing = threading.Event()
+        self._warmup: Optional[threading.Thread] = None
+        # 処理中のリクエスト数（差し替えられたリポジトリは 0 になってから close する。deps.reload_settings 参照）
+        self._users = 0
+        self._retired = False
+        self._users_lock = threading.Lock()
+
+    # -------- Lifecycle
+    def start(self) -> None:
+        """
+        ファイル監視と regex 用ワーカーを開始し、ToC の読み込みをバックグラウンドで始める
+        （以降の鮮度チェックは stat なしで済む）。読み込み前のマニュアルは初回アクセス時に読む。
+        """
+        if self.settings.watch.enabled:
+            self.watcher.start()
+        if self.settings.search.regex_sandbox:
+            self.regex_sandbox.start()
+        if self.settings.startup.snapshot:
+            n = self.snapshot.load()
+            if n:
+                log.info(f"loaded toc snapshot: manuals={n}")
+        if self.settings.startup.warmup:
+            self._warmup = threading.Thread(target=self._run_warmup, name="toc-warmup", daemon=True)
+            self._warmup.start()
+
+    def close(self) -> None:
+        self._closing.set()
+        if self._warmup is not None:
+            self._warmup.join(timeout=5)
+        self.watcher.stop()
+        self.ngrams.close()
+        self.regex_sandbox.close()
+        if self.settings.startup.snapshot:
+            self.snapshot.save()
+
+    def hold(self) -> None:
+        with self._users_lock:
+            self._users += 1
+
+    def release(self) -> None:
+        with self._users_lock:
+            self._users -= 1
+            idle = self._retired and self._users == 0
+        if idle:
+            self._close_in_background()
+
+    def retire(self) -> None:
+        """処理中のリクエスト（hold() 済み）が無くなった時点で close する。"""
+        with self._users_lock:
+            self._retired = True
+            idle = self._users == 0
+        if idle:
+            self._close_in_background()
+
+    def _close_in_background(self) -> None:
+        # release() はイベントループから呼ばれるので、スレッドの join やスナップショットの保存を待たせない
+        threading.Thread(target=self.close, name="repo-close", daemon=True).start()
+
+    def _run_warmup(self) -> None:
+        """全マニュアルの ToC をスレッドプールで並列に読み込み・検証し、スナップショットを保存する。"""
+        started = time.perf_counter()
+        manuals = self.list_manuals()
+
+        def load(manual: str) -> None:
+            if self._closing.is_set():
+                return
+            try:
+                self._ensure_loaded(manual)
+            except Exception as e:
+                # relaxed: 読めないマニュアルはログに残し、アクセス時に改めてエラーにする
+                log.error(f"failed to load toc: {manual}: {e}")
+
+        with ThreadPoolExecutor(max_workers=max(1, self.settings.startup.workers),
+                                thread_name_prefix="toc-warmup") as pool:
+            list(pool.map(load, manuals))
+        if self._closing.is_set():
+            return
+        if self.settings.startup.snapshot:
+            self.snapshot.save()
+        log.info(f"toc warmup done: manuals={len(manuals)} elapsed={time.perf_counter() - started:.3f}s")
+        if self.settings.startup.references and not self._closing.is_set():
+            self.refs.get()
+
+    def _on_file_changed(self, manual: str, path: Path) -> None:
+        # ToC が変わったときは ToC キャッシュを、章ファイルならその章だけを捨てる。
+        # 検索結果はどちらでもそのマニュアル分をすべて捨てる（キーのバージョンでも区別される）
+        self.results.discard_manual(manual)
+        if path == self._toc_path(manual):
+            self.invalidate(manual)
+        elif path.parent == self.root / manual:
+            self.sections.discard_file(manual, path.name)
 
     # -------- Discover manuals
     def list_manuals(self) -> List[str]:
@@ -44,12 +213,39 @@ class ManualRepository:
         return manuals
 
     # -------- Loading & cache
+    def _load_lock(self, manual: str) -> threading.Lock:
+        with self._lock:
+            lock = self._load_locks.get(manual)
+            if lock is None:
+                lock = self._load_locks[manual] = threading.Lock()
+            return lock
+
+    def invalidate(self, manual: Optional[str] = None) -> None:
+        """ToC キャッシュを破棄する（manual 省略時は全マニュアル）。"""
+        with self._lock:
+            if manual is None:
+                dropped = len(self._cache)
+                self._cache.clear()
+            else:
+                dropped = 1 if self._cache.pop(manual, None) is not None else 0
+        if dropped:
+            TOC_CACHE_EVICTIONS.inc(amount=dropped)
+
+    def _toc_path(self, manual: str) -> Path:
+        # 毎回 Path を組み立てるとホットパス（get_toc 等）で目立つので、マニュアルごとに保持する
+        path = self._toc_paths.get(manual)
+        if path is None:
+            path = self._toc_paths[manual] = Path(self.settings.toc.path_pattern.format(manual=manual))
+        return path
+
     def _load_toc_file(self, manual: str) -> TocFile:
-        path = Path(self.settings.toc.path_pattern.format(manual=manual))
+        path = self._toc_path(manual)
         if not path.exists():
             raise ManualNotFound(f"manual '{manual}' not found (missing {path})")
         try:
-            data = json.loads(path.read_text(encoding="utf-8"))
+            raw = path.read_bytes()
+            DISK_READ_BYTES.inc("toc", amount=len(raw))
+            data = json.loads(raw.decode("utf-8"))
             toc = TocFile(**data)
         except Exception as e:
             raise TocLoadError(str(e)) from e
@@ -63,52 +259,208 @@ class ManualRepository:
         return toc
 
     def _ensure_loaded(self, manual: str) -> _ManualCache:
-        path = Path(self.settings.toc.path_pattern.format(manual=manual))
-        if not path.exists():
+        path = self._toc_path(manual)
+        # 監視中は追跡済みの指紋を引くだけ（stat なし）、未監視なら stat 1 回
+        fp = self.watcher.fingerprint(path, manual=manual)
+        if fp is None:
             raise ManualNotFound(f"manual '{manual}' not found")
 
-        mtime = path.stat().st_mtime
-        sha = _calc_sha(path)
-
         cached = self._cache.get(manual)
-        if cached and cached.mtime == mtime and cached.sha == sha:
+        if cached and cached.fp == fp:
+            TOC_CACHE.inc("hit")
             return cached
 
-        toc = self._load_toc_file(manual)
-        # index maps
-        id_to_entry: Dict[str, TocEntry] = {e.id: e for e in toc.toc}
-        num_to_id: Dict[str, str] = {}
-        # "第2章-1 ..." → "2-1", "第10章 ..." → "10"
-        for e in toc.toc:
-            m = re.match(r"^第(?P<n>\d+)章(?:-(?P<s>\d+))?", e.title)
-            if m:
-                k = f"{m.group('n')}-{m.group('s')}" if m.group("s") else m.group("n")
-                num_to_id[k] = e.id
-
-        cache = _ManualCache(sha=sha, mtime=mtime, toc=toc,
-                             id_to_entry=id_to_entry, num_to_id=num_to_id)
-        self._cache[manual] = cache
-        return cache
+        # 同じマニュアルの再読み込みが並行して走らないよう、マニュアル単位で直列化する
+        with self._load_lock(manual):
+            cached = self._cache.get(manual)
+            if cached and cached.fp == fp:
+                TOC_CACHE.inc("hit")
+                return cached
+            TOC_CACHE.inc("miss")
+
+            with phase("load_toc"):
+                # 指紋が前回起動時と同じなら、検証済みのスナップショットから復元する
+                toc = self.snapshot.get(manual, fp) if self.settings.startup.snapshot else None
+                if toc is None:
+                    toc = self._load_toc_file(manual)
+                    self.snapshot.put(manual, fp, toc)
+            # index maps
+            id_to_entry: Dict[str, TocEntry] = {e.id: e for e in toc.toc}
+            num_to_id: Dict[str, str] = {}
+            # "第2章-1 ..." → "2-1", "第10章 ..." → "10", "別表1 ..." → "別表1"
+            for e in toc.toc:
+                m = _TITLE_KEY_RE.match(normalize_text(e.title))
+                if m:
+                    # 同じ番号のタイトルが重複したら後のエントリを採る（従来どおり）
+                    num_to_id[reference_key(m)] = e.id
+
+            # 章ファイルも追跡し、変更をマニュアル単位のバージョンに反映させる
+            self.watcher.track(manual, (self.root / manual / e.file for e in toc.toc))
+
+            cache = _ManualCache(fp=fp, toc=toc,
+                                 id_to_entry=id_to_entry, num_to_id=num_to_id)
+            with self._lock:
+                self._cache[manual] = cache
+            return cache
 
     # -------- Public API
+    def manual_version(self, manual: str) -> int:
+        """マニュアル配下の ToC / 章ファイルが変わるたびに増えるバージョン。"""
+        return self.watcher.version(manual)
+
+    def toc_fingerprint(self, manual: str) -> Fingerprint:
+        """ToC ファイルの指紋（ETag 用）。"""
+        return self._ensure_loaded(manual).fp
+
+    def section_fingerprint(self, manual: str, section_id: str) -> Fingerprint:
+        """章ファイルの指紋（ETag 用）。本文は読まない。"""
+        entry = self.get_entry(manual, section_id)
+        fp = self.watcher.fingerprint(self.root / manual / entry.file, manual=manual)
+        if fp is None:
+            raise SectionNotFound(f"file not found: {entry.file}")
+        return fp
+
     def load_toc(self, manual: str) -> TocFile:
         return self._ensure_loaded(manual).toc
 
+    def toc_json(self, manual: str, hierarchical: bool) -> bytes:
+        """
+        get_toc の本文（JSON バイト列）。ToC の版ごと・フラット/階層ごとに 1 回だけ作り、
+        _ManualCache に持たせる（ToC が変われば _ManualCache ごと作り直される）。
+        """
+        c = self._ensure_loaded(manual)
+        body = c.toc_json.get(hierarchical)
+        if body is None:
+            data = c.toc.model_dump(mode="json")
+            if not hierarchical:
+                # 章のみ：children を落として返す
+                data["toc"] = [{k: v for k, v in e.items() if k != "children"} for e in data["toc"]]
+            body = c.toc_json[hierarchical] = dump_json(data)
+        return body
+
     def list_sections(self, manual: str) -> List[str]:
         c = self._ensure_loaded(manual)
         return [e.id for e in c.toc.toc]
 
-    def get_section(self, manual: str, section_id: str) -> dict:
+    def get_entry(self, manual: str, section_id: str) -> TocEntry:
+        """section_id に対応する ToC エントリ（id→entry の索引を引くだけ）。"""
+        entry = self._ensure_loaded(manual).id_to_entry.get(section_id)
+        if not entry:
+            raise SectionNotFound(f"section '{section_id}' not found in '{manual}'")
+        return entry
+
+    def read_section(self, manual: str, section_id: str) -> SectionText:
+        """章本文をキャッシュ経由で取得する（生テキストと正規化済みテキストの両方）。"""
         c = self._ensure_loaded(manual)
         entry = c.id_to_entry.get(section_id)
         if not entry:
             raise SectionNotFound(f"section '{section_id}' not found in '{manual}'")
+        return self._read_entry(manual, entry)
+
+    def iter_sections(
+        self,
+        manual: str,
+        section_ids: Optional[Collection[str]] = None,
+    ) -> Iterator[SectionText]:
+        """
+        ToC 順に章本文を返す。ファイルが無い章は飛ばす。
+        section_ids を渡すと、それ以外の章は読み込まずに飛ばす。
+        """
+        c = self._ensure_loaded(manual)
+        for entry in c.toc.toc:
+            if section_ids is not None and entry.id not in section_ids:
+                continue
+            try:
+                yield self._read_entry(manual, entry)
+            except SectionNotFound:
+                continue
+
+    def section_signature(self, manual: str) -> Signature:
+        """ToC 順の (section_id, file, 指紋) 一覧。索引の鮮度判定に使う。"""
+        c = self._ensure_loaded(manual)
+        return [
+            (e.id, e.file, self.watcher.fingerprint(self.root / manual / e.file, manual=manual))
+            for e in c.toc.toc
+        ]
+
+    def _read_entry(self, manual: str, entry: TocEntry) -> SectionText:
         p = self.root / manual / entry.file
-        if not p.exists():
+        fp = self.watcher.fingerprint(p, manual=manual)
+        if fp is None:
             # relaxed: 404で返す
             raise SectionNotFound(f"file not found: {entry.file}")
-        text = p.read_text(encoding="utf-8", errors="replace").replace("\r\n", "\n")
-        return {"id": entry.id, "file": entry.file, "text": text, "encoding": "utf-8"}
+        st = self.sections.get(manual, entry.id, fp)
+        if st is not None:
+            return st
+        with phase("read"):
+            data = p.read_bytes()
+            DISK_READ_BYTES.inc("section", amount=len(data))
+            text = data.decode("utf-8", errors="replace").replace("\r\n", "\n").replace("\r", "\n")
+        with phase("normalize"):
+            norm = normalize_text(text)
+            if norm == text:
+                norm = text
+            spans = chunk_spans(norm, self.settings.chunks.max_chars)
+            starts = line_starts(norm)
+            raw_starts = starts if norm is text else line_starts(text)
+            exc_lines, exc_terms = self._exception_lines(norm, starts)
+            shadow, shadow_runs, shadow_origins = shadow_text(norm)
+        st = SectionText(
+            manual=manual,
+            section_id=entry.id,
+            file=entry.file,
+            fp=fp,
+            raw=text,
+            norm=norm,
+            line_starts=starts,
+            chunk_starts=array("I", (s for s, _ in spans)),
+            chunk_ends=array("I", (e for _, e in spans)),
+            exc_lines=exc_lines,
+            exc_terms=exc_terms,
+            raw_line_starts=raw_starts,
+            shadow=shadow,
+            shadow_runs=shadow_runs,
+            shadow_origins=shadow_origins,
+        )
+        self.sections.put(st)
+        return st
+
+    def _exception_lines(self, norm: str, starts: array) -> Tuple[array, array]:
+        """例外語を含む行（0 始まり）と、その行で最も左に現れる語の番号を求める。"""
+        first: Dict[int, Tuple[int, int]] = {}
+        for start, _, ti in self.exception_matcher.finditer(norm):
+            line = bisect_right(starts, start) - 1
+            cur = first.get(line)
+            if cur is None or (start, ti) < cur:
+                first[line] = (start, ti)
+        lines = sorted(first)
+        return array("I", lines), array("I", (first[i][1] for i in lines))
+
+    def get_section(self, manual: str, section_id: str) -> dict:
+        st = self.read_section(manual, section_id)
+        return {"id": st.section_id, "file": st.file, "text": st.raw, "encoding": "utf-8"}
+
+    def section_anchors(self, manual: str, section_id: str) -> Dict[str, Tuple[int, int]]:
+        """
+        ToC の children（anchor）ごとの本文の範囲。生テキスト上の行番号（0 始まり）の [start, end)。
+
+        見出し行（label、または "anchor label" / "anchor ..." で始まる行）を children の順に
+        探し、次に見つかった見出しの手前までをその anchor の範囲とする。PRE の見出しが無い場合は
+        章の先頭から始める。見出しが見つからない anchor は含めない。
+        ToC の版・章ファイルの版ごとに 1 回だけ求める。
+        """
+        c = self._ensure_loaded(manual)
+        entry = c.id_to_entry.get(section_id)
+        if not entry:
+            raise SectionNotFound(f"section '{section_id}' not found in '{manual}'")
+        st = self._read_entry(manual, entry)
+        cached = c.anchors.get(section_id)
+        if cached is not None and cached[0] == st.fp:
+            return cached[1]
+        ranges = _anchor_ranges(st, entry.children or [])
+        with self._lock:
+            c.anchors[section_id] = (st.fp, ranges)
+        return ranges
 
     def get_outline(self, manual: str, section_id: str) -> dict:
         c = self._ensure_loaded(manual)
@@ -119,11 +471,13 @@ class ManualRepository:
 
     def resolve_reference(self, manual: str, ref_text: str) -> Optional[str]:
         """
-        "第2章" / "第2章-1" を section_id に解決（簡易）
+        "第2章" / "第2章-1" / "別表1" を manual 内の section_id に解決（簡易）。
+        前置きのマニュアル名は見ない（常に manual 内で解決する。別マニュアルへの解決は resolve_references）。
         """
-        c = self._ensure_loaded(manual)
-        m = re.search(r"第\s*(\d+)\s*章(?:\s*-\s*(\d+))?", ref_text)
-        if not m: 
-            return None
-        key = f"{m.group(1)}-{m.group(2)}" if m.group(2) else m.group(1)
-        return c.num_to_id.get(key)
\ No newline at end of file
+        self._ensure_loaded(manual)
+        target = self.refs.resolve(manual, ref_text, manuals=())
+        return target[1] if target else None
+
+    def reference_target(self, manual: str, key: str) -> Optional[str]:
+        """参照キー（"2-1" / "3" / "別表1"）に対応する section_id。"""
+        return self._ensure_loaded(manual).num_to_id.get(key)
\ No newline at end of file
@@ -0,0 +1,95 @@
+from __future__ import annotations
+import json
+import logging
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+from app.core.watcher import Fingerprint
+from app.schemas.toc import TocFile
+
+log = logging.getLogger(__name__)
+
+_FORMAT_VERSION = 2
+
+
+class TocSnapshot:
+    """
+    検証済み ToC とその指紋の保存先（indices_dir/toc_snapshot.json）。
+
+    再起動時、指紋が変わっていないマニュアルは ToC の読み込み・緩い検証を飛ばして
+    ここから復元する。中身は TocFile.model_dump() をそのまま JSON にしたもの。
+    """
+
+    def __init__(self, path: Path, root: Path):
+        self.path = path
+        self.root = str(root.resolve())
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Tuple[Fingerprint, TocFile]] = {}
+        self._dirty = False
+
+    def load(self) -> int:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            log.warning(f"ignored broken toc snapshot: {self.path}: {e}")
+            return 0
+        if not isinstance(data, dict) or data.get("format") != _FORMAT_VERSION or data.get("root") != self.root:
+            return 0
+        try:
+            entries = {
+                manual: (tuple(e["fp"]), TocFile.model_validate(e["toc"]))
+                for manual, e in data["manuals"].items()
+            }
+        except Exception as e:
+            log.warning(f"ignored broken toc snapshot: {self.path}: {e}")
+            return 0
+        with self._lock:
+            self._entries = entries
+            self._dirty = False
+        return len(self._entries)
+
+    def get(self, manual: str, fp: Fingerprint) -> Optional[TocFile]:
+        entry = self._entries.get(manual)
+        if entry is None or entry[0] != fp:
+            return None
+        return entry[1]
+
+    def put(self, manual: str, fp: Fingerprint, toc: TocFile) -> None:
+        with self._lock:
+            entry = self._entries.get(manual)
+            if entry is not None and entry[0] == fp:
+                return
+            self._entries[manual] = (fp, toc)
+            self._dirty = True
+
+    def save(self) -> None:
+        """変更があったときだけ書き出す（一時ファイル → rename）。"""
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = dict(self._entries)
+            self._dirty = False
+        data = {
+            "format": _FORMAT_VERSION,
+            "root": self.root,
+            "manuals": {
+                manual: {"fp": list(fp), "toc": toc.model_dump(mode="json")}
+                for manual, (fp, toc) in entries.items()
+            },
+        }
+        # 終了時に複数ワーカーが同時に書いても混ざらないよう、一時ファイル名は書き手ごとに分ける
+        tmp = self.path.with_name(f"{self.path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except OSError as e:
+            log.warning(f"failed to save toc snapshot: {e}")
+        finally:
+            tmp.unlink(missing_ok=True)
@@ -1,8 +1,9 @@
 from __future__ import annotations
 
-from typing import Dict, Any
+from typing import Optional
 
-from fastapi import APIRouter, HTTPException, Query, Depends
+from fastapi import APIRouter, HTTPException, Query, Depends, Request
+from fastapi.responses import StreamingResponse
 
 from app.repositories.manual import (
     ManualRepository,
@@ -11,33 +12,56 @@ from app.repositories.manual import (
     TocLoadError,
 )
 from app.deps import get_repo
+from app.core.http import conditional_response, make_etag
+from app.core.profiling import ProfiledRoute
 from app.schemas.search import (
     SearchTextRequest,
     SearchTextResponse,
+    SearchAllRequest,
     FindExceptionsRequest,
     FindExceptionsResponse,
+    RankedSearchRequest,
+    RankedSearchResponse,
+    HybridSearchRequest,
+    HybridSearchResponse,
 )
 from app.services.search import (
     search_text as svc_search_text,
     find_exceptions as svc_find_exceptions,
+    iter_all_hits as svc_iter_all_hits,
+)
+from app.services.ranking import search_ranked as svc_search_ranked
+from app.services.hybrid import search_hybrid as svc_search_hybrid
+from app.indices.vectors import VectorSearchUnavailable
+from app.schemas.manuals import (
+    SectionResponse,
+    SectionRange,
+    ListSectionsResponse,
+    GetSectionsRequest,
+    GetSectionsResponse,
+    GetReferencesResponse,
+    ResolveReferencesRequest,
+    ResolveReferencesResponse,
+)
+from app.services.sections import (
+    fetch_section as svc_fetch_section,
+    iter_sections as svc_iter_sections,
+)
+from app.services.references import (
+    get_references as svc_get_references,
+    resolve_references as svc_resolve_references,
+)
+from app.schemas.chunks import (
+    ListChunksResponse,
+    GetChunksRequest,
+    GetChunksResponse,
+)
+from app.services.chunks import (
+    list_chunks as svc_list_chunks,
+    get_chunks as svc_get_chunks,
 )
-from app.schemas.manuals import SectionResponse, ListSectionsResponse
-
-router = APIRouter()
-
 
-def _strip_children_if_needed(data: Dict[str, Any], hierarchical: bool) -> Dict[str, Any]:
-    if hierarchical:
-        return data
-    # 章のみ：children を落として返す
-    if "toc" in data:
-        pruned = []
-        for e in data["toc"]:
-            d = dict(e)
-            d.pop("children", None)
-            pruned.append(d)
-        return {"manual": data["manual"], "toc": pruned}
-    return data
+router = APIRouter(route_class=ProfiledRoute)
 
 
 @router.get("/list_manuals")
@@ -47,13 +71,21 @@ def list_manuals(repo: ManualRepository = Depends(get_repo)):
 
 @router.get("/get_toc")
 def get_toc(
+    request: Request,
     manual_name: str = Query(...),
     hierarchical: bool = Query(False),
     repo: ManualRepository = Depends(get_repo),
 ):
     try:
-        toc = repo.load_toc(manual_name)
-        return _strip_children_if_needed(toc.model_dump(), hierarchical)
+        fps = [repo.toc_fingerprint(manual_name)]
+
+        # 本文は ToC の版ごとにシリアライズ済みのものを使う（モデルの走査はしない）
+        return conditional_response(
+            request, repo.responses, repo.settings.http,
+            make_etag("toc", manual_name, hierarchical, fps=fps), fps,
+            lambda: repo.toc_json(manual_name, hierarchical),
+            cache_body=False,
+        )
     except ManualNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except TocLoadError as e:
@@ -62,64 +94,81 @@ def get_toc(
 
 @router.get("/list_sections", response_model=ListSectionsResponse)
 def list_sections(
+    request: Request,
     manual_name: str,
     repo: ManualRepository = Depends(get_repo),
 ):
     try:
-        sections = repo.list_sections(manual_name)
-        return {
-            "manual": manual_name,
-            "sections": sections,
-        }
+        fps = [repo.toc_fingerprint(manual_name)]
+
+        def build() -> bytes:
+            sections = repo.list_sections(manual_name)
+            return ListSectionsResponse(manual=manual_name, sections=sections).model_dump_json().encode("utf-8")
+
+        return conditional_response(
+            request, repo.responses, repo.settings.http,
+            make_etag("sections", manual_name, fps=fps), fps, build,
+        )
     except ManualNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
 
 
 @router.get("/get_section", response_model=SectionResponse)
 def get_section(
+    request: Request,
     manual_name: str,
     section_id: str,
+    start_line: Optional[int] = Query(None, ge=1),
+    end_line: Optional[int] = Query(None, ge=1),
+    start_char: Optional[int] = Query(None, ge=0),
+    end_char: Optional[int] = Query(None, ge=0),
+    anchor: Optional[str] = None,
+    cursor: Optional[str] = None,
+    max_chars: Optional[int] = Query(None, ge=1),
     repo: ManualRepository = Depends(get_repo),
 ):
     try:
-        # 本文などの素データを取得
-        raw = repo.get_section(manual_name, section_id)
-
-        # ToC からタイトルを取得
-        toc = repo.load_toc(manual_name)
-        title = None
-        for entry in toc.toc:
-            if entry.id == section_id:
-                title = entry.title
-                break
-
-        if title is None:
-            raise SectionNotFound(
-                f"section '{section_id}' not found in ToC for manual '{manual_name}'"
-            )
-
-        resp: Dict[str, Any] = {
-            "manual": manual_name,
-            "section_id": section_id,
-            "title": title,
-            "text": raw.get("text", ""),
-        }
+        rng = SectionRange(
+            start_line=start_line, end_line=end_line, start_char=start_char, end_char=end_char,
+            anchor=anchor, cursor=cursor, max_chars=max_chars,
+        )
+        # タイトルは ToC 由来なので ToC と章ファイルの両方の指紋で版を決める
+        fps = [repo.toc_fingerprint(manual_name), repo.section_fingerprint(manual_name, section_id)]
 
-        # 任意フィールドを引き継ぐ
-        for key in ("file", "encoding", "id"):
-            if key in raw:
-                resp[key] = raw[key]
-
-        # id が無ければ section_id を入れておく
-        if "id" not in resp:
-            resp["id"] = section_id
-
-        return resp
+        def build() -> bytes:
+            data = svc_fetch_section(repo, manual_name, section_id, rng)
+            # 範囲指定が無いときは従来どおりのフィールドだけを返す
+            return SectionResponse(**data).model_dump_json(exclude_unset=True).encode("utf-8")
 
+        etag_parts = (manual_name, section_id) + (tuple(rng.model_dump().values()) if rng.is_set() else ())
+        return conditional_response(
+            request, repo.responses, repo.settings.http,
+            make_etag("section", *etag_parts, fps=fps), fps, build,
+        )
     except ManualNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
     except SectionNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/get_sections", response_model=GetSectionsResponse)
+def get_sections(
+    body: GetSectionsRequest,
+    repo: ManualRepository = Depends(get_repo),
+):
+    # 複数章をまとめて取得。項目ごとのエラーは results 内で返す
+    try:
+        items = svc_iter_sections(repo, body)
+        if body.stream:
+            return StreamingResponse(
+                (item.model_dump_json() + "\n" for item in items),
+                media_type="application/x-ndjson",
+            )
+        return {"results": list(items)}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.get("/get_outline")
@@ -149,16 +198,66 @@ def resolve_reference(
         raise HTTPException(status_code=404, detail=str(e))
 
 
+@router.post("/resolve_references", response_model=ResolveReferencesResponse)
+def resolve_references(
+    body: ResolveReferencesRequest,
+    repo: ManualRepository = Depends(get_repo),
+):
+    # 参照表現をまとめて解決（resolve_reference を 1 件ずつ呼ぶ代わり）
+    try:
+        return {"results": svc_resolve_references(repo, body)}
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.get("/get_references", response_model=GetReferencesResponse)
+def get_references(
+    manual_name: str,
+    section_id: str,
+    depth: int = Query(1, ge=1, le=5),
+    direction: str = Query("both", pattern="^(out|in|both)$"),
+    repo: ManualRepository = Depends(get_repo),
+):
+    # 章の参照先（outgoing）・参照元（incoming）を参照グラフから返す
+    try:
+        return svc_get_references(repo, manual_name, section_id, depth, direction)
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SectionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
 @router.post("/search_text", response_model=SearchTextResponse)
 def search_text(
     body: SearchTextRequest,
     repo: ManualRepository = Depends(get_repo),
 ):
     try:
-        results = svc_search_text(repo, body)
-        return {"results": results}
+        results, truncated = svc_search_text(repo, body)
+        return {"results": results, "truncated": truncated}
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TocLoadError as e:
+        # 名指しされたマニュアルの ToC が壊れている（全マニュアル検索では読み飛ばす）
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/search_text_stream")
+def search_text_stream(
+    body: SearchAllRequest,
+    repo: ManualRepository = Depends(get_repo),
+):
+    # 全出現を NDJSON（1 行 1 ヒット）で走査しながら順次返す
+    try:
+        hits = svc_iter_all_hits(repo, body)
     except ManualNotFound as e:
         raise HTTPException(status_code=404, detail=str(e))
+    except TocLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(
+        (hit.model_dump_json() + "\n" for hit in hits),
+        media_type="application/x-ndjson",
+    )
 
 
 @router.post("/find_exceptions", response_model=FindExceptionsResponse)
@@ -170,4 +269,73 @@ def find_exceptions(
         results = svc_find_exceptions(repo, body)
         return {"results": results}
     except ManualNotFound as e:
-        raise HTTPException(status_code=404, detail=str(e))
\ No newline at end of file
+        raise HTTPException(status_code=404, detail=str(e))
+    except TocLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/search_ranked", response_model=RankedSearchResponse)
+def search_ranked(
+    body: RankedSearchRequest,
+    repo: ManualRepository = Depends(get_repo),
+):
+    try:
+        results = svc_search_ranked(repo, body)
+        return {"results": results}
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TocLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ValueError as e:
+        # 語（2-gram）が作れない短いクエリ
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.post("/search_hybrid", response_model=HybridSearchResponse)
+def search_hybrid(
+    body: HybridSearchRequest,
+    repo: ManualRepository = Depends(get_repo),
+):
+    try:
+        results, truncated = svc_search_hybrid(repo, body)
+        return {"results": results, "truncated": truncated}
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except TocLoadError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except VectorSearchUnavailable as e:
+        # numpy 未導入でベクトル検索が使えない
+        raise HTTPException(status_code=503, detail=str(e))
+
+
+@router.get("/list_chunks", response_model=ListChunksResponse)
+def list_chunks(
+    manual_name: str,
+    section_id: Optional[str] = None,
+    repo: ManualRepository = Depends(get_repo),
+):
+    try:
+        return {
+            "manual": manual_name,
+            "chunks": svc_list_chunks(repo, manual_name, section_id),
+        }
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SectionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@router.post("/get_chunks", response_model=GetChunksResponse)
+def get_chunks(
+    body: GetChunksRequest,
+    repo: ManualRepository = Depends(get_repo),
+):
+    if not body.chunk_ids and body.section_id is None:
+        raise HTTPException(status_code=400, detail="either chunk_ids or section_id is required")
+    try:
+        chunks, missing = svc_get_chunks(repo, body)
+        return {"manual": body.manual_name, "chunks": chunks, "missing": missing}
+    except ManualNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except SectionNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
@@ -0,0 +1,54 @@
+# app/schemas/chunks.py
+
+from __future__ import annotations
+
+from typing import List, Optional
+
+from pydantic import BaseModel, Field
+
+
+class ChunkInfo(BaseModel):
+    """
+    チャンクのメタデータ（RAG.md §5.3 / §7.5.1）
+
+    - chunk_id: "{section_id}:{章内通し番号}"（例: "03-1:2"）
+    - position: start_line / end_line（1 始まり、両端含む）
+    - start / end: 正規化済み章本文上の文字オフセット
+    """
+
+    chunk_id: str
+    section_id: str
+    start_line: int
+    end_line: int
+    start: int
+    end: int
+
+
+class ListChunksResponse(BaseModel):
+    manual: str
+    chunks: List[ChunkInfo]
+
+
+class GetChunksRequest(BaseModel):
+    """
+    POST /get_chunks のリクエスト
+
+    chunk_ids を指定するか、section_id と章内番号の範囲（start_no〜end_no）を指定する。
+    """
+
+    manual_name: str
+    chunk_ids: Optional[List[str]] = Field(None, max_length=500)
+    section_id: Optional[str] = None
+    start_no: int = Field(1, ge=1)
+    end_no: Optional[int] = Field(None, ge=1)
+
+
+class Chunk(ChunkInfo):
+    title: str
+    chunk_text: str
+
+
+class GetChunksResponse(BaseModel):
+    manual: str
+    chunks: List[Chunk]
+    missing: List[str] = []
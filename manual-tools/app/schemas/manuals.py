@@ -4,7 +4,7 @@ from __future__ import annotations
 
 from typing import List, Optional
 
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 
 
 class SectionResponse(BaseModel):
@@ -32,6 +32,39 @@ class SectionResponse(BaseModel):
     encoding: Optional[str] = None
     id: Optional[str] = None
 
+    # 範囲指定（SectionRange）時のみ。位置は生テキスト上の文字位置 [start_char, end_char)、行は 1 始まり
+    start_char: Optional[int] = None
+    end_char: Optional[int] = None
+    start_line: Optional[int] = None
+    end_line: Optional[int] = None
+    total_chars: Optional[int] = None
+    total_lines: Optional[int] = None
+    truncated: Optional[bool] = None  # max_chars で切った場合 true
+    next_cursor: Optional[str] = None  # 続きを取るときに cursor に渡す
+
+
+class SectionRange(BaseModel):
+    """
+    GET /get_section の範囲指定（行範囲・文字範囲・anchor・cursor はどれか 1 つ）
+
+    - start_line / end_line: 1 始まり、両端を含む
+    - start_char / end_char: 0 始まりの文字位置、[start_char, end_char)
+    - anchor: ToC の children の anchor（"PRE", "I".."XV"）
+    - cursor: 前のレスポンスの next_cursor
+    - max_chars: 返す本文の上限（行の途中では切らない）。超えた分は next_cursor で続きを取る
+    """
+
+    start_line: Optional[int] = Field(None, ge=1)
+    end_line: Optional[int] = Field(None, ge=1)
+    start_char: Optional[int] = Field(None, ge=0)
+    end_char: Optional[int] = Field(None, ge=0)
+    anchor: Optional[str] = None
+    cursor: Optional[str] = None
+    max_chars: Optional[int] = Field(None, ge=1)
+
+    def is_set(self) -> bool:
+        return any(v is not None for v in self.__dict__.values())
+
 
 class ListSectionsResponse(BaseModel):
     """
@@ -43,3 +76,87 @@ class ListSectionsResponse(BaseModel):
 
     manual: str
     sections: List[str]
+
+
+class SectionRef(BaseModel):
+    manual_name: str
+    section_id: str
+
+
+class GetSectionsRequest(BaseModel):
+    """
+    POST /get_sections のリクエスト
+
+    manual_name + section_ids（1 マニュアル）か、items（マニュアルをまたぐ組）の
+    どちらか（両方指定時は section_ids → items の順に連結）。
+    stream=true なら 1 件ずつ NDJSON で返す。
+    """
+
+    manual_name: Optional[str] = None
+    section_ids: List[str] = Field(default_factory=list, max_length=100)
+    items: List[SectionRef] = Field(default_factory=list, max_length=100)
+    stream: bool = False
+
+
+class SectionItem(BaseModel):
+    """
+    /get_sections の 1 件分。取得できなかった項目も error / status を入れて返す。
+    """
+
+    manual: str
+    section_id: str
+    ok: bool
+    title: Optional[str] = None
+    text: Optional[str] = None
+    file: Optional[str] = None
+    encoding: Optional[str] = None
+    status: int = 200  # 個別のエラー時は 404 など
+    error: Optional[str] = None
+
+
+class GetSectionsResponse(BaseModel):
+    results: List[SectionItem]
+
+
+class ReferenceEdge(BaseModel):
+    """
+    章間参照の 1 本（source 章の本文が target 章を参照している）。
+
+    - ref_text: 最初に現れた参照表現（例: "第2章-1", "運用仕様編の第3章"）
+    - line: その行番号（1 始まり）
+    - count: source 章内で同じ target を参照している回数
+    - depth: 起点の章から何段目の辺か（1 = 直接の参照）
+    """
+
+    source_manual: str
+    source_section: str
+    target_manual: str
+    target_section: str
+    ref_text: str
+    line: int
+    count: int = 1
+    depth: int = 1
+
+
+class GetReferencesResponse(BaseModel):
+    manual: str
+    section_id: str
+    outgoing: List[ReferenceEdge]
+    incoming: List[ReferenceEdge]
+
+
+class ResolveReferencesRequest(BaseModel):
+    """POST /resolve_references のリクエスト（ref_texts をまとめて manual_name 基準で解決）"""
+
+    manual_name: str
+    ref_texts: List[str] = Field(max_length=200)
+
+
+class ResolvedReference(BaseModel):
+    ref_text: str
+    target_manual: Optional[str] = None
+    target_section: Optional[str] = None
+
+
+class ResolveReferencesResponse(BaseModel):
+    results: List[ResolvedReference]
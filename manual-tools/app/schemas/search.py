@@ -1,31 +1,105 @@
 from __future__ import annotations
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import List, Optional, Union
 
 class SearchTextRequest(BaseModel):
-    manual_name: str
+    # 省略時は全マニュアル、配列なら指定マニュアルを横断して並列に検索する
+    manual_name: Optional[Union[str, List[str]]] = None
     query: str
     section_id: Optional[str] = None
     limit: int = Field(10, ge=1, le=100)
-    # ↓ ここを regex|plain|loose に拡張
-    mode: str = Field("regex", pattern="^(regex|plain|loose)$", description="regex: 正規表現, plain: 文字列一致, loose: 空白/区切り無視のゆるい一致")
+    # ↓ ここを regex|plain|loose|fuzzy に拡張
+    mode: str = Field("regex", pattern="^(regex|plain|loose|fuzzy)$", description="regex: 正規表現, plain: 文字列一致, loose: 空白/区切り無視のゆるい一致, fuzzy: 編集距離 max_distance 以内のあいまい一致（距離の近い順）")
     case_sensitive: bool = False
+    # fuzzy モードの編集距離の上限（省略時は search.fuzzy_max_distance）
+    max_distance: Optional[int] = Field(None, ge=0, le=5)
 
 class SearchHit(BaseModel):
     section_id: str
     snippet: str
+    chunk_id: Optional[str] = None
+    manual: Optional[str] = None
+    distance: Optional[int] = None  # fuzzy モードのみ。クエリとの編集距離
 
 class SearchTextResponse(BaseModel):
     results: List[SearchHit]
+    truncated: bool = False  # regex の実行期限を超えて途中で打ち切った
+
+class SearchAllRequest(BaseModel):
+    # /search_text_stream 用。limit の代わりに max_hits（省略時は無制限）
+    manual_name: Optional[Union[str, List[str]]] = None
+    query: str
+    section_id: Optional[str] = None
+    max_hits: Optional[int] = Field(None, ge=1)
+    mode: str = Field("regex", pattern="^(regex|plain|loose)$")
+    case_sensitive: bool = False
+
+class MatchHit(BaseModel):
+    # NDJSON の 1 行。start/end・line は正規化済み本文上の位置（line は 1 始まり）
+    manual: str
+    section_id: str
+    line: int
+    start: int
+    end: int
+    match: str
+    snippet: str
+    chunk_id: Optional[str] = None
+
+class StreamTruncated(BaseModel):
+    # /search_text_stream の最終行。regex の実行期限を超えて途中で打ち切った
+    truncated: bool = True
 
 class FindExceptionsRequest(BaseModel):
-    manual_name: str
+    manual_name: Optional[Union[str, List[str]]] = None  # search_text と同じ
     section_id: Optional[str] = None
     limit: int = Field(50, ge=1, le=200)
 
 class ExceptionHit(BaseModel):
     section_id: str
     text: str
+    manual: Optional[str] = None
+    term: Optional[str] = None  # 行内で最初に現れた例外語
+    line: Optional[int] = None  # 例外語を含む行の行番号（1 始まり）
 
 class FindExceptionsResponse(BaseModel):
     results: List[ExceptionHit]
+
+class RankedSearchRequest(BaseModel):
+    manual_name: str
+    query: str
+    limit: int = Field(5, ge=1, le=100)
+    level: str = Field("section", pattern="^(section|chunk)$", description="section: 章単位, chunk: チャンク（段落）単位でスコアリング")
+
+class RankedHit(BaseModel):
+    section_id: str
+    title: str
+    score: float
+    snippet: str
+    chunk_id: Optional[str] = None  # level=chunk のとき
+
+class RankedSearchResponse(BaseModel):
+    results: List[RankedHit]
+
+class HybridSearchRequest(BaseModel):
+    manual_name: str
+    query: str
+    limit: int = Field(5, ge=1, le=100)
+    mode: str = Field("loose", pattern="^(regex|plain|loose)$", description="キーワード一致の判定に使う search_text のモード")
+    case_sensitive: bool = False
+    vector_weight: float = Field(0.5, ge=0)
+    keyword_weight: float = Field(0.3, ge=0)
+    regex_weight: float = Field(0.2, ge=0)
+
+class HybridHit(BaseModel):
+    section_id: str
+    chunk_id: str
+    title: str
+    score: float
+    vector_score: float
+    keyword_score: float
+    regex_match: bool
+    snippet: str
+
+class HybridSearchResponse(BaseModel):
+    results: List[HybridHit]
+    truncated: bool = False  # regex の実行期限を超えて途中で打ち切った
@@ -0,0 +1,77 @@
+# app/services/chunks.py
+from __future__ import annotations
+
+from typing import List, Optional, Tuple
+
+from app.schemas.chunks import ChunkInfo, Chunk, GetChunksRequest
+from app.indices.chunks import ChunkRef
+from app.repositories.manual import ManualRepository, SectionNotFound
+
+
+def _info(ref: ChunkRef) -> ChunkInfo:
+    return ChunkInfo(
+        chunk_id=ref.chunk_id,
+        section_id=ref.section_id,
+        start_line=ref.start_line,
+        end_line=ref.end_line,
+        start=ref.start,
+        end=ref.end,
+    )
+
+
+def list_chunks(
+    repo: ManualRepository,
+    manual: str,
+    section_id: Optional[str] = None,
+) -> List[ChunkInfo]:
+    """
+    /list_chunks のコアロジック。
+    section_id 指定時はその章のチャンクのみ（章が ToC に無ければ SectionNotFound）。
+    """
+    table = repo.chunks.get(manual)
+    if section_id is None:
+        return [_info(r) for r in table.refs()]
+    repo.get_entry(manual, section_id)
+    return [_info(r) for r in table.section_refs(section_id)]
+
+
+def get_chunks(repo: ManualRepository, req: GetChunksRequest) -> Tuple[List[Chunk], List[str]]:
+    """
+    /get_chunks のコアロジック。
+
+    chunk_ids 指定時は指定順に返し、見つからない ID は missing に入れる。
+    それ以外は section_id の章内番号 start_no〜end_no を返す。
+    """
+    manual = req.manual_name
+    table = repo.chunks.get(manual)
+
+    missing: List[str] = []
+    refs: List[ChunkRef] = []
+    if req.chunk_ids:
+        for cid in req.chunk_ids:
+            ref = table.find(cid)
+            if ref is None:
+                missing.append(cid)
+            else:
+                refs.append(ref)
+    else:
+        assert req.section_id is not None
+        repo.get_entry(manual, req.section_id)
+        refs = table.section_refs(req.section_id, req.start_no, req.end_no)
+
+    chunks: List[Chunk] = []
+    for ref in refs:
+        try:
+            entry = repo.get_entry(manual, ref.section_id)
+            sec = repo.read_section(manual, ref.section_id)
+        except SectionNotFound:
+            missing.append(ref.chunk_id)
+            continue
+        chunks.append(
+            Chunk(
+                **_info(ref).model_dump(),
+                title=entry.title,
+                chunk_text=sec.norm[ref.start:ref.end],
+            )
+        )
+    return chunks, missing
@@ -0,0 +1,136 @@
+# app/services/hybrid.py
+from __future__ import annotations
+
+from typing import Dict, List, Optional, Tuple
+
+from app.schemas.search import (
+    HybridSearchRequest,
+    HybridHit,
+    SearchTextRequest,
+)
+from app.core.sandbox import Deadline
+from app.core.text import make_snippet, normalize_text as _nfkc
+from app.indices.chunks import make_chunk_id
+from app.repositories.manual import ManualRepository, SectionNotFound
+from app.services.search import compile_query, search_text
+
+
+def search_hybrid(repo: ManualRepository, req: HybridSearchRequest) -> Tuple[List[HybridHit], bool]:
+    """
+    /search_hybrid のコアロジック。(ヒット, 打ち切りの有無) を返す。
+
+    チャンク単位で次の 3 つを重み付きで足し合わせて並べる。
+    - vector: チャンク埋め込みとのコサイン類似度
+    - keyword: BM25（チャンクレベル）を候補内の最大値で割った値
+    - regex: search_text と同じ mode でクエリがチャンク内にマッチするか（0/1）
+
+    regex モードの照合は search_text と同じく RegexSandbox で期限つきで行い、
+    期限を過ぎたら残りのチャンクは不一致として扱って打ち切りを True にする。
+    """
+    manual = req.manual_name
+    cfg = repo.settings.search
+    query = _nfkc(req.query)
+    table = repo.chunks.get(manual)
+    index = repo.vectors.get(manual)
+    q = index.encode_query(repo.vectors.embedder, query)
+
+    k = max(req.limit * 5, 50)
+    # 類似度が 0 以下の行は上位 k 件に入っていても候補にしない（クエリと共通の語が無い）
+    vector: Dict[str, float] = {index.chunk_ids[i]: s for i, s in index.top_k(q, k) if s > 0}
+    keyword: Dict[str, float] = {
+        make_chunk_id(d.section_id, d.chunk_no): s
+        for s, d in repo.bm25.rank(manual, query, "chunk", k)
+    }
+    keyword_max = max(keyword.values(), default=0.0) or 1.0
+
+    # search_text のヒット（章ごとの最初のマッチ）も候補に含める
+    text_hits, truncated = search_text(
+        repo,
+        SearchTextRequest(
+            manual_name=manual,
+            query=req.query,
+            mode=req.mode,
+            case_sensitive=req.case_sensitive,
+            limit=100,
+        ),
+    )
+    candidates = set(vector) | set(keyword) | {h.chunk_id for h in text_hits if h.chunk_id}
+    regex = compile_query(req.query, req.mode, req.case_sensitive)
+
+    rows: List[tuple] = []  # (chunk_id, チャンク, ToC エントリ, 章本文)
+    for cid in candidates:
+        ref = table.find(cid)
+        if ref is None:
+            continue
+        try:
+            entry = repo.get_entry(manual, ref.section_id)
+            sec = repo.read_section(manual, ref.section_id)
+        except SectionNotFound:
+            continue
+        rows.append((cid, ref, entry, sec))
+
+    # チャンクごとのクエリの一致位置。regex の実行期限を超えたパターンはチャンク単位でも走らせない
+    spans: Dict[str, Optional[Tuple[int, int]]] = {}
+    if not truncated:
+        if req.mode == "regex" and cfg.regex_sandbox:
+            # 期限は照合の直前から数える（索引の構築・候補集めの時間を含めない）
+            deadline = Deadline(cfg.regex_timeout)
+            truncated = _match_sandboxed(repo, regex.pattern, regex.flags, rows, deadline, spans)
+        else:
+            for cid, ref, _, sec in rows:
+                m = regex.search(sec.norm, ref.start, ref.end)
+                spans[cid] = m.span() if m else None
+
+    hits: List[HybridHit] = []
+    for cid, ref, entry, sec in rows:
+        v = vector.get(cid)
+        if v is None:
+            row = index.row_of(cid)
+            v = float(index.matrix[row] @ q) if row is not None else 0.0
+        kw = keyword.get(cid, 0.0) / keyword_max
+        span = spans.get(cid)
+        if v <= 0 and kw <= 0 and not span:
+            continue  # どの信号にも引っかからないチャンクは返さない
+
+        if span:
+            snippet = make_snippet(sec.norm, span[0], span[1])
+        else:
+            snippet = make_snippet(sec.norm[ref.start:ref.end], 0, 0, 160)
+        hits.append(
+            HybridHit(
+                section_id=ref.section_id,
+                chunk_id=cid,
+                title=entry.title,
+                score=round(req.vector_weight * v + req.keyword_weight * kw + req.regex_weight * (1.0 if span else 0.0), 4),
+                vector_score=round(v, 4),
+                keyword_score=round(kw, 4),
+                regex_match=span is not None,
+                snippet=snippet,
+            )
+        )
+
+    hits.sort(key=lambda h: (-h.score, h.chunk_id))
+    return hits[: req.limit], truncated
+
+
+def _match_sandboxed(repo: ManualRepository, pattern: str, flags: int, rows: List[tuple], deadline: Deadline,
+                     spans: Dict[str, Optional[Tuple[int, int]]]) -> bool:
+    """
+    チャンクの範囲ごとの pattern.search(本文, start, end) を RegexSandbox で行い spans に入れる。
+    本文は章ごとに 1 回だけ送る。期限を過ぎたら True（それまでの分は spans に残る）。
+    """
+    by_section: Dict[str, list] = {}
+    for cid, ref, _, sec in rows:
+        by_section.setdefault(sec.section_id, [sec, []])[1].append((cid, ref))
+    groups = list(by_section.values())
+    items = ((sec.norm, [(ref.start, ref.end) for _, ref in refs]) for sec, refs in groups)
+    results = repo.regex_sandbox.search_ranges(pattern, flags, items, deadline)
+    try:
+        for i, found in results:
+            for (cid, _), span in zip(groups[i][1], found):
+                spans[cid] = span
+    except TimeoutError:
+        return True
+    finally:
+        results.close()
+    return False
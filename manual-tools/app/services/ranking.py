@@ -0,0 +1,65 @@
+# app/services/ranking.py
+from __future__ import annotations
+
+import re
+from typing import List
+
+from app.schemas.search import RankedSearchRequest, RankedHit
+from app.core.text import SEP_CHAR_CLASS, make_snippet, normalize_text as _nfkc
+from app.indices.bm25 import Doc, term_counts
+from app.indices.chunks import make_chunk_id
+from app.repositories.manual import ManualRepository, SectionNotFound
+
+
+def _ranked_snippet(text: str, doc: Doc, terms: List[str], width: int = 80) -> str:
+    """
+    文書（章 or チャンク）内で、最も情報量の多い語（2-gram）の出現位置からスニペットを作る。
+    語は区切り除去済みなので、文字間の区切りを許容して探す。
+    """
+    for term in terms:
+        pattern = (SEP_CHAR_CLASS + "*").join(re.escape(ch) for ch in term)
+        m = re.compile(pattern, re.IGNORECASE).search(text, doc.start, doc.end)
+        if m:
+            left = max(doc.start, m.start() - width)
+            right = min(doc.end, m.end() + width)
+            prefix = "…" if left > doc.start else ""
+            suffix = "…" if right < doc.end else ""
+            return prefix + text[left:right].strip() + suffix
+    return make_snippet(text[doc.start:doc.end], 0, 0, width * 2)
+
+
+def search_ranked(repo: ManualRepository, req: RankedSearchRequest) -> List[RankedHit]:
+    """
+    /search_ranked のコアロジック。
+
+    章（またはチャンク）を BM25（文字 2-gram）でスコアリングし、スコア順に返す。
+    区切りを除いて 2 文字に満たないクエリは語が作れないので ValueError。
+    """
+    query = _nfkc(req.query)
+    if not term_counts(query):
+        raise ValueError("query must contain at least 2 characters (BM25 terms are character bigrams); use /search_text for single characters")
+    ranked = repo.bm25.rank(req.manual_name, query, req.level, req.limit)
+    if not ranked:
+        return []
+
+    stats = repo.bm25.get(req.manual_name)
+    level = stats.chunks if req.level == "chunk" else stats.sections
+    terms = sorted(term_counts(query), key=level.idf, reverse=True)
+
+    hits: List[RankedHit] = []
+    for score, doc in ranked:
+        try:
+            entry = repo.get_entry(req.manual_name, doc.section_id)
+            sec = repo.read_section(req.manual_name, doc.section_id)
+        except SectionNotFound:
+            continue
+        hits.append(
+            RankedHit(
+                section_id=doc.section_id,
+                title=entry.title,
+                score=round(score, 4),
+                snippet=_ranked_snippet(sec.norm, doc, terms),
+                chunk_id=make_chunk_id(doc.section_id, doc.chunk_no) if doc.chunk_no else None,
+            )
+        )
+    return hits
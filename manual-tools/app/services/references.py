@@ -0,0 +1,63 @@
+# app/services/references.py
+from __future__ import annotations
+
+from typing import List
+
+from app.indices.refs import RefEdge
+from app.repositories.manual import ManualRepository
+from app.schemas.manuals import (
+    GetReferencesResponse,
+    ReferenceEdge,
+    ResolveReferencesRequest,
+    ResolvedReference,
+)
+
+
+def _edge(depth: int, e: RefEdge) -> ReferenceEdge:
+    return ReferenceEdge(
+        source_manual=e.source[0],
+        source_section=e.source[1],
+        target_manual=e.target[0],
+        target_section=e.target[1],
+        ref_text=e.text,
+        line=e.line,
+        count=e.count,
+        depth=depth,
+    )
+
+
+def get_references(
+    repo: ManualRepository,
+    manual: str,
+    section_id: str,
+    depth: int = 1,
+    direction: str = "both",
+) -> GetReferencesResponse:
+    """
+    /get_references のコアロジック。章の参照先（outgoing）と参照元（incoming）を
+    参照グラフから depth 段までたどって返す（direction で片方だけにもできる）。
+    """
+    repo.get_entry(manual, section_id)  # 存在しない章は SectionNotFound
+    graph = repo.refs.get()
+    node = (manual, section_id)
+    outgoing: List[ReferenceEdge] = []
+    incoming: List[ReferenceEdge] = []
+    if direction in ("out", "both"):
+        outgoing = [_edge(d, e) for d, e in graph.walk(node, "out", depth)]
+    if direction in ("in", "both"):
+        incoming = [_edge(d, e) for d, e in graph.walk(node, "in", depth)]
+    return GetReferencesResponse(manual=manual, section_id=section_id, outgoing=outgoing, incoming=incoming)
+
+
+def resolve_references(repo: ManualRepository, req: ResolveReferencesRequest) -> List[ResolvedReference]:
+    """/resolve_references のコアロジック。別マニュアルを指す参照はそのマニュアルで解決する。"""
+    repo.load_toc(req.manual_name)  # 存在しないマニュアルは ManualNotFound
+    manuals = repo.list_manuals()  # 参照先になり得るマニュアル（ref_text ごとに列挙し直さない）
+    results: List[ResolvedReference] = []
+    for text in req.ref_texts:
+        target = repo.refs.resolve(req.manual_name, text, manuals)
+        if target is None:
+            results.append(ResolvedReference(ref_text=text))
+        else:
+            results.append(ResolvedReference(ref_text=text, target_manual=target[0], target_section=target[1]))
+    return results
@@ -1,70 +1,66 @@
 # app/services/search.py
 from __future__ import annotations
 
+import contextvars
+import logging
 import re
-import unicodedata
-from typing import Iterable, List, Tuple, Optional
+import sys
+import threading
+import time
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Collection, Dict, Iterable, Iterator, List, Pattern, Set, Optional, Tuple, TypeVar, Union
 
 from app.schemas.search import (
     SearchTextRequest,
+    SearchAllRequest,
+    MatchHit,
+    StreamTruncated,
     SearchHit,
     FindExceptionsRequest,
     ExceptionHit,
 )
-from app.repositories.manual import ManualRepository, SectionNotFound
+from app.core.fuzzy import best_match, effective_distance
+from app.core.text import SEP_CHAR_CLASS, fold_case, is_simple_case, make_snippet, normalize_text as _nfkc, strip_separators
+from app.core.metrics import ScanStats
+from app.core.sandbox import Deadline
+from app.indices.chunks import make_chunk_id
+from app.indices.corpus import compile_bytes_query
+from app.indices.ngram import index_key
+from app.repositories.cache import SectionText
+from app.repositories.manual import ManualRepository, SectionNotFound, TocLoadError
+
+log = logging.getLogger(__name__)
 
 # 許容する“区切り”の集合
 # 空白(\s) / 全角空白(\u3000) / 中点 / スラッシュ(全半角) / 各種ハイフン
-_SEP_CLASS = r"[\s\u3000・/／\-\u2010\u2011\u2012\u2013\u2014]*"
-
-
-def _nfkc(s: str) -> str:
-    """NFKC 正規化＋改行コード統一。"""
-    return unicodedata.normalize(
-        "NFKC",
-        s.replace("\r\n", "\n").replace("\r", "\n"),
-    )
+_SEP_CLASS = SEP_CHAR_CLASS + "*"
 
 
 def _iter_sections(
     repo: ManualRepository,
     manual: str,
     section_id: Optional[str],
-) -> Iterable[Tuple[str, str]]:
+    candidates: Optional[Collection[str]] = None,
+) -> Iterable[SectionText]:
     """
-    検索対象となる (section_id, 正規化済み本文) を順に返す。
+    検索対象となる章（正規化済み本文は .norm）を順に返す。
 
     - section_id が指定されていればその章のみ
     - 指定なしなら list_sections() の順に全章
+    - candidates を渡すと、それ以外の章は読まずに飛ばす
     """
     if section_id is not None:
         try:
-            sec = repo.get_section(manual, section_id)
+            sec = repo.read_section(manual, section_id)
         except SectionNotFound:
             # 存在しない場合は何も返さない
             return
-        yield section_id, _nfkc(sec["text"])
+        yield sec
         return
 
-    for sid in repo.list_sections(manual):
-        try:
-            sec = repo.get_section(manual, sid)
-        except SectionNotFound:
-            # ToC にはあるがファイルが無い章はスキップ
-            continue
-        yield sid, _nfkc(sec["text"])
-
-
-def _make_snippet(text: str, start: int, end: int, width: int = 80) -> str:
-    """
-    マッチ位置の前後 width 文字からスニペットを生成。
-    端が切れている場合は '…' を付与。
-    """
-    left = max(0, start - width)
-    right = min(len(text), end + width)
-    prefix = "…" if left > 0 else ""
-    suffix = "…" if right < len(text) else ""
-    return prefix + text[left:right].strip() + suffix
+    # ToC にはあるがファイルが無い章は iter_sections 側でスキップされる
+    yield from repo.iter_sections(manual, candidates)
 
 
 def _build_loose_regex(query: str) -> str:
@@ -80,94 +76,680 @@ def _build_loose_regex(query: str) -> str:
     return _SEP_CLASS.join(parts)
 
 
-def search_text(repo: ManualRepository, req: SearchTextRequest) -> List[SearchHit]:
+@lru_cache(maxsize=256)
+def _loose_key(query: str) -> Optional[Tuple[str, str]]:
+    """
+    loose クエリを影テキスト（SectionText.shadow）上の部分文字列検索にできるなら
+    (正規化済みクエリ, 影テキスト用のキー) を返す。できなければ None（正規表現で照合する）。
+
+    クエリ自体に区切り文字があると、正規表現ではその文字が本文に必要になるので対象外。
+    非 ASCII の大文字小文字は畳み込みが re.IGNORECASE と一致しない・前後の文字で変わる
+    （語末のシグマなど）ことがあるので、case_sensitive に関わらず対象外。
+    """
+    q = _nfkc(query)
+    if not q or strip_separators(q) != q or not is_simple_case(q):
+        return None
+    return q, fold_case(q)
+
+
+def _loose_finditer(sec: SectionText, loose: Tuple[str, str], case_sensitive: bool) -> Iterator[Tuple[int, int]]:
+    """
+    loose の正規表現（文字間に区切り *）の finditer と同じ位置を、影テキストの str.find で
+    (開始, 終了) として正規化済み本文上の位置で返す（重ならない出現を先頭から順に）。
+    """
+    q, key = loose
+    shadow, norm, at = sec.shadow, sec.norm, sec.from_shadow
+    n = len(key)
+    p = shadow.find(key)
+    while p >= 0:
+        # 影テキストは畳み込み済みなので、区別する場合は元の文字と突き合わせる
+        if not case_sensitive or all(norm[at(p + i)] == q[i] for i in range(n)):
+            yield at(p), at(p + n - 1) + 1
+            p = shadow.find(key, p + n)
+        else:
+            p = shadow.find(key, p + 1)
+
+
+def _candidate_sections(
+    repo: ManualRepository,
+    manual: str,
+    req: Union[SearchTextRequest, SearchAllRequest],
+    mode: str,
+) -> Optional[Set[str]]:
     """
-    /search_text のコアロジック。
+    n-gram 索引で走査対象の章を絞り込む。絞れない場合は None（全章を走査）。
+
+    - plain / loose のみ対象（regex は任意パターンなので絞れない）
+    - 候補はマッチし得る章の上位集合なので、最終判定は従来どおり正規表現で行う
     """
+    if req.section_id is not None or not repo.settings.search.use_ngram_index:
+        return None
+    if mode == "plain":
+        q = req.query
+    elif mode == "loose":
+        q = _nfkc(req.query)
+    else:
+        return None
+    # 非 ASCII の大文字小文字は re.IGNORECASE の畳み込みと一致しない場合がある
+    if not req.case_sensitive and not is_simple_case(q):
+        return None
+    return repo.ngrams.candidates(manual, index_key(q))
+
+
+def _query_flags(case_sensitive: bool) -> int:
     # 大文字小文字は日本語中心なのであまり影響しないが、一応フラグで制御
-    flags = 0 if getattr(req, "case_sensitive", False) else re.IGNORECASE
+    return 0 if case_sensitive else re.IGNORECASE
 
+
+@lru_cache(maxsize=256)
+def _compile_cached(query: str, flags: int, mode: str) -> Pattern[str]:
     # モードごとにパターン生成
-    mode = req.mode or "regex"
     if mode == "plain":
-        pattern = re.escape(req.query)
+        pattern = re.escape(query)
     elif mode == "loose":
-        pattern = _build_loose_regex(req.query)
+        pattern = _build_loose_regex(query)
     else:  # "regex"
-        pattern = req.query
+        pattern = query
 
     # 不正な正規表現 -> プレーン一致にフォールバック（仕様どおり）
     try:
-        regex = re.compile(pattern, flags)
+        return re.compile(pattern, flags)
     except re.error:
-        regex = re.compile(re.escape(req.query), flags)
+        return re.compile(re.escape(query), flags)
+
+
+def compile_query(query: str, mode: str, case_sensitive: bool = False) -> Pattern[str]:
+    """
+    search_text の mode（regex / plain / loose）に従ってクエリをコンパイルする。
+    結果は (query, flags, mode) をキーに LRU で保持する（loose の正規表現生成も省ける）。
+    """
+    return _compile_cached(query, _query_flags(case_sensitive), mode)
+
+
+_T = TypeVar("_T")
+
+# マニュアル横断検索用のスレッドプール（最初の横断検索で作る）
+_pool: Optional[ThreadPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(repo: ManualRepository) -> ThreadPoolExecutor:
+    """横断検索・一括取得（get_sections）で共用するスレッドプール。"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(
+                    max_workers=max(1, repo.settings.search.max_workers),
+                    thread_name_prefix="search",
+                )
+    return _pool
 
+
+def _corpus_wide(manual_name: Union[str, List[str], None]) -> bool:
+    """manual_name の省略（または空配列）で全マニュアルが対象か。"""
+    return manual_name is None or (isinstance(manual_name, list) and not manual_name)
+
+
+def _target_manuals(repo: ManualRepository, manual_name: Union[str, List[str], None]) -> List[str]:
+    if _corpus_wide(manual_name):
+        return repo.list_manuals()
+    if isinstance(manual_name, str):
+        return [manual_name]
+    return list(dict.fromkeys(manual_name))
+
+
+def _fan_out(
+    repo: ManualRepository,
+    manuals: List[str],
+    limit: int,
+    fn: Callable[[str, threading.Event], List[_T]],
+    skip_broken: bool = False,
+) -> List[_T]:
+    """
+    マニュアルごとの検索 fn(manual, cancel) をプールで並列に実行し、
+    マニュアル順に連結して limit 件に切り詰める。
+
+    先頭から完了済みのマニュアルだけで limit 件に達したら、それ以降の
+    マニュアルの cancel を立てて打ち切る（結果は逐次に検索した場合と同じ）。
+    skip_broken（manual_name 省略の全マニュアル検索）では、ToC が読めないマニュアルは
+    ログに残して 0 件として扱う（名指しされたマニュアルならエラーにする）。
+    """
+    if skip_broken:
+        fn = _skipping_broken(fn)
+    if len(manuals) == 1:
+        return fn(manuals[0], threading.Event())[:limit]
+
+    pool = get_pool(repo)
+    cancels = [threading.Event() for _ in manuals]
+    # リクエスト単位のフェーズ計測（app.core.profiling）をワーカースレッドにも引き継ぐ
+    futures = {pool.submit(contextvars.copy_context().run, fn, m, cancels[i]): i for i, m in enumerate(manuals)}
+    done: Dict[int, List[_T]] = {}
+
+    def prefix_satisfied() -> bool:
+        total = 0
+        for i in range(len(manuals)):
+            if i not in done:
+                return False
+            total += len(done[i])
+            if total >= limit:
+                return True
+        return False
+
+    try:
+        for fut in as_completed(futures):
+            done[futures[fut]] = fut.result()
+            if prefix_satisfied():
+                break
+    finally:
+        for ev in cancels:
+            ev.set()
+        for fut in futures:
+            fut.cancel()
+
+    merged: List[_T] = []
+    for i in range(len(manuals)):
+        if i not in done:
+            break
+        merged.extend(done[i])
+    return merged[:limit]
+
+
+def _skipping_broken(fn: Callable[[str, threading.Event], List[_T]]) -> Callable[[str, threading.Event], List[_T]]:
+    def run(manual: str, cancel: threading.Event) -> List[_T]:
+        try:
+            return fn(manual, cancel)
+        except TocLoadError as e:
+            log.warning(f"skipping manual with unreadable toc: manual={manual}: {e}")
+            return []
+    return run
+
+
+def _result_nbytes(hits: List[Any]) -> int:
+    """検索結果キャッシュの容量計算用の見積もり（ヒットのオブジェクトと文字列フィールドの合計）。"""
+    size = sys.getsizeof(hits)
+    for h in hits:
+        if isinstance(h, tuple):  # fuzzy は (距離, ヒット)
+            h = h[1]
+        size += sys.getsizeof(h) + sum(sys.getsizeof(v) for v in h.__dict__.values())
+    return size
+
+
+def _cached(
+    repo: ManualRepository,
+    manual: str,
+    key: Tuple[Any, ...],
+    cancel: threading.Event,
+    search: Callable[[], List[_T]],
+    incomplete: Optional[threading.Event] = None,
+) -> List[_T]:
+    """
+    マニュアル単位の検索 search() の結果を repo.results に載せる。
+
+    キーは (manual, マニュアルのバージョン) + key。バージョンは検索の前に読むので、検索中に
+    ファイルが変わっても古い結果が新しい版のものとして残ることはない。
+    打ち切られた結果（cancel 済み・incomplete が立った）は入れない。
+    """
+    cache = repo.results
+    if not cache.enabled:
+        return search()
+    full_key = (manual, repo.manual_version(manual)) + key
+    hits = cache.get(full_key)
+    if hits is not None:
+        return hits
+    hits = search()
+    if not cancel.is_set() and not (incomplete is not None and incomplete.is_set()):
+        cache.put(full_key, hits, _result_nbytes(hits))
+    return hits
+
+
+def _search_manual(
+    repo: ManualRepository,
+    manual: str,
+    req: SearchTextRequest,
+    regex: Pattern[str],
+    cancel: threading.Event,
+    stats: ScanStats,
+) -> List[SearchHit]:
+    mode = req.mode or "regex"
     results: List[SearchHit] = []
     limit = req.limit or 10
-
-    for sid, text in _iter_sections(repo, req.manual_name, req.section_id):
-        m = regex.search(text)
-        if not m:
+    candidates = _candidate_sections(repo, manual, req, mode)
+    # loose は区切りを除いた影テキストを str.find で探す（正規表現のバックトラックを避ける）
+    loose = _loose_key(req.query) if mode == "loose" else None
+
+    if loose is None and req.section_id is None and repo.settings.search.use_corpus:
+        hits = _search_manual_corpus(repo, manual, req, mode, candidates, cancel, stats)
+        if hits is not None:
+            return hits
+
+    scanned = 0
+    spent = 0.0
+    for sec in _iter_sections(repo, manual, req.section_id, candidates):
+        if cancel.is_set():
+            break
+        t = time.perf_counter()
+        if loose is not None:
+            span = next(_loose_finditer(sec, loose, req.case_sensitive), None)
+        else:
+            m = regex.search(sec.norm)
+            span = m.span() if m else None
+        spent += time.perf_counter() - t
+        scanned += 1
+        if span is None:
             continue
+        results.append(_make_hit(manual, sec, span[0], span[1]))
+        if len(results) >= limit:
+            break
+
+    stats.add(scanned, spent)
+    return results
 
-        snippet = _make_snippet(text, m.start(), m.end())
-        results.append(SearchHit(section_id=sid, snippet=snippet))
 
+def _search_manual_corpus(
+    repo: ManualRepository,
+    manual: str,
+    req: SearchTextRequest,
+    mode: str,
+    candidates: Optional[Set[str]],
+    cancel: threading.Event,
+    stats: ScanStats,
+) -> Optional[List[SearchHit]]:
+    """
+    plain / loose をコンパイル済みコーパス（mmap）に対する bytes の正規表現で走査する。
+    コーパスが無い・古い、または str の照合と結果が変わり得るクエリなら None。
+    """
+    corpus = repo.corpus.get(manual)
+    if corpus is None or not corpus.usable_for(req.query, req.case_sensitive):
+        return None
+    rx = compile_bytes_query(req.query, mode, req.case_sensitive)
+    if rx is None:
+        return None
+    results: List[SearchHit] = []
+    limit = req.limit or 10
+    for section_id, snippet, no in corpus.search_first(rx, candidates, stats):
+        if cancel.is_set():
+            break
+        results.append(SearchHit(
+            section_id=section_id,
+            snippet=snippet,
+            chunk_id=make_chunk_id(section_id, no) if no else None,
+            manual=manual,
+        ))
         if len(results) >= limit:
             break
-
     return results
 
 
-# 例外抽出用キーワード（必要に応じて拡張）
-_EXCEPTION_TERMS = [
-    r"留意",
-    r"注意",
-    r"例外",
-    r"対象外",
-    r"禁止",
-    r"適用しない",
-    r"支払われない",
-    r"支給されない",
-    r"不支給",
-    r"不適用",
-    r"除外",
-    r"取り扱わない",
-]
-_EXCEPTION_RE = re.compile("|".join(_EXCEPTION_TERMS))
+def _search_manual_sandboxed(
+    repo: ManualRepository,
+    manual: str,
+    req: SearchTextRequest,
+    regex: Pattern[str],
+    cancel: threading.Event,
+    deadline: Deadline,
+    timed_out: threading.Event,
+    stats: ScanStats,
+) -> List[SearchHit]:
+    """regex モード用。照合は RegexSandbox のワーカープロセスで行い、期限を過ぎたら打ち切る。"""
+    results: List[SearchHit] = []
+    limit = req.limit or 10
+    secs: List[SectionText] = []
+
+    def texts() -> Iterator[str]:
+        for sec in _iter_sections(repo, manual, req.section_id):
+            if cancel.is_set():
+                return
+            secs.append(sec)
+            yield sec.norm
 
+    started = time.perf_counter()
+    spans = repo.regex_sandbox.search_first(regex.pattern, regex.flags, texts(), deadline)
+    try:
+        for i, span in spans:
+            if span is None:
+                continue
+            results.append(_make_hit(manual, secs[i], span[0], span[1]))
+            if len(results) >= limit:
+                break
+    except TimeoutError:
+        timed_out.set()
+    finally:
+        spans.close()
+        # ワーカーとの送受信を含めた時間
+        stats.add(len(secs), time.perf_counter() - started)
 
-def find_exceptions(
+    return results
+
+
+def _search_manual_fuzzy(
     repo: ManualRepository,
-    req: FindExceptionsRequest,
-) -> List[ExceptionHit]:
+    manual: str,
+    req: SearchTextRequest,
+    query: str,
+    k: int,
+    fold: bool,
+    cancel: threading.Event,
+    stats: ScanStats,
+) -> List[Tuple[int, SearchHit]]:
     """
-    /find_exceptions のコアロジック。
+    fuzzy モード用。章ごとに最も近い一致を 1 件求め、(距離, ヒット) を距離・章の順に limit 件返す。
+    候補章は n-gram の共有数で絞り込む（距離 0 の章が limit 件そろえば残りは読まない）。
     """
-    hits: List[ExceptionHit] = []
     limit = req.limit or 10
+    candidates = None
+    if req.section_id is None and repo.settings.search.use_ngram_index:
+        candidates = repo.ngrams.fuzzy_candidates(manual, index_key(query), k)
+    found: List[Tuple[int, SearchHit]] = []
+    exact = 0
+    scanned = 0
+    spent = 0.0
+    for sec in _iter_sections(repo, manual, req.section_id, candidates):
+        if cancel.is_set():
+            break
+        t = time.perf_counter()
+        text = sec.norm
+        if fold:
+            folded = fold_case(text)
+            if len(folded) == len(text):  # 位置がずれる畳み込みは使わない
+                text = folded
+        m = best_match(text, query, k)
+        spent += time.perf_counter() - t
+        scanned += 1
+        if m is None:
+            continue
+        hit = _make_hit(manual, sec, m[1], m[2])
+        hit.distance = m[0]
+        found.append((m[0], hit))
+        if m[0] == 0:
+            exact += 1
+            if exact >= limit:
+                break
+
+    stats.add(scanned, spent)
+    found.sort(key=lambda x: x[0])  # 安定ソートなので同じ距離は章の順のまま
+    return found[:limit]
+
+
+def _search_text_fuzzy(repo: ManualRepository, req: SearchTextRequest, manuals: List[str]) -> List[SearchHit]:
+    query = _nfkc(req.query)
+    # クエリに大文字小文字の区別がある文字が無ければ、本文を畳み込んでも結果は変わらない
+    fold = not req.case_sensitive and any(c.lower() != c.upper() for c in query)
+    if fold:
+        query = fold_case(query)
+    cfg = repo.settings.search
+    k = effective_distance(query, cfg.fuzzy_max_distance if req.max_distance is None else req.max_distance)
+    limit = req.limit or 10
+    stats = ScanStats()
+    # マニュアルごとの上位 limit 件をすべて集めてから距離順に並べ直す
+    key = ("search_text", "fuzzy", query, k, fold, req.case_sensitive, req.section_id, limit)
+    per_manual = _fan_out(
+        repo,
+        manuals,
+        limit * len(manuals),
+        lambda m, cancel: _cached(
+            repo, m, key, cancel,
+            lambda: _search_manual_fuzzy(repo, m, req, query, k, fold, cancel, stats),
+        ),
+        skip_broken=_corpus_wide(req.manual_name),
+    )
+    stats.observe("search_text", "fuzzy")
+    per_manual.sort(key=lambda x: x[0])
+    return [hit for _, hit in per_manual[:limit]]
+
+
+def _make_hit(manual: str, sec: SectionText, start: int, end: int) -> SearchHit:
+    no = sec.chunk_of(start)
+    return SearchHit(
+        section_id=sec.section_id,
+        snippet=make_snippet(sec.norm, start, end),
+        chunk_id=make_chunk_id(sec.section_id, no) if no else None,
+        manual=manual,
+    )
+
+
+def search_text(repo: ManualRepository, req: SearchTextRequest) -> Tuple[List[SearchHit], bool]:
+    """
+    /search_text のコアロジック。(ヒット, 打ち切りの有無) を返す。
+
+    manual_name が省略または配列のときは、対象マニュアルを並列に検索して
+    マニュアル順に連結し、全体で limit 件までを返す。
+    regex モードは（search.regex_sandbox が有効なら）別プロセスで期限つきで実行し、
+    期限を過ぎた場合はそれまでのヒットを返して打ち切りを True にする。
+    fuzzy モードは章ごとに最も近い一致を求め、全体を編集距離の近い順に並べて返す。
+    """
+    mode = req.mode or "regex"
+    manuals = _target_manuals(repo, req.manual_name)
+    if mode == "fuzzy":
+        return _search_text_fuzzy(repo, req, manuals), False
+    regex = compile_query(req.query, mode, getattr(req, "case_sensitive", False))
+    cfg = repo.settings.search
+    stats = ScanStats()
+    # マニュアルごとの結果はキャッシュする（キーはリクエストのうち結果を左右する部分）
+    key = ("search_text", mode, req.query, req.case_sensitive, req.section_id, req.limit or 10)
+
+    if mode == "regex" and cfg.regex_sandbox:
+        deadline = Deadline(cfg.regex_timeout)
+        timed_out = threading.Event()
+        hits = _fan_out(
+            repo,
+            manuals,
+            req.limit or 10,
+            lambda m, cancel: _cached(
+                repo, m, key, cancel,
+                lambda: _search_manual_sandboxed(repo, m, req, regex, cancel, deadline, timed_out, stats),
+                incomplete=timed_out,
+            ),
+            skip_broken=_corpus_wide(req.manual_name),
+        )
+        stats.observe("search_text", mode)
+        return hits, timed_out.is_set()
+
+    hits = _fan_out(
+        repo,
+        manuals,
+        req.limit or 10,
+        lambda m, cancel: _cached(repo, m, key, cancel, lambda: _search_manual(repo, m, req, regex, cancel, stats)),
+        skip_broken=_corpus_wide(req.manual_name),
+    )
+    stats.observe("search_text", mode)
+    return hits, False
+
 
-    for sid, text in _iter_sections(repo, req.manual_name, req.section_id):
-        lines = text.split("\n")
+def iter_all_hits(repo: ManualRepository, req: SearchAllRequest) -> Iterator[Union[MatchHit, StreamTruncated]]:
+    """
+    /search_text_stream のコアロジック。章ごとの最初の 1 件ではなく、finditer で
+    すべての出現を走査順（マニュアル順 → ToC 順 → 出現位置順）に 1 件ずつ返す。
+
+    存在しないマニュアル・ToC が壊れた名指しのマニュアルは呼び出し時点で ManualNotFound /
+    TocLoadError を送出する（レスポンスのストリームを開始する前にエラーにできるように）。
+    manual_name 省略時は ToC が壊れたマニュアルを読み飛ばす。
+    regex モードは search_text と同じく RegexSandbox で期限つきで実行し、期限を過ぎたら
+    それまでのヒットの後に StreamTruncated を 1 件返して終える。
+    """
+    mode = req.mode or "regex"
+    regex = compile_query(req.query, mode, req.case_sensitive)
+    manuals = _target_manuals(repo, req.manual_name)
+    readable = []
+    for m in manuals:
+        try:
+            repo.load_toc(m)
+        except TocLoadError as e:
+            if not _corpus_wide(req.manual_name):
+                raise
+            log.warning(f"skipping manual with unreadable toc: manual={m}: {e}")
+            continue
+        readable.append(m)
+    return _iter_all_hits(repo, readable, req, regex)
 
-        for i, ln in enumerate(lines):
-            if not _EXCEPTION_RE.search(ln):
+
+def _all_spans(
+    repo: ManualRepository,
+    manual: str,
+    req: SearchAllRequest,
+    regex: Pattern[str],
+    stats: ScanStats,
+) -> Iterator[Tuple[SectionText, int, int]]:
+    """マニュアル内の空でない全出現を (章, 開始, 終了) で返す（リクエストスレッドで照合）。"""
+    mode = req.mode or "regex"
+    loose = _loose_key(req.query) if mode == "loose" else None
+    candidates = _candidate_sections(repo, manual, req, mode)
+    for sec in _iter_sections(repo, manual, req.section_id, candidates):
+        stats.sections += 1  # このジェネレータだけが触るのでロック不要
+        if loose is not None:
+            spans = _loose_finditer(sec, loose, req.case_sensitive)
+        else:
+            spans = (m.span() for m in regex.finditer(sec.norm))
+        while True:
+            t = time.perf_counter()
+            span = next(spans, None)
+            stats.seconds += time.perf_counter() - t
+            if span is None:
+                break
+            if span[0] == span[1]:
+                # 空マッチ（例: "a*"）は位置の列挙にしかならないので捨てる
                 continue
+            yield sec, span[0], span[1]
+
+
+def _all_spans_sandboxed(
+    repo: ManualRepository,
+    manual: str,
+    req: SearchAllRequest,
+    regex: Pattern[str],
+    deadline: Deadline,
+    limit: Optional[int],
+    stats: ScanStats,
+) -> Iterator[Tuple[SectionText, int, int]]:
+    """_all_spans の regex 版。照合は RegexSandbox で行い、期限を過ぎたら TimeoutError。"""
+    secs: List[SectionText] = []
+
+    def texts() -> Iterator[str]:
+        for sec in _iter_sections(repo, manual, req.section_id):
+            secs.append(sec)
+            yield sec.norm
+
+    results = repo.regex_sandbox.finditer(regex.pattern, regex.flags, texts(), deadline, limit)
+    try:
+        while True:
+            # ワーカーとの送受信を含めた時間（呼び出し側がヒットを送っている間は数えない）
+            t = time.perf_counter()
+            item = next(results, None)
+            stats.seconds += time.perf_counter() - t
+            if item is None:
+                break
+            i, spans = item
+            for start, end in spans:
+                yield secs[i], start, end
+    finally:
+        results.close()
+        stats.sections += len(secs)
+
+
+def _iter_all_hits(
+    repo: ManualRepository,
+    manuals: List[str],
+    req: SearchAllRequest,
+    regex: Pattern[str],
+) -> Iterator[Union[MatchHit, StreamTruncated]]:
+    mode = req.mode or "regex"
+    cfg = repo.settings.search
+    sandboxed = mode == "regex" and cfg.regex_sandbox
+    deadline = Deadline(cfg.regex_timeout)
+    remaining = req.max_hits
+    stats = ScanStats()
+    try:
+        for manual in manuals:
+            if sandboxed:
+                found = _all_spans_sandboxed(repo, manual, req, regex, deadline, remaining, stats)
+            else:
+                found = _all_spans(repo, manual, req, regex, stats)
+            for sec, start, end in found:
+                text = sec.norm
+                no = sec.chunk_of(start)
+                yield MatchHit(
+                    manual=manual,
+                    section_id=sec.section_id,
+                    line=sec.line_of(start),
+                    start=start,
+                    end=end,
+                    match=text[start:end],
+                    snippet=make_snippet(text, start, end),
+                    chunk_id=make_chunk_id(sec.section_id, no) if no else None,
+                )
+                if remaining is not None:
+                    remaining -= 1
+                    if remaining <= 0:
+                        return
+    except TimeoutError:
+        yield StreamTruncated()
+    finally:
+        # 途中で切断された場合もそこまでの分を記録する
+        stats.observe("search_text_stream", mode)
+
+
+def _find_exceptions_manual(
+    repo: ManualRepository,
+    manual: str,
+    req: FindExceptionsRequest,
+    cancel: threading.Event,
+    stats: ScanStats,
+) -> List[ExceptionHit]:
+    hits: List[ExceptionHit] = []
+    limit = req.limit or 10
+    terms = repo.exception_matcher.terms
+    scanned = 0
+    started = time.perf_counter()
 
+    for sec in _iter_sections(repo, manual, req.section_id):
+        if cancel.is_set():
+            break
+        scanned += 1
+        n_lines = len(sec.line_starts)
+
+        # 例外語を含む行は章の読み込み時に求めてある（SectionText.exc_lines）
+        for i, ti in zip(sec.exc_lines, sec.exc_terms):
             # 前後1行ずつを含めた文脈を生成
             ctx = []
             if i - 1 >= 0:
-                ctx.append(lines[i - 1].strip())
-            ctx.append(ln.strip())
-            if i + 1 < len(lines):
-                ctx.append(lines[i + 1].strip())
+                ctx.append(sec.line_text(i - 1).strip())
+            ctx.append(sec.line_text(i).strip())
+            if i + 1 < n_lines:
+                ctx.append(sec.line_text(i + 1).strip())
 
             snippet = " ".join([c for c in ctx if c])
             if not snippet:
                 continue
 
-            hits.append(ExceptionHit(section_id=sid, text=snippet))
+            hits.append(
+                ExceptionHit(section_id=sec.section_id, text=snippet, manual=manual, term=terms[ti], line=i + 1)
+            )
             if len(hits) >= limit:
-                return hits
+                break
+        if len(hits) >= limit:
+            break
+
+    # 照合は読み込み時に済んでいるので、時間は章の読み込みと文脈の組み立てを含む
+    stats.add(scanned, time.perf_counter() - started)
+    return hits
+
 
+def find_exceptions(
+    repo: ManualRepository,
+    req: FindExceptionsRequest,
+) -> List[ExceptionHit]:
+    """
+    /find_exceptions のコアロジック（manual_name の扱いは search_text と同じ）。
+    """
+    manuals = _target_manuals(repo, req.manual_name)
+    stats = ScanStats()
+    key = ("find_exceptions", req.section_id, req.limit or 10)
+    hits = _fan_out(
+        repo,
+        manuals,
+        req.limit or 10,
+        lambda m, cancel: _cached(repo, m, key, cancel, lambda: _find_exceptions_manual(repo, m, req, cancel, stats)),
+        skip_broken=_corpus_wide(req.manual_name),
+    )
+    stats.observe("find_exceptions", "terms")
     return hits
@@ -0,0 +1,188 @@
+# app/services/sections.py
+from __future__ import annotations
+
+import contextvars
+import hashlib
+import logging
+import re
+from bisect import bisect_right
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from app.schemas.manuals import GetSectionsRequest, SectionItem, SectionRange
+from app.repositories.cache import SectionText
+from app.repositories.manual import ManualRepository, ManualNotFound, SectionNotFound, TocLoadError
+from app.services.search import get_pool
+
+log = logging.getLogger(__name__)
+
+# 続きの取得用カーソル: "c1.<開始>.<終了>.<章ファイルの版>"（開始・終了は生テキスト上の文字位置）
+_CURSOR_RE = re.compile(r"^c1\.(\d+)\.(\d+)\.([0-9a-f]{8})$")
+
+
+def _version_tag(st: SectionText) -> str:
+    return hashlib.blake2b(repr(st.fp).encode("utf-8"), digest_size=4).hexdigest()
+
+
+def _decode_cursor(cursor: str, st: SectionText) -> Tuple[int, int]:
+    m = _CURSOR_RE.match(cursor)
+    if not m:
+        raise ValueError("invalid cursor")
+    if m.group(3) != _version_tag(st):
+        raise ValueError("cursor is stale (the section has changed); request the range again")
+    start, end = int(m.group(1)), int(m.group(2))
+    if not start <= end <= len(st.raw):
+        raise ValueError("invalid cursor")
+    return start, end
+
+
+def _select(repo: ManualRepository, manual: str, section_id: str, st: SectionText, rng: SectionRange) -> Tuple[int, int]:
+    """範囲指定を生テキスト上の文字位置 [start, end) にする（行頭位置・anchor の範囲は前計算済み）。"""
+    given = [
+        name for name, on in (
+            ("line range", rng.start_line is not None or rng.end_line is not None),
+            ("char range", rng.start_char is not None or rng.end_char is not None),
+            ("anchor", rng.anchor is not None),
+            ("cursor", rng.cursor is not None),
+        ) if on
+    ]
+    if len(given) > 1:
+        raise ValueError(f"specify only one of line range, char range, anchor or cursor (got {', '.join(given)})")
+
+    total = len(st.raw)
+    starts = st.raw_line_starts
+    n_lines = len(starts)
+
+    def line_start(i: int) -> int:  # 0 始まりの行 i の先頭（i == n_lines なら末尾）
+        return starts[i] if i < n_lines else total
+
+    if rng.cursor is not None:
+        return _decode_cursor(rng.cursor, st)
+    if rng.start_line is not None or rng.end_line is not None:
+        first = rng.start_line or 1
+        last = min(rng.end_line or n_lines, n_lines)
+        if first > n_lines:
+            raise ValueError(f"start_line {first} is beyond the last line ({n_lines})")
+        if first > last:
+            raise ValueError("start_line must not be greater than end_line")
+        return line_start(first - 1), line_start(last)
+    if rng.start_char is not None or rng.end_char is not None:
+        start = rng.start_char or 0
+        end = total if rng.end_char is None else min(rng.end_char, total)
+        if start > total:
+            raise ValueError(f"start_char {start} is beyond the end of the section ({total})")
+        if start > end:
+            raise ValueError("start_char must not be greater than end_char")
+        return start, end
+    if rng.anchor is not None:
+        ranges = repo.section_anchors(manual, section_id)
+        if rng.anchor not in ranges:
+            raise SectionNotFound(f"anchor '{rng.anchor}' not found in section '{section_id}'")
+        a, b = ranges[rng.anchor]
+        return line_start(a), line_start(b)
+    return 0, total
+
+
+def _cut(st: SectionText, start: int, end: int, max_chars: Optional[int]) -> int:
+    """max_chars に収まる終了位置。行の途中では切らない（1 行だけで超える場合を除く）。"""
+    if max_chars is None or end - start <= max_chars:
+        return end
+    limit = start + max_chars
+    cut = st.raw_line_starts[bisect_right(st.raw_line_starts, limit) - 1]
+    return cut if cut > start else limit
+
+
+def fetch_section(
+    repo: ManualRepository,
+    manual: str,
+    section_id: str,
+    rng: Optional[SectionRange] = None,
+) -> Dict[str, Any]:
+    """
+    /get_section の本体。タイトルは ToC の id→entry 索引から引く（ToC の線形走査はしない）。
+
+    rng を渡すと行範囲・文字範囲・anchor・カーソルのいずれかで本文の一部だけを返し、
+    max_chars を超える分は next_cursor で続きを取れるようにする。
+    範囲の指定が不正なら ValueError、anchor が見つからなければ SectionNotFound。
+    """
+    entry = repo.get_entry(manual, section_id)
+    st = repo.read_section(manual, section_id)
+    data: Dict[str, Any] = {
+        "manual": manual,
+        "section_id": section_id,
+        "title": entry.title,
+        "text": st.raw,
+        "file": st.file,
+        "encoding": "utf-8",
+        "id": st.section_id,
+    }
+    if rng is None or not rng.is_set():
+        return data
+
+    start, end = _select(repo, manual, section_id, st, rng)
+    cut = _cut(st, start, end, rng.max_chars)
+    data.update(
+        text=st.raw[start:cut],
+        start_char=start,
+        end_char=cut,
+        start_line=st.raw_line_of(start),
+        end_line=st.raw_line_of(max(start, cut - 1)),
+        total_chars=len(st.raw),
+        total_lines=len(st.raw_line_starts),
+        truncated=cut < end,
+        next_cursor=f"c1.{cut}.{end}.{_version_tag(st)}" if cut < end else None,
+    )
+    return data
+
+
+def _targets(req: GetSectionsRequest) -> List[Tuple[str, str]]:
+    targets = []
+    if req.section_ids:
+        if req.manual_name is None:
+            raise ValueError("manual_name is required with section_ids")
+        targets.extend((req.manual_name, sid) for sid in req.section_ids)
+    targets.extend((it.manual_name, it.section_id) for it in req.items)
+    return targets
+
+
+def _fetch_item(repo: ManualRepository, manual: str, section_id: str) -> SectionItem:
+    try:
+        data = fetch_section(repo, manual, section_id)
+    except (ManualNotFound, SectionNotFound) as e:
+        return SectionItem(manual=manual, section_id=section_id, ok=False, status=404, error=str(e))
+    except TocLoadError as e:
+        # ToC が壊れているマニュアルの項目だけを失敗にする
+        return SectionItem(manual=manual, section_id=section_id, ok=False, status=422, error=str(e))
+    except (OSError, UnicodeDecodeError) as e:
+        log.error(f"failed to read section: manual={manual} section_id={section_id}: {e}")
+        return SectionItem(manual=manual, section_id=section_id, ok=False, status=500, error=f"failed to read section: {e}")
+    data.pop("id")
+    return SectionItem(ok=True, **data)
+
+
+def iter_sections(repo: ManualRepository, req: GetSectionsRequest) -> Iterator[SectionItem]:
+    """
+    /get_sections のコアロジック。
+
+    本文の読み込みは検索と共有のスレッドプールで並行に行い、結果はリクエストの並び順で返す。
+    項目ごとのエラー（存在しないマニュアル・章は 404、ToC が壊れたマニュアルは 422、
+    読み込みの失敗は 500）は SectionItem の error / status に入れ、
+    リクエスト全体は失敗させない。指定の形が不正なら呼び出し時点で ValueError。
+    """
+    targets = _targets(req)
+    return _iter_fetched(repo, targets)
+
+
+def _iter_fetched(repo: ManualRepository, targets: List[Tuple[str, str]]) -> Iterator[SectionItem]:
+    if len(targets) <= 1:
+        for manual, sid in targets:
+            yield _fetch_item(repo, manual, sid)
+        return
+    pool = get_pool(repo)
+    futures = [pool.submit(contextvars.copy_context().run, _fetch_item, repo, manual, sid)
+               for manual, sid in targets]
+    try:
+        for fut in futures:
+            yield fut.result()
+    finally:
+        for fut in futures:
+            fut.cancel()
@@ -0,0 +1,125 @@
+"""
+ベンチマーク用の合成マニュアルを manuals_root 形式で書き出す。
+
+    python -m bench.gen_corpus /tmp/bench-manuals --manuals 2 --chapters 60 --paragraphs 40
+
+各マニュアルは 00_目次.json（children 付き）と章ファイルからなる。本文には
+全角/半角の英数字、区切り入りの語（"帝 王・切－開"）、例外語、章・別表への参照を混ぜる。
+同じ引数・seed なら同じ内容になる。
+"""
+from __future__ import annotations
+import argparse
+import json
+import random
+from pathlib import Path
+from typing import Dict, List
+
+from app.core.config import DEFAULT_EXCEPTION_TERMS
+
+_TOC_NAME = "00_目次.json"
+
+_WORDS = [
+    "給付金", "入院", "通院", "手術", "診断", "請求", "書類", "医師", "特約", "契約者",
+    "被保険者", "保険期間", "支払", "対象", "帝王切開", "先進医療", "放射線治療", "所定",
+    "責任開始日", "告知", "解約", "失効", "復活", "受取人", "診断書", "領収書", "日額",
+]
+_MIXED = ["ＡＢＣ１２３", "ABC123", "ＩＣＵ", "ICU", "１８０日", "180日", "Ｘ線", "X線", "ＭＲＩ検査", "MRI検査"]
+_SPLIT = ["帝 王・切－開", "先進 医療", "放射線／治療", "給付・金", "入－院"]
+_ROMAN = ["I", "II", "III", "IV", "V", "VI", "VII", "VIII"]
+_TITLES = ["入院", "手術", "通院", "先進医療", "診断", "請求手続", "支払事由", "免責", "特約", "用語"]
+
+
+def _sentence(rng: random.Random, chapters: int, tables: int) -> str:
+    body = "".join(rng.choice(_WORDS) for _ in range(rng.randint(4, 14)))
+    r = rng.random()
+    if r < 0.10:
+        body += f"。{rng.choice(_MIXED)} の場合"
+    elif r < 0.15:
+        body += f"。{rng.choice(_SPLIT)}について"
+    if rng.random() < 0.12:
+        body += f"。{rng.choice(DEFAULT_EXCEPTION_TERMS)}とする"
+    if rng.random() < 0.06:
+        body += f"。第{rng.randint(1, chapters)}章を参照"
+    elif rng.random() < 0.04 and tables:
+        body += f"。別表{rng.randint(1, tables)}を参照"
+    return body + "。"
+
+
+def _chapter_text(rng: random.Random, paragraphs: int, children: List[Dict], chapters: int, tables: int) -> str:
+    lines: List[str] = []
+    heads = [c["label"] for c in children] or [""]
+    per_head = max(1, paragraphs // len(heads))
+    for head in heads:
+        if head:
+            lines.append(head)
+        for _ in range(per_head):
+            for _ in range(rng.randint(1, 4)):
+                lines.append(_sentence(rng, chapters, tables))
+            lines.append("")
+    return "\n".join(lines)
+
+
+def _children(rng: random.Random) -> List[Dict]:
+    children: List[Dict] = [{"anchor": "PRE", "label": "前文"}]
+    for roman in _ROMAN[: rng.randint(1, 5)]:
+        items = [{"n": i, "label": rng.choice(_WORDS)} for i in range(1, rng.randint(1, 6) + 1)]
+        children.append({"anchor": roman, "label": f"{roman} {rng.choice(_TITLES)}", "items": items})
+    return children
+
+
+def generate_manual(root: Path, name: str, chapters: int, paragraphs: int, tables: int, seed: int) -> int:
+    """1 マニュアル分を書き出し、本文の総文字数を返す。"""
+    rng = random.Random(f"{seed}:{name}")
+    d = root / name
+    d.mkdir(parents=True, exist_ok=True)
+    toc: List[Dict] = []
+    total = 0
+    n = 1
+    while len(toc) < chapters:
+        subs = rng.choice([0, 0, 0, 2, 3])  # 第N章-M に分かれる章も混ぜる
+        for m in range(1, subs + 1) if subs else [0]:
+            sid = f"{n:02d}-{m}" if m else f"{n:02d}"
+            title = f"第{n}章-{m} {rng.choice(_TITLES)}" if m else f"第{n}章 {rng.choice(_TITLES)}"
+            toc.append({"id": sid, "title": title, "file": f"{sid}_章{n}.txt",
+                        "children": _children(rng) if rng.random() < 0.7 else None})
+        n += 1
+    toc = toc[:chapters]
+    for t in range(1, tables + 1):
+        sid = f"T{t:02d}"
+        toc.append({"id": sid, "title": f"別表{t} {rng.choice(_TITLES)}一覧", "file": f"{sid}_別表{t}.txt",
+                    "children": None})
+    for e in toc:
+        text = _chapter_text(rng, paragraphs, e["children"] or [], n - 1, tables)
+        (d / e["file"]).write_text(text, encoding="utf-8")
+        total += len(text)
+    (d / _TOC_NAME).write_text(json.dumps({"manual": name, "toc": toc}, ensure_ascii=False, indent=1),
+                               encoding="utf-8")
+    return total
+
+
+def generate(root: Path, manuals: int = 2, chapters: int = 30, paragraphs: int = 20,
+             tables: int = 2, seed: int = 0) -> Dict[str, int]:
+    """manuals_root に manuals 個のマニュアルを書き出し、{マニュアル名: 総文字数} を返す。"""
+    root.mkdir(parents=True, exist_ok=True)
+    return {
+        name: generate_manual(root, name, chapters, paragraphs, tables, seed)
+        for name in (f"合成{i + 1:02d}編" for i in range(manuals))
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="ベンチマーク用の合成マニュアルを生成する")
+    parser.add_argument("root", type=Path, help="書き出し先（manuals_root）")
+    parser.add_argument("--manuals", type=int, default=2)
+    parser.add_argument("--chapters", type=int, default=30, help="1 マニュアルあたりの章数（別表を除く）")
+    parser.add_argument("--paragraphs", type=int, default=20, help="1 章あたりの段落数")
+    parser.add_argument("--tables", type=int, default=2, help="1 マニュアルあたりの別表の数")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    sizes = generate(args.root, args.manuals, args.chapters, args.paragraphs, args.tables, args.seed)
+    for name, chars in sizes.items():
+        print(f"{name}: chars={chars}")
+
+
+if __name__ == "__main__":
+    main()
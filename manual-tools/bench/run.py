@@ -0,0 +1,288 @@
+"""
+エンドポイント別のレイテンシ計測。
+
+    python -m bench.run --scale 10 --out bench-10x.json
+    python -m bench.run --compare bench-before.json bench-after.json
+
+合成マニュアル（bench.gen_corpus）を一時ディレクトリに作り、それを manuals_root とする
+設定ファイルを MANUAL_TOOLS_CONFIG で渡して、FastAPI アプリをプロセス内で
+TestClient（httpx）から叩く。ケースごとに p50 / p95 / p99・スループット・ピーク RSS を出す。
+
+- warm: 数回の空打ちの後に --iterations 回連続で計測（キャッシュが温まった状態）
+- cold: 毎回 /reload_config でリポジトリを作り直してから 1 回計測（ToC・章本文・索引の
+  メモリ上のキャッシュが空の状態。ディスク上の索引と OS のページキャッシュは残る）
+"""
+from __future__ import annotations
+import argparse
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:  # resource は Unix のみ
+    import resource
+except ImportError:  # pragma: no cover - only hit on Windows
+    resource = None  # type: ignore[assignment]
+
+import yaml
+
+from bench.gen_corpus import _SPLIT, _WORDS, generate
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# ベースライン（scale=1）は manuals/ のサンプルと同程度の大きさ
+_BASE_CHAPTERS = 7
+_BASE_PARAGRAPHS = 20
+
+Request = Tuple[str, str, Dict[str, Any]]  # (method, path, httpx の引数)
+
+
+@dataclass
+class Case:
+    name: str
+    endpoint: str
+    mode: Optional[str]
+    make: Callable[[random.Random, "Corpus"], Request]
+
+
+@dataclass
+class Corpus:
+    manuals: List[str]
+    sections: Dict[str, List[str]]
+
+    def pick(self, rng: random.Random) -> Tuple[str, str]:
+        m = rng.choice(self.manuals)
+        return m, rng.choice(self.sections[m])
+
+
+def _search(mode: str, all_manuals: bool = False) -> Callable[[random.Random, Corpus], Request]:
+    def make(rng: random.Random, c: Corpus) -> Request:
+        if mode == "regex":
+            query = rng.choice([r"第\d+章(-\d+)?を参照", r"(ICU|ＩＣＵ)", rf"{rng.choice(_WORDS)}.{{0,10}}とする"])
+        elif mode == "loose":
+            query = rng.choice(_SPLIT).replace(" ", "").replace("・", "").replace("－", "").replace("／", "")
+        elif mode == "fuzzy":
+            # 1 文字だけ違う語（異体字・送り仮名の揺れの代わり）
+            word = rng.choice([w for w in _WORDS if len(w) >= 3])
+            i = rng.randrange(len(word))
+            query = word[:i] + rng.choice("のを一") + word[i + 1:]
+        else:
+            query = rng.choice(_WORDS)
+        body: Dict[str, Any] = {"query": query, "mode": mode, "limit": 20}
+        if not all_manuals:
+            body["manual_name"] = rng.choice(c.manuals)
+        return "POST", "/search_text", {"json": body}
+    return make
+
+
+CASES: List[Case] = [
+    Case("get_toc", "/get_toc", None,
+         lambda rng, c: ("GET", "/get_toc", {"params": {"manual_name": rng.choice(c.manuals), "hierarchical": True}})),
+    Case("list_sections", "/list_sections", None,
+         lambda rng, c: ("GET", "/list_sections", {"params": {"manual_name": rng.choice(c.manuals)}})),
+    Case("get_section", "/get_section", None,
+         lambda rng, c: ("GET", "/get_section", {"params": dict(zip(("manual_name", "section_id"), c.pick(rng)))})),
+    Case("get_sections", "/get_sections", None,
+         lambda rng, c: ("POST", "/get_sections", {"json": {"items": [
+             dict(zip(("manual_name", "section_id"), c.pick(rng))) for _ in range(10)]}})),
+    Case("search_text.plain", "/search_text", "plain", _search("plain")),
+    Case("search_text.loose", "/search_text", "loose", _search("loose")),
+    Case("search_text.regex", "/search_text", "regex", _search("regex")),
+    Case("search_text.fuzzy", "/search_text", "fuzzy", _search("fuzzy")),
+    Case("search_text.plain.all", "/search_text", "plain", _search("plain", all_manuals=True)),
+    Case("search_text_stream.plain", "/search_text_stream", "plain",
+         lambda rng, c: ("POST", "/search_text_stream", {"json": {
+             "manual_name": rng.choice(c.manuals), "query": rng.choice(_WORDS), "mode": "plain", "max_hits": 200}})),
+    Case("find_exceptions", "/find_exceptions", None,
+         lambda rng, c: ("POST", "/find_exceptions", {"json": {"manual_name": rng.choice(c.manuals)}})),
+    Case("search_ranked", "/search_ranked", None,
+         lambda rng, c: ("POST", "/search_ranked", {"json": {
+             "manual_name": rng.choice(c.manuals), "query": rng.choice(_WORDS) + rng.choice(_WORDS)}})),
+    Case("search_hybrid", "/search_hybrid", "loose",
+         lambda rng, c: ("POST", "/search_hybrid", {"json": {
+             "manual_name": rng.choice(c.manuals), "query": rng.choice(_WORDS)}})),
+    Case("get_references", "/get_references", None,
+         lambda rng, c: ("GET", "/get_references", {"params": {
+             **dict(zip(("manual_name", "section_id"), c.pick(rng))), "depth": 2}})),
+]
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(kb / 1024 / (1024 if sys.platform == "darwin" else 1), 1)  # macOS はバイト単位
+
+
+def _summary(name: str, case: Case, scenario: str, lat: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    ms = sorted(x * 1000 for x in lat)
+    q = statistics.quantiles(ms, n=100, method="inclusive") if len(ms) > 1 else ms * 99
+    return {
+        "case": name,
+        "endpoint": case.endpoint,
+        "mode": case.mode,
+        "scenario": scenario,
+        "n": len(ms),
+        "errors": errors,
+        "p50_ms": round(q[49], 3),
+        "p95_ms": round(q[94], 3),
+        "p99_ms": round(q[98], 3),
+        "mean_ms": round(statistics.fmean(ms), 3),
+        "max_ms": round(ms[-1], 3),
+        "throughput_rps": round(len(ms) / elapsed, 1) if elapsed > 0 else None,
+        "peak_rss_mb": _peak_rss_mb(),  # プロセス全体の最大値（それまでのケースを含む）
+    }
+
+
+def _call(client, req: Request) -> Tuple[float, bool]:
+    method, path, kwargs = req
+    t = time.perf_counter()
+    r = client.request(method, path, **kwargs)
+    r.read()
+    return time.perf_counter() - t, r.status_code < 400
+
+
+def _run_case(client, case: Case, corpus: Corpus, scenario: str, iterations: int, seed: int) -> Dict[str, Any]:
+    rng = random.Random(f"{seed}:{case.name}")
+    lat: List[float] = []
+    errors = 0
+    if scenario == "warm":
+        for _ in range(min(5, iterations)):
+            _call(client, case.make(rng, corpus))
+    started = time.perf_counter()
+    for _ in range(iterations):
+        if scenario == "cold":
+            client.post("/reload_config")
+        req = case.make(rng, corpus)
+        dt, ok = _call(client, req)
+        lat.append(dt)
+        errors += 0 if ok else 1
+    # cold はリポジトリの作り直しを除いた時間でスループットを出す
+    elapsed = sum(lat) if scenario == "cold" else time.perf_counter() - started
+    return _summary(case.name, case, scenario, lat, errors, elapsed)
+
+
+def _write_config(workdir: Path, manuals_root: Path) -> Path:
+    with open(PROJECT_ROOT / "config.yaml", "r", encoding="utf-8") as f:
+        data = yaml.safe_load(f) or {}
+    data["manuals_root"] = str(manuals_root)
+    data.setdefault("paths", {})["indices_dir"] = str(workdir / "indices")
+    # cold シナリオで ToC を毎回読み直すため、起動時の先読み・スナップショットは使わない
+    data["startup"] = {**data.get("startup", {}), "warmup": False, "snapshot": False}
+    data.setdefault("logging", {})["level"] = "WARNING"
+    path = workdir / "config.yaml"
+    with open(path, "w", encoding="utf-8") as f:
+        yaml.safe_dump(data, f, allow_unicode=True)
+    return path
+
+
+def _git_revision() -> Optional[str]:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                             capture_output=True, text=True, timeout=5)
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    workdir = Path(args.workdir or tempfile.mkdtemp(prefix="manual-tools-bench-"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    if args.manuals_root:
+        manuals_root = Path(args.manuals_root).resolve()
+        sizes: Dict[str, int] = {}
+    else:
+        manuals_root = workdir / "manuals"
+        sizes = generate(manuals_root, args.manuals, _BASE_CHAPTERS * args.scale, _BASE_PARAGRAPHS,
+                         max(1, args.scale // 10), args.seed)
+    os.environ["MANUAL_TOOLS_CONFIG"] = str(_write_config(workdir, manuals_root))
+
+    # 設定の差し替え後に読み込む（app.main は import 時に設定を読む）
+    from fastapi.testclient import TestClient
+    from app.main import app
+
+    cases = [c for c in CASES if not args.only or any(c.name.startswith(o) for o in args.only)]
+    scenarios = ["cold", "warm"] if args.scenario == "both" else [args.scenario]
+    results: List[Dict[str, Any]] = []
+    with TestClient(app) as client:
+        manuals = client.get("/list_manuals").json()
+        corpus = Corpus(manuals, {m: client.get("/list_sections", params={"manual_name": m}).json()["sections"]
+                                  for m in manuals})
+        for scenario in scenarios:
+            n = args.cold_iterations if scenario == "cold" else args.iterations
+            for case in cases:
+                res = _run_case(client, case, corpus, scenario, n, args.seed)
+                results.append(res)
+                print(f"{scenario:4} {case.name:26} p50={res['p50_ms']:9.3f}ms p95={res['p95_ms']:9.3f}ms "
+                      f"p99={res['p99_ms']:9.3f}ms {res['throughput_rps']}/s errors={res['errors']}",
+                      file=sys.stderr)
+
+    return {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": args.scale,
+            "manuals_root": str(manuals_root),
+            "corpus_chars": sizes,
+            "iterations": args.iterations,
+            "cold_iterations": args.cold_iterations,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+
+
+def compare(before_path: str, after_path: str) -> None:
+    """2 つの結果ファイルの p50 / p95 / p99 を並べて比を出す。"""
+    def load(p: str) -> Dict[Tuple[str, str], Dict[str, Any]]:
+        with open(p, "r", encoding="utf-8") as f:
+            return {(r["scenario"], r["case"]): r for r in json.load(f)["results"]}
+    before, after = load(before_path), load(after_path)
+    print(f"{'scenario':8} {'case':26} {'p50 before→after':>24} {'p95 ratio':>10} {'p99 ratio':>10}")
+    def ratio(b: Dict[str, Any], a: Dict[str, Any], k: str) -> str:
+        return f"{a[k] / b[k]:.2f}x" if b[k] else "-"
+
+    for key in sorted(before.keys() & after.keys()):
+        b, a = before[key], after[key]
+        print(f"{key[0]:8} {key[1]:26} {b['p50_ms']:10.3f}→{a['p50_ms']:10.3f}ms "
+              f"{ratio(b, a, 'p95_ms'):>10} {ratio(b, a, 'p99_ms'):>10}")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="manual-tools のエンドポイント別ベンチマーク")
+    parser.add_argument("--scale", type=int, default=1, help="章数の倍率（1 = サンプルマニュアル程度）")
+    parser.add_argument("--manuals", type=int, default=2, help="生成するマニュアル数")
+    parser.add_argument("--manuals-root", help="生成せずに既存の manuals_root を使う")
+    parser.add_argument("--workdir", help="生成物・索引・設定の置き場（省略時は一時ディレクトリ）")
+    parser.add_argument("--iterations", type=int, default=200, help="warm シナリオの計測回数")
+    parser.add_argument("--cold-iterations", type=int, default=10, help="cold シナリオの計測回数")
+    parser.add_argument("--scenario", choices=["cold", "warm", "both"], default="both")
+    parser.add_argument("--only", action="append", help="ケース名の前方一致で絞り込む（複数指定可）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="結果 JSON の出力先（省略時は標準出力）")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="2 つの結果 JSON を比較する")
+    args = parser.parse_args()
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run(args)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        Path(args.out).write_text(text + "\n", encoding="utf-8")
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""best_match を全部分文字列の編集距離を数える素朴な実装と突き合わせる。"""
+from __future__ import annotations
+import random
+from typing import Optional
+
+from app.core.fuzzy import FuzzyMatch, best_match, effective_distance
+
+
+def _levenshtein(a: str, b: str) -> int:
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+        prev = cur
+    return prev[-1]
+
+
+def _oracle(text: str, query: str, k: int) -> Optional[FuzzyMatch]:
+    """距離 k 以内の部分文字列のうち (距離, 開始, 終了) が最小のもの。"""
+    m = len(query)
+    best: Optional[FuzzyMatch] = None
+    for s in range(len(text) + 1):
+        for e in range(s + max(0, m - k), min(len(text), s + m + k) + 1):
+            d = _levenshtein(text[s:e], query)
+            if d <= k and (best is None or (d, s, e) < best):
+                best = (d, s, e)
+    return best
+
+
+def test_exact_match_wins():
+    assert best_match("入院給付金と入院", "入院", 0) == (0, 0, 2)
+    assert best_match("通院給付金と入院給付金", "入院給付金", 1) == (0, 6, 11)
+
+
+def test_single_edits():
+    text = "手術給付金の支払"
+    assert best_match(text, "手術給全金", 1) == (1, 0, 5)  # 置換
+    assert best_match(text, "手術付金", 1) == (1, 0, 5)  # 本文側に余分な 1 文字
+    assert best_match(text, "手術給x付金", 1) == (1, 0, 5)  # クエリ側に余分な 1 文字
+
+
+def test_window_extends_past_query_length():
+    # 残った断片が先頭の abc だけで、一致の終わりは abc の位置 + len(query) + k
+    assert best_match("xxabcdXefxx", "abcdef", 1) == (1, 2, 9)
+
+
+def test_no_match_within_distance():
+    assert best_match("入院給付金", "通院手当", 1) is None
+    assert best_match("入院", "", 1) is None
+
+
+def test_random_against_oracle():
+    rng = random.Random(0)
+    for _ in range(3000):
+        alphabet = rng.choice(["ab", "abc", "abcd", "入院給付金"])
+        query = "".join(rng.choice(alphabet) for _ in range(rng.randint(1, 8)))
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+        if rng.random() < 0.3 and len(text) > len(query):
+            # 一部を書き換えたクエリを埋め込み、近い一致がある場合も十分に含める
+            noisy = list(query)
+            for _ in range(rng.randint(0, 2)):
+                noisy[rng.randrange(len(noisy))] = rng.choice(alphabet)
+            p = rng.randrange(len(text) - len(query) + 1)
+            text = text[:p] + "".join(noisy) + text[p + len(noisy):]
+        k = effective_distance(query, rng.randint(0, 3))
+        assert best_match(text, query, k) == _oracle(text, query, k), (text, query, k)
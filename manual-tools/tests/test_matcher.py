@@ -0,0 +1,77 @@
+"""KeywordMatcher（Aho-Corasick）を素朴な全出現列挙と突き合わせる。"""
+from __future__ import annotations
+import random
+from typing import List, Set, Tuple
+
+from app.core.matcher import KeywordMatcher
+
+
+def _found(m: KeywordMatcher, text: str) -> Set[Tuple[int, int, str]]:
+    return {(s, e, m.terms[ti]) for s, e, ti in m.finditer(text)}
+
+
+def _brute(terms: List[str], text: str) -> Set[Tuple[int, int, str]]:
+    hits = set()
+    for t in terms:
+        if not t:
+            continue
+        i = text.find(t)
+        while i >= 0:
+            hits.add((i, i + len(t), t))
+            i = text.find(t, i + 1)
+    return hits
+
+
+def test_overlapping_terms():
+    m = KeywordMatcher(["ab", "bc", "abc", "c"])
+    assert _found(m, "abcd") == {(0, 2, "ab"), (1, 3, "bc"), (0, 3, "abc"), (2, 3, "c")}
+
+
+def test_repeated_overlapping_occurrences():
+    m = KeywordMatcher(["aa", "aaa"])
+    assert _found(m, "aaaa") == {(0, 2, "aa"), (1, 3, "aa"), (2, 4, "aa"), (0, 3, "aaa"), (1, 4, "aaa")}
+
+
+def test_shared_suffixes():
+    # he は she の接尾辞（失敗遷移先の出力の引き継ぎ）で、hers の接頭辞でもある
+    m = KeywordMatcher(["he", "she", "his", "hers"])
+    assert _found(m, "ushers") == {(1, 4, "she"), (2, 4, "he"), (2, 6, "hers")}
+
+
+def test_shared_suffixes_japanese():
+    m = KeywordMatcher(["ただし", "し", "除く", "を除く"])
+    assert _found(m, "ただし、次の場合を除く。") == {
+        (0, 3, "ただし"), (2, 3, "し"), (9, 11, "除く"), (8, 11, "を除く"),
+    }
+
+
+def test_failure_transition_into_longer_term():
+    # "abcx" で失敗したあと、"bcd" の途中から続けられること
+    m = KeywordMatcher(["abcx", "bcd"])
+    assert _found(m, "abcd") == {(1, 4, "bcd")}
+
+
+def test_ends_ascending():
+    m = KeywordMatcher(["入院", "院", "給付金", "入院給付金", "金"])
+    ends = [e for _, e, _ in m.finditer("入院給付金と入院")]
+    assert ends == sorted(ends)
+
+
+def test_dedupe_and_empty_terms():
+    m = KeywordMatcher(["", "免責", "免責", ""])
+    assert m.terms == ["免責"]
+    assert len(m) == 1
+    assert list(KeywordMatcher([]).finditer("免責")) == []
+    assert list(KeywordMatcher([""]).finditer("")) == []
+
+
+def test_random_against_brute_force():
+    rng = random.Random(0)
+    for _ in range(500):
+        alphabet = "abc" if rng.random() < 0.5 else "abcdあい"
+        terms = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))) for _ in range(rng.randint(1, 8))]
+        text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+        m = KeywordMatcher(terms)
+        got = list(m.finditer(text))
+        assert len(got) == len(set(got))  # 同じ出現を 2 度返さない
+        assert _found(m, text) == _brute(terms, text)
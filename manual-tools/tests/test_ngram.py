@@ -0,0 +1,206 @@
+"""n-gram 索引の差分区画と併合（NgramIndex / NgramIndexStore）。"""
+from __future__ import annotations
+import json
+import random
+from pathlib import Path
+from typing import Dict, Optional
+
+import pytest
+
+from app.core.config import PathsConfig, SearchConfig, Settings, StartupConfig, TocConfig, WatchConfig
+from app.core.text import normalize_text
+from app.indices.ngram import NgramIndex, Signature, index_key
+from app.repositories.manual import ManualRepository
+
+MANUAL = "テスト編"
+
+
+def _signature(texts: Dict[str, Optional[str]]) -> Signature:
+    # 指紋は内容が変わったときに変われば足りるので、(長さ, ハッシュ, 0) で代用する。None はファイル無し
+    return [
+        (sid, f"{sid}.txt", (len(t), hash(t), 0) if t is not None else None)
+        for sid, t in texts.items()
+    ]
+
+
+def _build(texts: Dict[str, Optional[str]]) -> NgramIndex:
+    sig = _signature(texts)
+    return NgramIndex.build(MANUAL, sig, ((i, t) for i, t in enumerate(texts.values()) if t is not None))
+
+
+def _delta(idx: NgramIndex, texts: Dict[str, Optional[str]]) -> NgramIndex:
+    """変わった章だけを差分区画にする（NgramIndexStore._update と同じ手順）。"""
+    sig = _signature(texts)
+    changed = set(idx.changed_sections(sig))
+    return idx.with_delta(sig, [(sid, t) for sid, t in texts.items() if sid in changed and t is not None])
+
+
+def _contains(texts: Dict[str, Optional[str]], key: str) -> set:
+    return {sid for sid, t in texts.items() if t is not None and key in index_key(t)}
+
+
+BASE = {
+    "01": "入院給付金の支払について定める。",
+    "02": "手術給付金は対象となる手術を受けたときに支払う。",
+    "03": "通院給付金は退院後の通院に限る。",
+}
+
+
+def test_delta_edit_replaces_old_postings():
+    idx = _build(BASE)
+    texts = dict(BASE, **{"02": "帝王切開は対象外とする。"})
+    idx = _delta(idx, texts)
+
+    assert len(idx.segments) == 2
+    assert idx.delta_sections == 1
+    # 古い区画に残った 02 の postings は読み飛ばされる
+    assert idx.candidates(index_key("手術給付金")) == set()
+    assert idx.candidates(index_key("帝王切開")) == {"02"}
+    assert idx.candidates(index_key("給付金")) == {"01", "03"}
+
+
+def test_delta_add_and_delete():
+    idx = _build(BASE)
+    texts = dict(BASE, **{"04": "特約の解約について。"})
+    del texts["03"]
+    idx = _delta(idx, texts)
+
+    assert idx.candidates(index_key("特約の解約")) == {"04"}
+    assert idx.candidates(index_key("通院給付金")) == set()
+    assert idx.fuzzy_candidates(index_key("退院後の通院"), 1) == set()
+    assert "03" not in idx.live
+
+
+def test_delta_missing_file_drops_section():
+    idx = _build(BASE)
+    texts = dict(BASE, **{"03": None})  # ToC にはあるがファイルが無い
+    idx = _delta(idx, texts)
+    assert idx.candidates(index_key("通院")) == set()
+
+
+def test_compacted_matches_fresh_build():
+    idx = _build(BASE)
+    texts = dict(BASE)
+    texts["02"] = "帝王切開は対象外とする。"
+    idx = _delta(idx, texts)
+    texts["05"] = "契約者は請求書類を提出する。"
+    texts["01"] = "入院給付金の支払について定める（改定）。"
+    idx = _delta(idx, texts)
+    assert len(idx.segments) == 3
+
+    merged = idx.compacted()
+    fresh = _build(texts)
+    assert len(merged.segments) == 1
+    assert merged.delta_sections == 0
+    assert merged.signature == fresh.signature
+    assert merged.segments[0].postings == fresh.segments[0].postings
+    assert merged.live == fresh.live
+
+
+def test_compacted_save_load_round_trip(tmp_path: Path):
+    idx = _delta(_build(BASE), dict(BASE, **{"02": "帝王切開は対象外とする。"})).compacted()
+    path = tmp_path / MANUAL / "ngram.json"
+    idx.save(path)
+    loaded = NgramIndex.load(path)
+
+    assert loaded is not None
+    assert loaded.signature == idx.signature
+    assert loaded.segments[0].postings == idx.segments[0].postings
+    assert [p.name for p in path.parent.iterdir()] == ["ngram.json"]  # 一時ファイルを残さない
+
+
+def test_save_requires_compaction(tmp_path: Path):
+    idx = _delta(_build(BASE), dict(BASE, **{"02": "帝王切開"}))
+    with pytest.raises(AssertionError):
+        idx.save(tmp_path / "ngram.json")
+
+
+def test_random_edits_keep_candidates_exact():
+    rng = random.Random(0)
+    alphabet = "入院手術給付金支払対象通 ・-Ａa"
+
+    def text() -> str:
+        return "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 40)))
+
+    texts: Dict[str, Optional[str]] = {f"{i:02d}": text() for i in range(8)}
+    idx = _build(texts)
+    for version in range(1, 30):
+        op = rng.random()
+        sid = f"{rng.randrange(12):02d}"
+        if op < 0.5:
+            texts[sid] = text()
+        elif op < 0.8:
+            texts.pop(sid, None)
+        else:
+            texts[sid] = None
+        idx = _delta(idx, texts)
+        if rng.random() < 0.3:
+            idx = idx.compacted()
+
+        fresh = _build(texts)
+        for _ in range(30):
+            src = rng.choice([t for t in texts.values() if t] or ["入院"])
+            key = index_key(src)
+            i = rng.randrange(max(1, len(key) - 1))
+            key = key[i:i + rng.randint(2, 5)]
+            got = idx.candidates(key)
+            assert got == fresh.candidates(key)
+            if got is not None:
+                assert _contains(texts, key) <= got
+            assert idx.fuzzy_candidates(key, 1) == fresh.fuzzy_candidates(key, 1)
+
+
+# -------- NgramIndexStore（章ファイルの変更 → 差分 → 併合）
+
+def _write_manual(root: Path, sections: Dict[str, str]) -> None:
+    d = root / MANUAL
+    d.mkdir(parents=True, exist_ok=True)
+    toc = [{"id": sid, "title": f"第{sid}章", "file": f"{sid}.txt"} for sid in sections]
+    (d / "00_目次.json").write_text(json.dumps({"manual": MANUAL, "toc": toc}, ensure_ascii=False), encoding="utf-8")
+    for sid, body in sections.items():
+        (d / f"{sid}.txt").write_text(body, encoding="utf-8")
+
+
+@pytest.fixture
+def repo(tmp_path: Path):
+    root = tmp_path / "manuals"
+    _write_manual(root, BASE)
+    settings = Settings(
+        manuals_root=str(root),
+        toc=TocConfig(path_pattern=str(root / "{manual}" / "00_目次.json")),
+        paths=PathsConfig(indices_dir=str(tmp_path / "indices")),
+        watch=WatchConfig(enabled=False),  # 監視なしなら照会ごとに stat で変更を拾う
+        search=SearchConfig(ngram_compact_delay=3600, ngram_rebuild_ratio=0.9, regex_sandbox=False),
+        startup=StartupConfig(warmup=False, snapshot=False),
+    )
+    r = ManualRepository(settings)
+    yield r
+    r.close()
+
+
+def _store_candidates(repo: ManualRepository, query: str):
+    return repo.ngrams.candidates(MANUAL, index_key(normalize_text(query)))
+
+
+def test_store_delta_then_compact(repo: ManualRepository):
+    root = repo.root / MANUAL
+    assert _store_candidates(repo, "手術給付金") == {"02"}
+    assert len(repo.ngrams.get(MANUAL).segments) == 1
+
+    (root / "02.txt").write_text("帝王切開は対象外とする。", encoding="utf-8")
+    idx = repo.ngrams.get(MANUAL)
+    assert len(idx.segments) == 2
+    assert _store_candidates(repo, "手術給付金") == set()
+    assert _store_candidates(repo, "帝王切開") == {"02"}
+
+    assert repo.ngrams.compact(MANUAL)
+    idx = repo.ngrams.get(MANUAL)
+    assert len(idx.segments) == 1
+    assert _store_candidates(repo, "帝王切開") == {"02"}
+    assert _store_candidates(repo, "給付金") == {"01", "03"}
+
+    # 書き出された索引は併合後のもの
+    disk = NgramIndex.load(repo.ngrams._path(MANUAL))
+    assert disk is not None
+    assert disk.signature == repo.section_signature(MANUAL)
+    assert disk.segments[0].postings == idx.segments[0].postings